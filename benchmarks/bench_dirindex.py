@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of the decisions that download_lectures takes about the files
+that are already downloaded.
+
+Builds a synthetic class with the given number of files (100000 by
+default), all of them already downloaded, and times:
+
+  decisions/stat        one os.path.exists and os.path.getmtime per file,
+                        as download_lectures used to do
+  decisions/scandir     one scan_directory per section, then lookups
+  download_lectures     a whole re-sync of the class, which downloads
+                        nothing
+
+Run it on the filesystem that you care about (e.g. an NFS mount) with
+--path, since that is where the number of stats matters.
+
+Examples:
+  python -m benchmarks.bench_dirindex
+  python -m benchmarks.bench_dirindex --files 20000 --path /mnt/nfs/tmp
+"""
+
+from __future__ import print_function
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from coursera import coursera_dl
+from coursera.model import Section, make_lecture
+from coursera.utils import scan_directory
+
+
+class NullDownloader(object):
+    session = None
+
+    def download(self, url, filename):
+        raise AssertionError('%s should not be downloaded' % filename)
+
+
+def synthetic_sections(num_files, files_per_section):
+    sections = []
+    for first in range(0, num_files, files_per_section):
+        last = min(first + files_per_section, num_files)
+        lectures = [make_lecture('Lecture_%d' % i, {
+            'pdf': [('https://example.com/%d.pdf' % i, '', None)]})
+            for i in range(first, last)]
+        sections.append(Section('Week_%d' % (len(sections) + 1), lectures))
+    return sections
+
+
+def create_tree(path, sections):
+    """
+    Create the files of the sections, as download_lectures would have.
+    """
+    coursera_dl.download_lectures(NullDownloader(), 'bench-001', sections,
+                                  ['all'], skip_download=True, path=path)
+
+
+def section_files(path, sections):
+    for secnum, (section, lectures) in enumerate(sections):
+        sec = os.path.join(path, 'bench-001',
+                           '%02d_%s' % (secnum + 1, section))
+        names = ['%02d_%s.pdf' % (lecnum + 1, lecname)
+                 for lecnum, (lecname, _) in enumerate(lectures)]
+        yield sec, names
+
+
+def decisions_stat(path, sections):
+    last_update = -1
+    for sec, names in section_files(path, sections):
+        os.path.exists(sec)
+        for name in names:
+            fn = os.path.join(sec, name)
+            if os.path.exists(fn):
+                last_update = max(last_update, os.path.getmtime(fn))
+    return last_update
+
+
+def decisions_scandir(path, sections):
+    last_update = -1
+    for sec, names in section_files(path, sections):
+        index = scan_directory(sec) or {}
+        for name in names:
+            existing = index.get(name)
+            if existing is not None:
+                last_update = max(last_update, existing[1])
+    return last_update
+
+
+def resync(path, sections):
+    coursera_dl.download_lectures(NullDownloader(), 'bench-001', sections,
+                                  ['all'], path=path)
+
+
+def measure(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the directory index of download_lectures.')
+    parser.add_argument('--files', dest='files', type=int, default=100000,
+                        help='number of files in the class (default: 100000)')
+    parser.add_argument('--per-section', dest='per_section', type=int,
+                        default=500,
+                        help='number of files per section (default: 500)')
+    parser.add_argument('--path', dest='path', default=None,
+                        help='directory where the class is created'
+                             ' (default: a temporary directory)')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=3,
+                        help='times each case is run (default: 3)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # download_lectures logs every file that it skips
+    logging.disable(logging.CRITICAL)
+
+    path = tempfile.mkdtemp(dir=args.path)
+    try:
+        sections = synthetic_sections(args.files, args.per_section)
+
+        start = time.time()
+        create_tree(path, sections)
+        print('Created %d files in %d sections in %.1f seconds' %
+              (args.files, len(sections), time.time() - start))
+
+        cases = [
+            ('decisions/stat', lambda: decisions_stat(path, sections)),
+            ('decisions/scandir', lambda: decisions_scandir(path, sections)),
+            ('download_lectures', lambda: resync(path, sections)),
+        ]
+
+        print('%-40s %10s' % ('case', 'seconds'))
+        for name, func in cases:
+            print('%-40s %10.4f' % (name, measure(func, args.repeat)))
+            sys.stdout.flush()
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
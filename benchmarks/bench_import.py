@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of the start of coursera-dl.
+
+Times, in fresh interpreters:
+
+  import                import coursera.coursera_dl
+  --help                coursera-dl --help
+
+and, with Python 3.7 or later, lists the modules which take the longest to
+import, as reported by python -X importtime.  Exits with an error if the
+import takes longer than the budget.
+
+Examples:
+  python -m benchmarks.bench_import
+  python -m benchmarks.bench_import --top 20 --budget 0.2
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SCRIPT = os.path.join(ROOT, 'coursera-dl')
+
+
+def run(args):
+    """
+    Run python with the given arguments from ROOT, and return the seconds
+    that it took and what it wrote to stderr.
+    """
+    start = time.time()
+    p = subprocess.Popen([sys.executable] + args, cwd=ROOT,
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                         universal_newlines=True)
+    _, err = p.communicate()
+    elapsed = time.time() - start
+    if p.returncode:
+        raise RuntimeError('%s failed: %s' % (' '.join(args), err))
+    return elapsed, err
+
+
+def measure(args, repeat):
+    return min(run(args)[0] for _ in range(repeat))
+
+
+def import_times():
+    """
+    Return the (cumulative seconds, module) of every module imported by
+    coursera.coursera_dl, as reported by -X importtime.
+    """
+    _, err = run(['-X', 'importtime', '-c', 'import coursera.coursera_dl'])
+
+    times = []
+    for line in err.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times.append((int(cumulative) / 1e6, name.strip()))
+    return times
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the start of coursera-dl.')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=5,
+                        help='times each case is run (default: 5)')
+    parser.add_argument('--top', dest='top', type=int, default=10,
+                        help='number of the slowest imports to list'
+                             ' (default: 10)')
+    parser.add_argument('--budget', dest='budget', type=float, default=0.5,
+                        help='seconds that the import case may take'
+                             ' (default: 0.5)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    cases = [
+        ('import', ['-c', 'import coursera.coursera_dl']),
+        ('--help', [SCRIPT, '--help']),
+    ]
+
+    print('%-40s %10s' % ('case', 'seconds'))
+    results = {}
+    for name, case in cases:
+        results[name] = measure(case, args.repeat)
+        print('%-40s %10.4f' % (name, results[name]))
+        sys.stdout.flush()
+
+    if sys.version_info >= (3, 7):
+        print()
+        print('%-40s %10s' % ('module', 'seconds'))
+        for seconds, module in sorted(import_times(), reverse=True)[:args.top]:
+            print('%-40s %10.4f' % (module, seconds))
+
+    if results['import'] > args.budget:
+        print('The import takes longer than the budget of %.2f seconds' %
+              args.budget)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
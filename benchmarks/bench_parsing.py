@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of the syllabus parsing path.
+
+Times parse_syllabus, clean_filename, get_anchor_format and fix_url over the
+syllabi in coursera/test/fixtures/html and over synthetic syllabi, once for
+every BeautifulSoup backend that is installed (html5lib, html.parser and
+lxml), reporting the best time and the peak memory of each case.  The
+results are compared with those stored in benchmarks/baseline.json, which
+is only meaningful on the machine where the baseline was recorded.
+
+Examples:
+  python -m benchmarks.bench_parsing
+  python -m benchmarks.bench_parsing --backend lxml --lectures 1000
+  python -m benchmarks.bench_parsing --save-baseline
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import time
+
+import bs4
+
+from coursera import coursera_dl
+from coursera.model import Lecture, Resource, Section, intern_format
+from coursera.utils import clean_filename, fix_url, get_anchor_format
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+FIXTURES = os.path.join(os.path.dirname(__file__), '..', 'coursera', 'test',
+                        'fixtures', 'html')
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+BACKENDS = ['html5lib', 'html.parser', 'lxml']
+
+SECTION = (
+    '<div class="course-item-list-header contracted"><h3>'
+    '<span class="icon-chevron-right"></span> &nbsp;Week {0} - Topic {0}'
+    '</h3></div><ul class="course-item-list-section-list">{1}</ul>')
+
+LECTURE = (
+    '<li class="viewed"><a data-lecture-id="{0}"'
+    ' data-modal-iframe="https://class.coursera.org/bench-001/lecture/'
+    'view?lecture_id={0}" href="https://class.coursera.org/bench-001/'
+    'lecture/{0}" class="lecture-link">\nLecture {0}: Something (12:34)</a>'
+    '<div class="course-lecture-item-resource">'
+    '<a href="https://d19vezwu8eufl6.cloudfront.net/bench/{0}.pptx"'
+    ' title="PPT"></a>'
+    '<a href="https://d19vezwu8eufl6.cloudfront.net/bench/{0}.pdf"'
+    ' title="PDF"></a>'
+    '<a href="https://class.coursera.org/bench-001/lecture/subtitles?'
+    'q={0}_en&amp;format=txt" title="Subtitles (text)"></a>'
+    '<a href="https://class.coursera.org/bench-001/lecture/subtitles?'
+    'q={0}_en&amp;format=srt" title="Subtitles (srt)"></a>'
+    '<a href="https://class.coursera.org/bench-001/lecture/download.mp4?'
+    'lecture_id={0}" title="Video (MP4)"></a>'
+    '</div></li>')
+
+
+def synthetic_syllabus(num_lectures, lectures_per_section=10):
+    """
+    Return a syllabus page with the given number of lectures, laid out like
+    the ones in the fixtures.
+    """
+    sections = []
+    for first in range(0, num_lectures, lectures_per_section):
+        last = min(first + lectures_per_section, num_lectures)
+        lectures = ''.join(LECTURE.format(i) for i in range(first, last))
+        sections.append(SECTION.format(first // lectures_per_section + 1,
+                                       lectures))
+
+    return ('<html><body><div class="course-item-list">' +
+            ''.join(sections) + '</div></body></html>')
+
+
+def load_fixtures():
+    pages = {}
+    for fn in sorted(os.listdir(FIXTURES)):
+        if fn.endswith('.html'):
+            with open(os.path.join(FIXTURES, fn), 'rb') as f:
+                pages[fn[:-len('.html')]] = f.read().decode('utf-8')
+    return pages
+
+
+def available_backends(wanted):
+    backends = []
+    for backend in wanted:
+        try:
+            bs4.BeautifulSoup('<p></p>', backend)
+        except bs4.FeatureNotFound:
+            print('Skipping backend %s: not installed' % backend)
+        else:
+            backends.append(backend)
+    return backends
+
+
+def use_backend(backend):
+    coursera_dl.BeautifulSoup = \
+        lambda page: bs4.BeautifulSoup(page, backend)
+
+
+def measure(func, repeat):
+    """
+    Return the best wall time of repeat calls of func, and the peak memory
+    allocated by one call (or None, if tracemalloc is not available).
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    peak = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return best, peak
+
+
+def parsing_cases(pages, backends):
+    for backend in backends:
+        for name in sorted(pages):
+            page = pages[name]
+            yield ('parse_syllabus/%s/%s' % (name, backend), backend,
+                   lambda page=page: coursera_dl.parse_syllabus(None, page))
+
+
+def utils_cases(pages, scale):
+    """
+    Cases for the helpers called for every anchor of a syllabus, fed with
+    the titles and links found in all the given pages.
+    """
+    text = ''.join(pages.values())
+    hrefs = re.findall(r'href="([^"]*)"', text) * scale
+    titles = re.findall(r'title="([^"]*)"', text) * scale
+
+    yield ('clean_filename/%d' % len(titles), None,
+           lambda: [clean_filename(t) for t in titles])
+    yield ('clean_filename-minimal/%d' % len(titles), None,
+           lambda: [clean_filename(t, True) for t in titles])
+    yield ('get_anchor_format/%d' % len(hrefs), None,
+           lambda: [get_anchor_format(h) for h in hrefs])
+    yield ('fix_url/%d' % len(hrefs), None,
+           lambda: [fix_url(h) for h in hrefs])
+
+
+def _copy(s):
+    # a new string object, like those that the regular expressions return
+    return (s + '.')[:-1]
+
+
+def legacy_sections(sections):
+    """
+    Build the structure that parse_syllabus used to return: lists of plain
+    tuples, and one list per format holding (url, title) tuples, with a
+    copy of the format string in every lecture.
+    """
+    return [(name,
+             [(lecture_name,
+               dict((_copy(fmt), [(r.url, r.title) for r in resources])
+                    for fmt, resources in lecture.items()))
+              for lecture_name, lecture in lectures])
+            for name, lectures in sections]
+
+
+def model_sections(sections):
+    """
+    Build the same sections with the classes of the model module.
+    """
+    return [Section(name,
+                    [Lecture(lecture_name,
+                             dict((intern_format(_copy(fmt)),
+                                   tuple(Resource(*r) for r in resources))
+                                  for fmt, resources in lecture.items()))
+                     for lecture_name, lecture in lectures])
+            for name, lectures in sections]
+
+
+def model_cases(pages):
+    """
+    Cases comparing the memory taken by the syllabus model with the one
+    taken by the old structure, for the largest synthetic syllabus.  The
+    urls and titles are shared, so only the containers are measured.
+    """
+    name = max((n for n in pages if n.startswith('synthetic-')),
+               key=lambda n: int(n.split('-')[1]))
+    sections = coursera_dl.parse_syllabus(None, pages[name])
+
+    yield ('model/legacy/%s' % name, None,
+           lambda: legacy_sections(sections))
+    yield ('model/slots/%s' % name, None,
+           lambda: model_sections(sections))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the parsing of syllabus pages.')
+    parser.add_argument('--backend', dest='backends', action='append',
+                        default=None, choices=BACKENDS,
+                        help='BeautifulSoup backend to use (default: all'
+                             ' the installed ones)')
+    parser.add_argument('--lectures', dest='lectures', action='append',
+                        type=int, default=None,
+                        help='number of lectures of a synthetic syllabus'
+                             ' (default: 1000 and 10000)')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=3,
+                        help='runs of each case, the best one is reported'
+                             ' (default: 3)')
+    parser.add_argument('--baseline', dest='baseline', default=BASELINE,
+                        help='baseline file (default: %(default)s)')
+    parser.add_argument('--save-baseline', dest='save_baseline',
+                        action='store_true', default=False,
+                        help='store the results as the new baseline')
+    parser.add_argument('--tolerance', dest='tolerance', type=float,
+                        default=0.25,
+                        help='slowdown over the baseline reported as a'
+                             ' regression (default: 0.25)')
+    parser.add_argument('--check', dest='check', action='store_true',
+                        default=False,
+                        help='exit with an error on regressions')
+    return parser.parse_args()
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)['cases']
+    except (IOError, OSError, ValueError, KeyError):
+        return {}
+
+
+def main():
+    args = parse_args()
+
+    # parse_syllabus logs every section and lecture that it finds
+    logging.disable(logging.CRITICAL)
+
+    backends = available_backends(args.backends or BACKENDS)
+    pages = load_fixtures()
+    for num in args.lectures or [1000, 10000]:
+        pages['synthetic-%d' % num] = synthetic_syllabus(num)
+
+    baseline = load_baseline(args.baseline)
+    results = {}
+    regressions = []
+
+    cases = list(parsing_cases(pages, backends))
+    cases.extend(utils_cases(load_fixtures(), 10))
+    if backends:
+        use_backend(backends[0])
+        cases.extend(model_cases(pages))
+
+    print('%-68s %10s %10s %10s' % ('case', 'seconds', 'peak MB', 'vs base'))
+    for name, backend, func in cases:
+        if backend:
+            use_backend(backend)
+
+        seconds, peak = measure(func, args.repeat)
+        results[name] = {'seconds': seconds, 'peak_bytes': peak}
+
+        ratio = ''
+        if name in baseline:
+            base = baseline[name]['seconds']
+            ratio = '%.2fx' % (seconds / base) if base else ''
+            if base and seconds > base * (1 + args.tolerance):
+                regressions.append(name)
+                ratio += ' !'
+
+        peak_mb = '%.1f' % (peak / 1048576.0) if peak is not None else 'N/A'
+        print('%-68s %10.4f %10s %10s' % (name, seconds, peak_mb, ratio))
+        sys.stdout.flush()
+
+    if regressions:
+        print('\n%d case(s) slower than the baseline by more than %d%%:' %
+              (len(regressions), args.tolerance * 100))
+        for name in regressions:
+            print('  ' + name)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'cases': results},
+                      f, indent=4, sort_keys=True, separators=(',', ': '))
+            f.write('\n')
+        print('\nBaseline written to %s' % args.baseline)
+
+    if args.check and regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+"""
+Caches of Coursera's pages and of data derived from them, kept under
+PATH_CACHE.
+
+Pages are stored along with their ETag and Last-Modified headers, so that
+they can be revalidated with a conditional request instead of being
+downloaded again.
+
+Parsing a syllabus with BeautifulSoup is, by far, the most expensive thing
+that we do before any download starts.  Since the result only depends on
+the page and on a couple of parsing options, we keep it around, keyed by a
+hash of both.
+
+The sizes of the resources found by --plan are kept too, by url, and so
+are the times until which the cookies of each class are known to be good.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+
+from .define import (
+    PATH_PAGE_CACHE, PATH_SIZES_CACHE, PATH_SYLLABUS_CACHE,
+    PATH_VALIDATIONS_CACHE)
+from .model import sections_from_json
+from .utils import file_lock, mkdir_p, replace_file, temp_path
+
+# Bump this whenever the structure returned by parse_syllabus changes, so
+# that entries written by older versions are simply ignored.
+SYLLABUS_CACHE_VERSION = 3
+
+# Serializes the updates of the validations by the threads of this process,
+# since their file lock cannot be taken twice by the same process.
+_validations_lock = threading.Lock()
+
+
+def _read_json(fn):
+    """
+    Return the data stored by _write_json in fn, or None if there is no
+    such file or it cannot be read.
+    """
+    try:
+        with open(fn, 'rb') as f:
+            return json.loads(zlib.decompress(f.read()).decode('utf-8'))
+    except (IOError, OSError):
+        return None
+    except (ValueError, zlib.error) as e:
+        logging.debug('Ignoring corrupted cache file %s: %s', fn, e)
+        return None
+
+
+def _write_json(fn, data):
+    """
+    Store data as compressed JSON in fn, replacing it in a single step.
+    """
+    mkdir_p(os.path.dirname(fn), 0o700)
+
+    data = json.dumps(data, separators=(',', ':'))
+
+    tmp_fn = temp_path(fn)
+    with open(tmp_fn, 'wb') as f:
+        f.write(zlib.compress(data.encode('utf-8')))
+    replace_file(tmp_fn, fn)
+
+
+def get_page_cache_path(url, path=None):
+    name = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    return os.path.join(path or PATH_PAGE_CACHE, name + '.json.z')
+
+
+def load_page(url, path=None):
+    """
+    Return a (page, validators) tuple for the cached copy of url, where
+    validators is a dict holding the 'etag' and/or 'last_modified' of the
+    page.  If there is no cached copy, page is None.
+    """
+    data = _read_json(get_page_cache_path(url, path))
+    if data is None or data.get('url') != url:
+        return None, {}
+
+    validators = dict((k, data[k]) for k in ('etag', 'last_modified')
+                      if data.get(k))
+    return data['page'], validators
+
+
+def save_page(url, page, etag=None, last_modified=None, path=None):
+    """
+    Cache page as the contents of url, if we have a way to revalidate it.
+    """
+    if not (etag or last_modified):
+        return
+
+    fn = get_page_cache_path(url, path)
+    _write_json(fn, {'url': url, 'page': page, 'etag': etag,
+                     'last_modified': last_modified})
+    logging.debug('Saved page %s to %s', url, fn)
+
+
+def load_sizes(path=None):
+    """
+    Return the sizes of the resources found so far, as a dict by url.
+    """
+    data = _read_json(path or PATH_SIZES_CACHE)
+    if not isinstance(data, dict):
+        return {}
+    return data
+
+
+def save_sizes(sizes, path=None):
+    """
+    Add the given sizes, a dict by url, to those already cached.
+    """
+    fn = path or PATH_SIZES_CACHE
+
+    # another class may have added some since we loaded them
+    cached = load_sizes(fn)
+    cached.update(sizes)
+    _write_json(fn, cached)
+    logging.debug('Saved %d sizes to %s', len(cached), fn)
+
+
+def load_validations(path=None):
+    """
+    Return the times until which the cookies of each user and class are
+    known to be valid, as a dict by 'user/class'.
+    """
+    data = _read_json(path or PATH_VALIDATIONS_CACHE)
+    if not isinstance(data, dict):
+        return {}
+    return data
+
+
+def save_validations(validations, path=None):
+    """
+    Add the given validations, a dict by 'user/class', to those already
+    cached, dropping the ones which expired.  The cache is locked while it
+    is updated, since other processes may update it as well.
+    """
+    fn = path or PATH_VALIDATIONS_CACHE
+    mkdir_p(os.path.dirname(fn), 0o700)
+
+    with _validations_lock:
+        with file_lock(fn + '.lock'):
+            # another process may have validated other classes since we
+            # loaded them
+            cached = load_validations(fn)
+            cached.update(validations)
+            now = time.time()
+            _write_json(fn, dict((key, expires)
+                                 for key, expires in cached.items()
+                                 if expires > now))
+
+
+def syllabus_cache_key(page, reverse=False, intact_fnames=False):
+    """
+    Return the key of a parsed syllabus: a hash of the page contents plus
+    the options that change the outcome of the parsing.
+    """
+    if not isinstance(page, bytes):
+        page = page.encode('utf-8')
+
+    h = hashlib.sha1(page)
+    h.update('|{0:d}|{1:d}|{2:d}'.format(
+        SYLLABUS_CACHE_VERSION, bool(reverse),
+        bool(intact_fnames)).encode('ascii'))
+
+    return h.hexdigest()
+
+
+def get_syllabus_cache_path(class_name, path=None):
+    return os.path.join(path or PATH_SYLLABUS_CACHE, class_name + '.json.z')
+
+
+def load_syllabus(class_name, key, path=None):
+    """
+    Return the cached sections of class_name if they were stored with the
+    given key, or None otherwise.
+    """
+    fn = get_syllabus_cache_path(class_name, path)
+
+    data = _read_json(fn)
+    if data is None:
+        return None
+
+    if data.get('key') != key:
+        logging.debug('Syllabus cache of %s is stale.', class_name)
+        return None
+
+    logging.debug('Loaded parsed syllabus from %s', fn)
+    return sections_from_json(data['sections'])
+
+
+def save_syllabus(class_name, key, sections, path=None):
+    """
+    Store the sections of class_name under the given key, replacing any
+    previous entry for the same class.
+    """
+    fn = get_syllabus_cache_path(class_name, path)
+    _write_json(fn, {'key': key, 'sections': sections})
+    logging.debug('Saved parsed syllabus to %s', fn)
@@ -6,14 +6,32 @@ Cookie handling module.
 
 import logging
 import os
+import time
+from multiprocessing.pool import ThreadPool
 
 import requests
 import six
 
-from six.moves import StringIO
 from six.moves import http_cookiejar as cookielib
+from .cache import load_validations, save_validations
 from .define import AUTH_URL, CLASS_URL, AUTH_REDIRECT_URL, PATH_COOKIES
-from .utils import mkdir_p
+from .events import emit
+from .phases import phase
+from .utils import file_lock, mkdir_p, replace_file, temp_path
+
+#  six.moves doesn’t support urlparse
+if six.PY3:
+    from urllib.parse import urlparse
+else:
+    from urlparse import urlparse
+
+# Seconds for which cookies which passed validate_cookies are trusted without
+# asking Coursera again (unless they expire before)
+VALIDATION_TTL = 6 * 3600
+
+# How many classes are validated or authenticated at the same time by
+# get_cookies_for_classes
+AUTH_WORKERS = 8
 
 
 # Monkey patch cookielib.Cookie.__init__.
@@ -77,7 +95,7 @@ def login(session, class_name, username, password):
 
     # Hit class url to obtain csrf_token
     class_url = CLASS_URL.format(class_name=class_name)
-    r = requests.get(class_url, allow_redirects=False)
+    r = session.get(class_url, allow_redirects=False)
 
     try:
         r.raise_for_status()
@@ -109,7 +127,9 @@ def login(session, class_name, username, password):
     except requests.exceptions.HTTPError:
         raise AuthenticationFailed('Cannot login on accounts.coursera.org.')
 
+    session.logged_in = True
     logging.info('Logged in on accounts.coursera.org.')
+    emit(session, 'login', username=username)
 
 
 def down_the_wabbit_hole(session, class_name):
@@ -118,7 +138,8 @@ def down_the_wabbit_hole(session, class_name):
     """
 
     auth_redirector_url = AUTH_REDIRECT_URL.format(class_name=class_name)
-    r = session.get(auth_redirector_url)
+    with phase(session, 'authenticate', class_name):
+        r = session.get(auth_redirector_url)
     try:
         r.raise_for_status()
     except requests.exceptions.HTTPError:
@@ -152,7 +173,8 @@ def get_authentication_cookies(session, class_name, username, password):
     if session.cookies.get('CAUTH', domain=".coursera.org"):
         logging.debug('Already logged in on accounts.coursera.org.')
     else:
-        login(session, class_name, username, password)
+        with phase(session, 'login', class_name):
+            login(session, class_name, username, password)
 
     _get_authentication_cookies(
         session, class_name, username, password)
@@ -171,26 +193,121 @@ def do_we_have_enough_cookies(cj, class_name):
     return cj.get('csrf_token', domain=domain, path=path) is not None
 
 
-def validate_cookies(session, class_name):
+def cookies_expiry(cj, class_name):
+    """
+    Return the time until which the cookies of class_name may be trusted:
+    VALIDATION_TTL seconds from now, or the first time when one of them
+    expires.
+    """
+    path = '/' + class_name
+    expiry = time.time() + VALIDATION_TTL
+    for c in cj:
+        if c.expires and (c.domain == '.coursera.org' or
+                          (c.domain == 'class.coursera.org' and
+                           c.path == path)):
+            expiry = min(expiry, c.expires)
+    return expiry
+
+
+def _get_validations(session):
+    # loaded once per session, like the cookies cache
+    if getattr(session, 'validations', None) is None:
+        session.validations = load_validations()
+    return session.validations
+
+
+def _validation_key(username, class_name):
+    return '%s/%s' % (username, class_name)
+
+
+def remember_validation(session, username, class_name):
+    """
+    Record that the cookies of the class were found to be valid.
+    """
+    remember_validations(session, username, [class_name])
+
+
+def remember_validations(session, username, class_names):
+    """
+    Record that the cookies of the classes were found to be valid, writing
+    the cache once.
+    """
+    validations = _get_validations(session)
+    found = {}
+    for class_name in class_names:
+        key = _validation_key(username, class_name)
+        found[key] = cookies_expiry(session.cookies, class_name)
+    validations.update(found)
+    _save_validations(found)
+
+
+def _save_validations(validations):
+    try:
+        save_validations(validations)
+    except (IOError, OSError) as e:
+        logging.warn('Could not cache the validations of the cookies: %s', e)
+
+
+def _is_validated(session, username, class_name):
+    """
+    Tell whether the cookies of the class were validated recently.
+    """
+    key = _validation_key(username, class_name)
+    return _get_validations(session).get(key, 0) > time.time()
+
+
+def forget_validation(session, username, class_name):
+    """
+    Record that the cookies of the class can no longer be trusted.
+    """
+    key = _validation_key(username, class_name)
+    validations = _get_validations(session)
+    if validations.get(key, 0):
+        validations[key] = 0
+        _save_validations({key: 0})
+
+
+def validate_cookies(session, class_name, username=None):
     """
     Checks whether we have all the required cookies
     to authenticate on class.coursera.org. Also check for and remove
     stale session.
+
+    With a username, cookies which were validated recently (see
+    VALIDATION_TTL) are trusted without asking Coursera again.
     """
     if not do_we_have_enough_cookies(session.cookies, class_name):
         return False
 
+    if username is not None and _is_validated(session, username,
+                                              class_name):
+        logging.debug('Cookies of %s validated recently.', class_name)
+        return True
+
     url = CLASS_URL.format(class_name=class_name) + '/class'
-    r = session.head(url, allow_redirects=False)
+    with phase(session, 'validate', class_name):
+        r = session.head(url, allow_redirects=False)
 
     if r.status_code == 200:
+        if username is not None:
+            remember_validation(session, username, class_name)
         return True
     else:
         logging.debug('Stale session.')
+        if username is not None:
+            forget_validation(session, username, class_name)
         try:
-            session.cookies.clear('.coursera.org')
+            session.cookies.clear('class.coursera.org', '/' + class_name)
         except KeyError:
             pass
+
+        # If we logged in during this run, only the class cookies may be
+        # stale, and the login is still good for the other classes.
+        if not getattr(session, 'logged_in', False):
+            try:
+                session.cookies.clear('.coursera.org')
+            except KeyError:
+                pass
         return False
 
 
@@ -215,45 +332,112 @@ def find_cookies_for_class(cookies_file, class_name):
     .coursera.org and class.coursera.org found in the given cookies_file.
     """
 
-    path = "/" + class_name
-
-    def cookies_filter(c):
-        return c.domain == ".coursera.org" \
-            or (c.domain == "class.coursera.org" and c.path == path)
-
-    cj = get_cookie_jar(cookies_file)
+    index = get_cookies_index(cookies_file)
 
     new_cj = requests.cookies.RequestsCookieJar()
-    for c in filter(cookies_filter, cj):
+    for c in index.find('.coursera.org'):
+        new_cj.set_cookie(c)
+    for c in index.find('class.coursera.org', '/' + class_name):
         new_cj.set_cookie(c)
 
     return new_cj
 
 
-def load_cookies_file(cookies_file):
+def iter_cookies_file(cookies_file, domains=None):
+    """
+    Yield the cookies of a cookies.txt file (in the Netscape format, as
+    exported by the browsers), reading it one line at a time.  Only the
+    cookies of the given domains are parsed, if given; expired cookies and
+    session cookies are skipped, as MozillaCookieJar.load does.
     """
-    Loads the cookies file.
+    now = time.time()
+
+    with open(cookies_file) as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if line.startswith('#HttpOnly_'):
+                line = line[len('#HttpOnly_'):]
+            elif line.startswith(('#', '$')) or not line.strip():
+                continue
+
+            fields = line.split('\t')
+            if len(fields) != 7:
+                continue
+            domain = fields[0]
+            if domains is not None and domain not in domains:
+                continue
+            domain_specified, path, secure, expires, name, value = fields[1:]
+
+            if not name:
+                # cookies.txt regards 'Set-Cookie: foo' as a cookie with
+                # no name, whereas cookielib regards it as a cookie with no
+                # value.
+                name, value = value, None
+            if not expires:
+                continue  # a session cookie, which is discarded
+            c = cookielib.Cookie(0, name, value,
+                                 None, False,
+                                 domain, domain_specified == 'TRUE',
+                                 domain.startswith('.'),
+                                 path, False,
+                                 secure == 'TRUE',
+                                 expires,
+                                 False,
+                                 None,
+                                 None,
+                                 {})
+            if c.is_expired(now):
+                continue
+            yield c
+
+
+class CookiesIndex(object):
+    """
+    The cookies of Coursera found in a cookies.txt file, by domain and
+    path, so that the cookies of a class are found without looking at all
+    the others.
+    """
+
+    DOMAINS = ('.coursera.org', 'class.coursera.org')
 
-    We pre-pend the file with the special Netscape header because the cookie
-    loader is very particular about this string.
+    def __init__(self, cookies_file):
+        self._cookies = {}
+        for c in iter_cookies_file(cookies_file, self.DOMAINS):
+            paths = self._cookies.setdefault(c.domain, {})
+            paths.setdefault(c.path, []).append(c)
+
+    def find(self, domain, path=None):
+        """
+        Return the cookies of the domain, for the given path or for all
+        of them.
+        """
+        paths = self._cookies.get(domain, {})
+        if path is not None:
+            return list(paths.get(path, []))
+        return [c for cookies in paths.values() for c in cookies]
+
+
+# The index of each cookies file, built once per run (or when it changes)
+_cookies_indexes = {}
+
+
+def get_cookies_index(cookies_file):
+    """
+    Return the CookiesIndex of cookies_file.
     """
+    st = os.stat(cookies_file)
+    key = (os.path.abspath(cookies_file), st.st_mtime, st.st_size)
 
-    cookies = StringIO()
-    cookies.write('# Netscape HTTP Cookie File')
-    cookies.write(open(cookies_file, 'rU').read())
-    cookies.flush()
-    cookies.seek(0)
-    return cookies
+    if key not in _cookies_indexes:
+        _cookies_indexes[key] = CookiesIndex(cookies_file)
+        logging.debug('Indexed the cookies of %s', cookies_file)
+    return _cookies_indexes[key]
 
 
 def get_cookie_jar(cookies_file):
     cj = cookielib.MozillaCookieJar()
-    cookies = load_cookies_file(cookies_file)
-
-    # nasty hack: cj.load() requires a filename not a file, but if I use
-    # stringio, that file doesn't exist. I used NamedTemporaryFile before,
-    # but encountered problems on Windows.
-    cj._really_load(cookies, 'StringIO.cookies', False, False)
+    for c in iter_cookies_file(cookies_file):
+        cj.set_cookie(c)
 
     return cj
 
@@ -262,6 +446,15 @@ def get_cookies_cache_path(username):
     return os.path.join(PATH_COOKIES, username + '.txt')
 
 
+def cookies_cache_lock(username, shared=False):
+    """
+    Return the lock of the cookies cache of the user, shared by all the
+    processes using it: see file_lock.
+    """
+    mkdir_p(PATH_COOKIES, 0o700)
+    return file_lock(get_cookies_cache_path(username) + '.lock', shared)
+
+
 def get_cookies_from_cache(username):
     """
     Returns a RequestsCookieJar containing the cached cookies for the given
@@ -270,29 +463,197 @@ def get_cookies_from_cache(username):
     path = get_cookies_cache_path(username)
     cj = requests.cookies.RequestsCookieJar()
     try:
-        cached_cj = get_cookie_jar(path)
+        with cookies_cache_lock(username, shared=True):
+            cached_cj = get_cookie_jar(path)
         for cookie in cached_cj:
             cj.set_cookie(cookie)
         logging.debug(
             'Loaded cookies from %s', get_cookies_cache_path(username))
-    except IOError:
+    except (IOError, OSError):
         pass
 
     return cj
 
 
-def write_cookies_to_cache(cj, username):
+def _save_cookies_cache(cj, username):
     """
-    Saves the RequestsCookieJar to disk in the Mozilla cookies.txt file
-    format.  This prevents us from repeated authentications on the
-    accounts.coursera.org and class.coursera.org/class_name sites.
+    Add the cookies of the RequestsCookieJar to the cookies cache of the
+    user, replacing the file in a single step.  The caller holds the lock
+    of the cache.
     """
-    mkdir_p(PATH_COOKIES, 0o700)
     path = get_cookies_cache_path(username)
+
+    # other processes may have added cookies (e.g., for other classes)
     cached_cj = cookielib.MozillaCookieJar()
+    try:
+        for cookie in get_cookie_jar(path):
+            cached_cj.set_cookie(cookie)
+    except (IOError, OSError):
+        pass
     for cookie in cj:
         cached_cj.set_cookie(cookie)
-    cached_cj.save(path)
+
+    tmp_path = temp_path(path)
+    cached_cj.save(tmp_path)
+    replace_file(tmp_path, path)
+
+
+def write_cookies_to_cache(cj, username):
+    """
+    Saves the RequestsCookieJar to disk in the Mozilla cookies.txt file
+    format.  This prevents us from repeated authentications on the
+    accounts.coursera.org and class.coursera.org/class_name sites.
+
+    The cookies are merged with those already cached, so that processes
+    running at the same time do not undo each other's work.
+    """
+    with cookies_cache_lock(username):
+        _save_cookies_cache(cj, username)
+
+
+def _cookies_cache_mtime(username):
+    try:
+        return os.path.getmtime(get_cookies_cache_path(username))
+    except OSError:
+        return None
+
+
+def _reload_cookies_cache(session, username):
+    """
+    Load the cookies cache of the user again if another process wrote it
+    since the session loaded it.  The caller holds the lock of the cache.
+    Tells whether the cookies were loaded.
+    """
+    mtime = _cookies_cache_mtime(username)
+    if mtime is None or mtime == getattr(session, 'cookies_cache_mtime',
+                                         None):
+        return False
+
+    try:
+        session.cookies.update(get_cookie_jar(
+            get_cookies_cache_path(username)))
+    except (IOError, OSError):
+        return False
+    session.cookies_cache_mtime = mtime
+    return True
+
+
+def _class_of_url(url):
+    """
+    Return the name of the class of a url on class.coursera.org, or None.
+    """
+    parts = urlparse(url)
+    if parts.netloc != 'class.coursera.org':
+        return None
+    return parts.path.strip('/').split('/')[0] or None
+
+
+def reauthenticate_on_refusal(session, username, password):
+    """
+    Add a response hook to the session which, when Coursera refuses a
+    request to a class page (401 or 403), authenticates on the class again
+    and sends the request once more.
+    """
+    def reauthenticate(r, *args, **kwargs):
+        if r.status_code not in (401, 403):
+            return r
+
+        class_name = _class_of_url(r.url)
+        if (class_name is None or getattr(r.request, 'reauthenticated', False)
+                or getattr(session, 'reauthenticating', False)):
+            return r
+
+        logging.info('Access to %s refused, authenticating again.', r.url)
+        forget_validation(session, username, class_name)
+        session.reauthenticating = True
+        try:
+            get_authentication_cookies(session, class_name,
+                                       username, password)
+        finally:
+            session.reauthenticating = False
+        write_cookies_to_cache(session.cookies, username)
+        session.cookie_values = make_cookie_values(session.cookies,
+                                                   class_name)
+        emit(session, 'auth', class_name=class_name,
+             result='reauthenticated')
+
+        r.close()
+        request = r.request.copy()
+        request.headers.pop('Cookie', None)
+        request.prepare_cookies(session.cookies)
+        request.reauthenticated = True
+        return session.send(request, **kwargs)
+
+    session.hooks['response'].append(reauthenticate)
+
+
+def _load_cookies_cache(session, username, password):
+    if not getattr(session, 'cookies_cache_loaded', False):
+        session.cookies_cache_mtime = _cookies_cache_mtime(username)
+        cookies = get_cookies_from_cache(username)
+        session.cookies.update(cookies)
+        session.cookies_cache_loaded = True
+        reauthenticate_on_refusal(session, username, password)
+
+
+def get_cookies_for_classes(session, class_names, username, password,
+                            workers=AUTH_WORKERS):
+    """
+    Get the cookies for all the given classes at once, ahead of
+    get_cookies_for_class: we log in on accounts.coursera.org once, if
+    needed, then validate and authenticate on the classes concurrently,
+    into the cookies of the session.  The cookies cache is written once,
+    at the end.
+
+    Returns a dict with the error of each class which could not be
+    authenticated; those are left to get_cookies_for_class.
+    """
+    _load_cookies_cache(session, username, password)
+
+    pending = [c for c in class_names
+               if not _is_validated(session, username, c)]
+    if not pending:
+        return {}
+
+    def validate(class_name):
+        return validate_cookies(session, class_name)
+
+    def handshake(class_name):
+        try:
+            _get_authentication_cookies(session, class_name,
+                                        username, password)
+        except AuthenticationFailed as e:
+            return e
+        except requests.exceptions.RequestException as e:
+            return AuthenticationFailed(e)
+
+    errors = {}
+    pool = ThreadPool(max(1, min(workers, len(pending))))
+    try:
+        valid = pool.map(validate, pending)
+        stale = [c for c, ok in zip(pending, valid) if not ok]
+
+        if stale:
+            if not session.cookies.get('CAUTH', domain='.coursera.org'):
+                with phase(session, 'login', stale[0]):
+                    login(session, stale[0], username, password)
+            for class_name, error in zip(stale, pool.map(handshake, stale)):
+                if error is not None:
+                    logging.debug('Could not authenticate on %s: %s',
+                                  class_name, error)
+                    errors[class_name] = error
+                emit(session, 'auth', class_name=class_name,
+                     result='failed' if error else 'authenticated')
+            write_cookies_to_cache(session.cookies, username)
+            logging.info('Authenticated on %d class(es).',
+                         len(stale) - len(errors))
+    finally:
+        pool.close()
+        pool.join()
+
+    remember_validations(session, username,
+                         [c for c in pending if c not in errors])
+    return errors
 
 
 def get_cookies_for_class(session, class_name,
@@ -304,16 +665,44 @@ def get_cookies_for_class(session, class_name,
     We do not validate the cookies if they are loaded from a cookies file
     because this is intented for debugging purposes or if the coursera
     authentication process has changed.
+
+    The session may be reused for several classes, in which case the
+    cookies cache is only loaded for the first one.  The cookies which were
+    validated recently are not validated again, and if Coursera refuses
+    them later on, we authenticate again on the fly.
     """
     if cookies_file:
         cookies = find_cookies_for_class(cookies_file, class_name)
         session.cookies.update(cookies)
         logging.info('Loaded cookies from %s', cookies_file)
+        emit(session, 'auth', class_name=class_name, result='cookies_file')
     else:
-        cookies = get_cookies_from_cache(username)
-        session.cookies.update(cookies)
-        if validate_cookies(session, class_name):
+        _load_cookies_cache(session, username, password)
+        if validate_cookies(session, class_name, username):
             logging.info('Already authenticated.')
-        else:
-            get_authentication_cookies(session, class_name, username, password)
-            write_cookies_to_cache(session.cookies, username)
+            emit(session, 'auth', class_name=class_name, result='valid')
+            return
+
+        # one process at a time authenticates, and the others use its
+        # cookies, instead of authenticating again
+        # the hook of reauthenticate_on_refusal would take the lock, which
+        # is not re-entrant, again: a refusal raises AuthenticationFailed
+        reauthenticating = getattr(session, 'reauthenticating', False)
+        session.reauthenticating = True
+        try:
+            with cookies_cache_lock(username):
+                if (_reload_cookies_cache(session, username) and
+                        validate_cookies(session, class_name, username)):
+                    logging.info('Authenticated by another process.')
+                    emit(session, 'auth', class_name=class_name,
+                         result='shared')
+                    return
+
+                get_authentication_cookies(session, class_name, username,
+                                           password)
+                _save_cookies_cache(session.cookies, username)
+                session.cookies_cache_mtime = _cookies_cache_mtime(username)
+        finally:
+            session.reauthenticating = reauthenticating
+        remember_validation(session, username, class_name)
+        emit(session, 'auth', class_name=class_name, result='authenticated')
@@ -41,52 +41,121 @@ Legalese:
 
 import argparse
 import datetime
+import io
 import json
 import logging
+import multiprocessing
+import multiprocessing.util
 import os
 import re
 import shutil
-import subprocess
 import sys
+import threading
 import time
-import glob
-
-from distutils.version import LooseVersion as V
 
 import requests
 from six import iteritems
 
-try:
-    from BeautifulSoup import BeautifulSoup
-except ImportError:
-    from bs4 import BeautifulSoup as BeautifulSoup_
-    try:
-        # Use html5lib for parsing if available
-        import html5lib
-        BeautifulSoup = lambda page: BeautifulSoup_(page, 'html5lib')
-    except ImportError:
-        BeautifulSoup = lambda page: BeautifulSoup_(page, 'html.parser')
-
 
+from .cache import (
+    load_page, load_sizes, load_syllabus, save_page, save_sizes,
+    save_syllabus, syllabus_cache_key)
 from .cookies import (
     AuthenticationFailed, ClassNotFound,
-    get_cookies_for_class, make_cookie_values)
+    get_cookies_for_class, get_cookies_for_classes, make_cookie_values)
 from .credentials import get_credentials, CredentialsError
-from .define import CLASS_URL, ABOUT_URL, PATH_CACHE
+from .define import (
+    CLASS_URL, ABOUT_URL, PATH_CACHE, PATH_DISK_RESERVATIONS)
+from .diskspace import DiskSpace
 from .downloaders import get_downloader
-from .utils import clean_filename, get_anchor_format, mkdir_p, fix_url
+from .events import emit, open_events, transfer_fields
+from .hooks import HOOK_WORKERS, HookRunner, log_hooks
+from .jobs import ClassReport, JobFileError, load_jobs, log_report
+from .ledger import open_ledger
+from .model import Section, make_lecture
+from .pagestore import PageStore
+from .phases import (
+    PHASES, PhaseProfiler, cpu_time, log_phases, phase, phase_iter,
+    summarize_phases, write_phases)
+from .plan import (
+    get_size, log_plan, parse_bandwidth, plan_resources, summarize,
+    write_plan)
+from .tracing import (
+    HttpTracer, TracingAdapter, log_http_stats, merge_http_stats,
+    summarize_http, write_http_stats)
+from .utils import (
+    clean_filename, get_anchor_format, mkdir_p, fix_url, parse_size,
+    prefetch, replace_file, scan_directory, temp_path)
+from .watch import ClassWatch, resource_key
+
+# How many parsed sections may wait for download_lectures
+SECTIONS_PREFETCH = 2
+
+# Serializes the use of the cookies cache; a multiprocessing.Lock shared by
+# all the workers when downloading classes in parallel.
+_cookies_lock = threading.RLock()
+
+# The class handled by a worker process, the options it was given and the
+# session that it reuses for all its classes.
+_current_class = None
+_args = None
+_session = None
+
+# Size of the connection pools of the session shared by all the classes:
+# how many hosts we keep connections to, and how many connections per host.
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = 10
 
 # URL containing information about outdated modules
 _see_url = " See https://github.com/coursera-dl/coursera/issues/139"
 
-# Test versions of some critical modules.
-# We may, perhaps, want to move these elsewhere.
-import bs4
-import six
 
-assert V(requests.__version__) >= V('1.2'), "Upgrade requests!" + _see_url
-assert V(six.__version__) >= V('1.3'), "Upgrade six!" + _see_url
-assert V(bs4.__version__) >= V('4.1'), "Upgrade bs4!" + _see_url
+def V(version):
+    """
+    Return the numbers of a version string, e.g. (2, 34, 2) for '2.34.2',
+    to compare versions without importing distutils.
+    """
+    return tuple(int(n) for n in re.findall(r'\d+', version))
+
+
+def check_versions():
+    """
+    Test versions of some critical modules.
+
+    This is done by main rather than on import; bs4 is tested when it is
+    imported, by BeautifulSoup.
+    """
+    import six
+
+    assert V(requests.__version__) >= V('1.2'), "Upgrade requests!" + _see_url
+    assert V(six.__version__) >= V('1.3'), "Upgrade six!" + _see_url
+
+
+def _make_beautiful_soup():
+    try:
+        from BeautifulSoup import BeautifulSoup
+        return BeautifulSoup
+    except ImportError:
+        import bs4
+        from bs4 import BeautifulSoup as BeautifulSoup_
+        assert V(bs4.__version__) >= V('4.1'), "Upgrade bs4!" + _see_url
+        try:
+            # Use html5lib for parsing if available
+            import html5lib
+            return lambda page: BeautifulSoup_(page, 'html5lib')
+        except ImportError:
+            return lambda page: BeautifulSoup_(page, 'html.parser')
+
+
+def BeautifulSoup(page):
+    """
+    Parse page with the best BeautifulSoup available, which is only
+    imported the first time that a page has to be parsed (with a cached
+    syllabus, none is).
+    """
+    global BeautifulSoup
+    BeautifulSoup = _make_beautiful_soup()
+    return BeautifulSoup(page)
 
 
 def get_syllabus_url(class_name, preview):
@@ -101,12 +170,22 @@ def get_syllabus_url(class_name, preview):
     return page
 
 
+def _emit_page(session, url, r, start):
+    if getattr(session, 'events', None) is not None:
+        emit(session, 'page', url=url, status=r.status_code,
+             bytes=len(r.content), seconds=round(time.time() - start, 3))
+
+
 def get_page(session, url):
     """
     Download an HTML page using the requests session.
+
+    If the session has a page_store, the page is archived in it.
     """
 
+    start = time.time()
     r = session.get(url)
+    _emit_page(session, url, r, start)
 
     try:
         r.raise_for_status()
@@ -114,6 +193,59 @@ def get_page(session, url):
         logging.error("Error %s getting page %s", e, url)
         raise
 
+    store = getattr(session, 'page_store', None)
+    if store is not None:
+        store.put(url, r.text, etag=r.headers.get('ETag'),
+                  last_modified=r.headers.get('Last-Modified'))
+
+    return r.text
+
+
+def get_page_cached(session, url):
+    """
+    Download an HTML page using the requests session, unless the copy that
+    we cached before is still fresh, as told by a conditional request.
+
+    If the session has a page_store, it is used to keep the cached copy.
+    """
+
+    store = getattr(session, 'page_store', None)
+    if store is not None:
+        page, validators = store.get_entry(url)
+    else:
+        page, validators = load_page(url)
+
+    headers = {}
+    if page is not None:
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'last_modified' in validators:
+            headers['If-Modified-Since'] = validators['last_modified']
+
+    start = time.time()
+    r = session.get(url, headers=headers)
+    _emit_page(session, url, r, start)
+
+    if r.status_code == 304 and page is not None:
+        logging.info('Using cached copy of %s (not modified)', url)
+        return page
+
+    try:
+        r.raise_for_status()
+    except requests.exceptions.HTTPError as e:
+        logging.error("Error %s getting page %s", e, url)
+        raise
+
+    etag = r.headers.get('ETag')
+    last_modified = r.headers.get('Last-Modified')
+    if store is not None:
+        store.put(url, r.text, etag=etag, last_modified=last_modified)
+    else:
+        try:
+            save_page(url, r.text, etag=etag, last_modified=last_modified)
+        except (IOError, OSError) as e:
+            logging.warn('Could not cache page %s: %s', url, e)
+
     return r.text
 
 
@@ -135,7 +267,8 @@ def grab_hidden_video_url(session, href):
         return None
 
 
-def get_syllabus(session, class_name, local_page=False, preview=False):
+def get_syllabus(session, class_name, local_page=False, preview=False,
+                 use_cache=False):
     """
     Get the course listing webpage.
 
@@ -143,20 +276,26 @@ def get_syllabus(session, class_name, local_page=False, preview=False):
     that page is used instead of performing a download.  If we are
     instructed to use a local page and it does not exist, then we download
     the page and save a copy of it for future use.
+
+    Otherwise, if use_cache is set, the page is revalidated against the copy
+    cached by a previous run, which is used if it was not modified.
     """
 
     if not (local_page and os.path.exists(local_page)):
         url = get_syllabus_url(class_name, preview)
-        page = get_page(session, url)
+        if use_cache:
+            page = get_page_cached(session, url)
+        else:
+            page = get_page(session, url)
         logging.info('Downloaded %s (%d bytes)', url, len(page))
 
         # cache the page if we're in 'local' mode
         if local_page:
-            with open(local_page, 'w') as f:
-                f.write(page.encode("utf-8"))
+            with io.open(local_page, 'w', encoding='utf-8') as f:
+                f.write(page)
     else:
-        with open(local_page) as f:
-            page = f.read().decode("utf-8")
+        with io.open(local_page, encoding='utf-8') as f:
+            page = f.read()
         logging.info('Read (%d bytes) from local file', len(page))
 
     return page
@@ -189,15 +328,70 @@ def get_video(session, url):
     return soup.find(attrs={'type': re.compile('^video/mp4')})['src']
 
 
-def parse_syllabus(session, page, reverse=False, intact_fnames=False):
+def resolve_resource(session, href, via, fallback=None):
     """
-    Parses a Coursera course listing/syllabus page.  Each section is a week
-    of classes.
+    Return the URL of a resource found by parse_syllabus.
+
+    Resources that need extra requests to be found (preview and hidden
+    videos) are only resolved here, just before they are downloaded, so
+    that the filtered out ones never cost us anything.  If a preview video
+    cannot be found, the hidden video page given as fallback is tried.
+    Returns None if the resource could not be resolved.
     """
+    if via == 'preview':
+        try:
+            url = fix_url(get_video(session, href))
+        except TypeError:
+            logging.warn('Could not get resource: %s', href)
+            url = None
+        if url is None and fallback:
+            url = fix_url(grab_hidden_video_url(session, fallback))
+        return url
+    elif via == 'hidden':
+        return fix_url(grab_hidden_video_url(session, href))
 
-    sections = []
-    soup = BeautifulSoup(page)
+    return href
+
+
+# Start of the tag of the header of a section of a syllabus page
+_SECTION_HEADER = r"""<\w+[^>]*\sclass=["']course-item-list-header"""
 
+
+def _section_chunks(page):
+    """
+    Split a syllabus page at the headers of its sections, so that each
+    section can be parsed on its own.  The page before the first header is
+    dropped; if no header is found, the whole page is returned.
+    """
+    pattern = _SECTION_HEADER
+    if isinstance(page, bytes):
+        pattern = pattern.encode('ascii')
+    starts = [m.start() for m in re.finditer(pattern, page)]
+    if not starts:
+        return [page]
+    ends = starts[1:] + [len(page)]
+    return [page[start:end] for start, end in zip(starts, ends)]
+
+
+def iter_syllabus(session, page, intact_fnames=False):
+    """
+    Parses a Coursera course listing/syllabus page, yielding each section
+    (a week of classes) as soon as its lectures are known.  Each section is
+    parsed on its own, so the first one is known before the rest of the
+    page is parsed.
+
+    The sections are described by the classes of the model module.  If the
+    via of a resource is not None, its url is the page where the resource
+    can be found, which resolve_resource turns into the actual URL of the
+    resource.  No requests are made here.
+    """
+
+    for chunk in _section_chunks(page):
+        for section in _iter_sections(BeautifulSoup(chunk), intact_fnames):
+            yield section
+
+
+def _iter_sections(soup, intact_fnames):
     # traverse sections
     for stag in soup.findAll(attrs={'class':
                                     re.compile('^course-item-list-header')}):
@@ -224,63 +418,106 @@ def parse_syllabus(session, page, reverse=False, intact_fnames=False):
                 logging.debug('    %s %s', fmt, href)
                 if fmt:
                     lecture[fmt] = lecture.get(fmt, [])
-                    lecture[fmt].append((href, title))
+                    lecture[fmt].append((href, title, None))
                     continue
 
                 # Special case: find preview URLs
                 lecture_page = transform_preview_url(href)
                 if lecture_page:
-                    try:
-                        href = get_video(session, lecture_page)
-                        lecture['mp4'] = lecture.get('mp4', [])
-                        lecture['mp4'].append((fix_url(href), ''))
-                    except TypeError:
-                        logging.warn(
-                            'Could not get resource: %s', lecture_page)
+                    lecture['mp4'] = lecture.get('mp4', [])
+                    lecture['mp4'].append((lecture_page, '', 'preview'))
 
             # Special case: we possibly have hidden video links---thanks to
-            # the University of Washington for that.
+            # the University of Washington for that.  They are also tried
+            # if the preview videos cannot be found.
+            hidden = [a['data-modal-iframe'] for a in vtag.findAll('a')
+                      if a.get('data-modal-iframe')]
             if 'mp4' not in lecture:
-                for a in vtag.findAll('a'):
-                    if a.get('data-modal-iframe'):
-                        href = grab_hidden_video_url(
-                            session, a['data-modal-iframe'])
-                        href = fix_url(href)
-                        fmt = 'mp4'
-                        logging.debug('    %s %s', fmt, href)
-                        if href is not None:
-                            lecture[fmt] = lecture.get(fmt, [])
-                            lecture[fmt].append((href, ''))
-
-            for fmt in lecture:
-                count = len(lecture[fmt])
-                for i, r in enumerate(lecture[fmt]):
-                    if (count == i + 1):
-                        # for backward compatibility, we do not add the title
-                        # to the filename (format_combine_number_resource and
-                        # format_resource)
-                        lecture[fmt][i] = (r[0], '')
-                    else:
-                        # make sure the title is unique
-                        lecture[fmt][i] = (r[0], '{0:d}_{1}'.format(i, r[1]))
-
-            lectures.append((vname, lecture))
-
-        sections.append((section_name, lectures))
+                for href in hidden:
+                    logging.debug('    mp4 %s (hidden)', href)
+                    lecture['mp4'] = lecture.get('mp4', [])
+                    lecture['mp4'].append((href, '', 'hidden'))
+            elif hidden:
+                lecture['mp4'] = [
+                    r + (hidden[0],) if r[2] == 'preview' else r
+                    for r in lecture['mp4']]
+
+            lectures.append(make_lecture(vname, lecture))
+
+        yield Section(section_name, lectures)
+
 
+def _log_sections_found(sections):
     logging.info('Found %d sections and %d lectures on this page',
                  len(sections), sum(len(s[1]) for s in sections))
 
-    if sections and reverse:
-        sections.reverse()
-
     if not len(sections):
         logging.error('The cookies file may be invalid, '
                       'please re-run with the `--clear-cache` option.')
 
+
+def parse_syllabus(session, page, reverse=False, intact_fnames=False):
+    """
+    Parses a Coursera course listing/syllabus page.  Each section is a week
+    of classes.  See iter_syllabus for the format of the sections.
+    """
+
+    sections = list(iter_syllabus(session, page, intact_fnames))
+    _log_sections_found(sections)
+
+    if sections and reverse:
+        sections.reverse()
+
     return sections
 
 
+def _save_syllabus(class_name, key, sections):
+    try:
+        save_syllabus(class_name, key, sections)
+    except (IOError, OSError) as e:
+        logging.warn('Could not cache the syllabus of %s: %s', class_name, e)
+
+
+def stream_syllabus(session, class_name, page, reverse=False,
+                    intact_fnames=False, use_cache=True):
+    """
+    Yield the sections of the syllabus of class_name as soon as they are
+    parsed, so that the downloads can start while the rest of the page is
+    still being parsed.  With reverse, the whole page has to be parsed
+    before the first section is known.
+
+    If use_cache is set, the sections found by a previous run are reused if
+    neither the page nor the parsing options changed since then.
+    """
+    key = syllabus_cache_key(page, reverse, intact_fnames)
+
+    if use_cache:
+        sections = load_syllabus(class_name, key)
+        if sections is not None:
+            logging.info('Using cached syllabus of %s (%d sections)',
+                         class_name, len(sections))
+            for section in sections:
+                yield section
+            return
+
+    if reverse:
+        sections = parse_syllabus(session, page, reverse, intact_fnames)
+        if use_cache and sections:
+            _save_syllabus(class_name, key, sections)
+        for section in sections:
+            yield section
+        return
+
+    sections = []
+    for section in iter_syllabus(session, page, intact_fnames):
+        sections.append(section)
+        yield section
+
+    _log_sections_found(sections)
+    if use_cache and sections:
+        _save_syllabus(class_name, key, sections)
+
+
 def download_about(session, class_name, path='', overwrite=False):
     """
     Download the 'about' metadata which is in JSON format and pretty-print it.
@@ -306,6 +543,105 @@ def download_about(session, class_name, path='', overwrite=False):
         about_file.write(json_data)
 
 
+class ResourceFilter(object):
+    """
+    The section, lecture, resource and format filters given on the command
+    line, compiled once for all the lectures of a class.
+    """
+
+    def __init__(self, file_formats=None, section_filter=None,
+                 lecture_filter=None, resource_filter=None):
+        if not file_formats or 'all' in file_formats:
+            self.file_formats = None
+        else:
+            self.file_formats = set(file_formats)
+
+        self.section_filter = section_filter
+        self.lecture_filter = lecture_filter
+        self.resource_filter = resource_filter
+
+        self._section_re = section_filter and re.compile(section_filter)
+        self._lecture_re = lecture_filter and re.compile(lecture_filter)
+        self._resource_re = resource_filter and re.compile(resource_filter)
+
+    def section(self, name):
+        if self._section_re and not self._section_re.search(name):
+            logging.debug('Skipping b/c of sf: %s %s', self.section_filter,
+                          name)
+            return False
+        return True
+
+    def lecture(self, name):
+        if self._lecture_re and not self._lecture_re.search(name):
+            logging.debug('Skipping b/c of lf: %s %s', self.lecture_filter,
+                          name)
+            return False
+        return True
+
+    def resources(self, lecture):
+        """
+        Return the (fmt, resource) pairs of the lecture that pass the format
+        and resource filters.
+        """
+        selected = []
+        for fmt, resources in iteritems(lecture):
+            if self.file_formats is not None and fmt not in self.file_formats:
+                logging.debug('Skipping b/c format %s not in %s', fmt,
+                              sorted(self.file_formats))
+                continue
+            for resource in resources:
+                title = resource.title
+                if self._resource_re and title and \
+                        not self._resource_re.search(title):
+                    logging.debug('Skipping b/c of rf: %s %s',
+                                  self.resource_filter, title)
+                    continue
+                selected.append((fmt, resource))
+        return selected
+
+
+def _lecture_order(name):
+    # 9_... before 10_..., also with more than 99 lectures
+    return [int(part) if part.isdigit() else part
+            for part in re.split(r'(\d+)', name)]
+
+
+def write_playlist(sec, index):
+    """
+    Write the M3U playlist of the section directory sec, listing the videos
+    in its index (the files already there plus those just downloaded) in
+    lecture order.  The playlist is replaced in a single step, and only if
+    it changed.
+    """
+    listed = sorted((name for name in index if name.endswith('.mp4')),
+                    key=_lecture_order)
+    if not listed:
+        return
+
+    m3u_name = os.path.join(sec, os.path.basename(sec) + '.m3u')
+    contents = ''.join(name + '\n' for name in listed)
+
+    try:
+        with open(m3u_name) as m3u:
+            if m3u.read() == contents:
+                return
+    except (IOError, OSError):
+        pass
+
+    tmp_name = temp_path(m3u_name)
+    with open(tmp_name, 'w') as m3u:
+        m3u.write(contents)
+    replace_file(tmp_name, m3u_name)
+    logging.debug('Wrote playlist %s', m3u_name)
+
+
+def _file_size(filename):
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return 0
+
+
 def download_lectures(downloader,
                       class_name,
                       sections,
@@ -321,13 +657,31 @@ def download_lectures(downloader,
                       combined_section_lectures_nums=False,
                       hooks=None,
                       playlist=False,
-                      intact_fnames=False
+                      intact_fnames=False,
+                      ledger=None,
+                      disk_space=None,
+                      hook_runner=None,
+                      outcomes=None
                       ):
     """
     Downloads lecture resources described by sections.
     Returns True if the class appears completed.
+
+    With a ledger, each file is claimed in it before being downloaded, and
+    the files claimed by other workers are left to them.
+
+    With disk_space, a DiskSpace, the files which would not fit on the disk
+    are skipped.
+
+    The hooks of each section are run by hook_runner, a HookRunner, in the
+    background; without one, they are all waited for before returning.
+
+    With outcomes, a dict, the resource_key of each resource selected is
+    added to it, with the time of its file if it was downloaded or found
+    on disk, or None if it was not.
     """
     last_update = -1
+    own_runner = None
 
     def format_section(num, section):
         sec = '%02d_%s' % (num, section)
@@ -345,39 +699,42 @@ def download_lectures(downloader,
             title = '_' + title
         return '%02d_%02d_%s%s.%s' % (secnum, lecnum, lecname, title, fmt)
 
+    events = getattr(downloader.session, 'events', None)
+
+    def event(name, filename, **fields):
+        if events is not None:
+            events.emit(name, class_name=class_name, file=filename, **fields)
+
+    def outcome(section, lecname, fmt, resource, mtime):
+        if outcomes is not None:
+            outcomes[resource_key(section, lecname, fmt, resource)] = mtime
+
+    filters = ResourceFilter(file_formats, section_filter, lecture_filter,
+                             resource_filter)
+
     for (secnum, (section, lectures)) in enumerate(sections):
-        if section_filter and not re.search(section_filter, section):
-            logging.debug('Skipping b/c of sf: %s %s', section_filter,
-                          section)
+        if not filters.section(section):
             continue
         sec = os.path.join(path, class_name, format_section(secnum + 1,
                                                             section))
+        # the files already in the section, listed once
+        index = scan_directory(sec)
+        selected = 0
         for (lecnum, (lecname, lecture)) in enumerate(lectures):
-            if lecture_filter and not re.search(lecture_filter,
-                                                lecname):
-                logging.debug('Skipping b/c of lf: %s %s', lecture_filter,
-                              lecname)
+            if not filters.lecture(lecname):
                 continue
 
-            if not os.path.exists(sec):
+            if index is None:
                 mkdir_p(sec)
+                index = {}
 
             # Select formats to download
-            resources_to_get = []
-            for fmt, resources in iteritems(lecture):
-                if fmt in file_formats or 'all' in file_formats:
-                    for r in resources:
-                        if resource_filter and r[1] and not re.search(resource_filter, r[1]):
-                            logging.debug('Skipping b/c of rf: %s %s',
-                                          resource_filter, r[1])
-                            continue
-                        resources_to_get.append((fmt, r[0], r[1]))
-                else:
-                    logging.debug(
-                        'Skipping b/c format %s not in %s', fmt, file_formats)
+            resources_to_get = filters.resources(lecture)
+            selected += len(resources_to_get)
 
             # write lecture resources
-            for fmt, url, title in resources_to_get:
+            for fmt, resource in resources_to_get:
+                url, title, via = resource.url, resource.title, resource.via
                 if combined_section_lectures_nums:
                     lecfn = os.path.join(
                         sec,
@@ -387,40 +744,102 @@ def download_lectures(downloader,
                     lecfn = os.path.join(
                         sec, format_resource(lecnum + 1, lecname, title, fmt))
 
-                if overwrite or not os.path.exists(lecfn):
-                    if not skip_download:
-                        logging.info('Downloading: %s', lecfn)
-                        downloader.download(url, lecfn)
-                    else:
-                        open(lecfn, 'w').close()  # touch
+                existing = index.get(os.path.basename(lecfn))
+                if overwrite or existing is None:
+                    event('queued', lecfn, url=resource.url, format=fmt)
+                    # until it is downloaded
+                    outcome(section, lecname, fmt, resource, None)
+                    key = os.path.relpath(lecfn, path or os.curdir)
+                    if ledger is not None and not ledger.claim(key):
+                        logging.info('%s is done or being downloaded by'
+                                     ' another worker', lecfn)
+                        event('skipped', lecfn, reason='claimed')
+                        continue
+                    try:
+                        if not skip_download:
+                            if via:
+                                with phase(downloader.session, 'resolve',
+                                           class_name):
+                                    url = resolve_resource(
+                                        downloader.session, url, via,
+                                        resource.fallback)
+                                if url is None:
+                                    logging.warn('Could not find the %s'
+                                                 ' video for %s', via, lecfn)
+                                    event('skipped', lecfn,
+                                          reason='unresolved')
+                                    if ledger is not None:
+                                        ledger.release(key)
+                                    continue
+                            if disk_space is not None:
+                                size = disk_space.size_of(resource.url, url)
+                                if not disk_space.admit(lecfn, size, url):
+                                    event('skipped', lecfn,
+                                          reason='no_space',
+                                          size=disk_space.size_of(
+                                              resource.url, url))
+                                    if ledger is not None:
+                                        ledger.release(key)
+                                    continue
+                            logging.info('Downloading: %s', lecfn)
+                            event('started', lecfn, url=url)
+                            start = time.time()
+                            try:
+                                with phase(downloader.session, 'transfer',
+                                           class_name):
+                                    ok = downloader.download(url, lecfn)
+                            except Exception as e:
+                                event('failed', lecfn, error=str(e))
+                                raise
+                            finally:
+                                if disk_space is not None:
+                                    disk_space.release(lecfn)
+                            if ok is False:
+                                event('failed', lecfn,
+                                      error='could not download %s' % url)
+                                # left to the next run, or to another worker
+                                if ledger is not None:
+                                    ledger.release(key)
+                                continue
+                            if events is not None:
+                                event('finished', lecfn, **transfer_fields(
+                                    _file_size(lecfn), time.time() - start))
+                        else:
+                            open(lecfn, 'w').close()  # touch
+                    except:
+                        if ledger is not None:
+                            ledger.release(key)
+                        raise
+                    if ledger is not None:
+                        ledger.finish(key)
                     last_update = time.time()
+                    index[os.path.basename(lecfn)] = (None, last_update)
+                    outcome(section, lecname, fmt, resource, last_update)
                 else:
                     logging.info('%s already downloaded', lecfn)
+                    event('skipped', lecfn, reason='exists')
+                    outcome(section, lecname, fmt, resource, existing[1])
                     # if this file hasn't been modified in a long time,
                     # record that time
-                    last_update = max(last_update, os.path.getmtime(lecfn))
+                    last_update = max(last_update, existing[1])
+
+        # nothing to list or to run hooks on (e.g., in --watch mode, when
+        # there is nothing new in the section)
+        if not selected:
+            continue
 
         # After fetching resources, create a playlist in M3U format with the
         # videos downloaded.
         if playlist:
-            path_to_return = os.getcwd()
-
-            for (_path, subdirs, files) in os.walk(sec):
-                os.chdir(_path)
-                globbed_videos = glob.glob("*.mp4")
-                m3u_name = os.path.split(_path)[1] + ".m3u"
-
-                if len(globbed_videos):
-                    with open(m3u_name, "w") as m3u:
-                        for video in globbed_videos:
-                            m3u.write(video + "\n")
-                    os.chdir(path_to_return)
+            write_playlist(sec, index)
 
         if hooks:
-            for hook in hooks:
-                logging.info('Running hook %s for section %s.', hook, sec)
-                os.chdir(sec)
-                subprocess.call(hook)
+            if hook_runner is None:
+                hook_runner = own_runner = HookRunner()
+            hook_runner.submit(class_name, sec, hooks)
+
+    if own_runner is not None:
+        own_runner.close()
 
     # if we haven't updated any files in 1 month, we're probably
     # done with this course
@@ -433,6 +852,30 @@ def download_lectures(downloader,
     return False
 
 
+def plan_class(session, class_name, sections, args, report=None):
+    """
+    Find the sizes of the resources of the class selected by the filters
+    given in args, and log their totals by section and format.  The summary
+    of the plan is kept in report, if given.
+    """
+    filters = ResourceFilter(args.file_formats, args.section_filter,
+                             args.lecture_filter, args.resource_filter)
+
+    sizes = load_sizes()
+    entries = plan_resources(session, sections, filters, resolve_resource,
+                             sizes)
+    try:
+        save_sizes(sizes)
+    except (IOError, OSError) as e:
+        logging.warn('Could not cache the sizes of %s: %s', class_name, e)
+
+    summary = summarize(entries)
+    log_plan(class_name, summary, args.plan_bandwidth)
+
+    if report is not None:
+        report.plan = summary
+
+
 def total_seconds(td):
     """
     Compute total seconds for a timedelta.
@@ -443,6 +886,42 @@ def total_seconds(td):
            (td.seconds + td.days * 24 * 3600) * 10**6) // 10**6
 
 
+class _ClassNameFilter(logging.Filter):
+    """
+    Adds the name of the class being downloaded to the log records.
+    """
+
+    def filter(self, record):
+        record.class_name = _current_class or '-'
+        return True
+
+
+def setup_logging(debug=False, quiet=False, class_tag=False):
+    """
+    (Re)initialize the logging system.  With class_tag, every message is
+    prefixed with the name of the class being downloaded.
+    """
+    if debug:
+        level, fmt = logging.DEBUG, '%(name)s[%(funcName)s] %(message)s'
+    elif quiet:
+        level, fmt = logging.ERROR, '%(name)s: %(message)s'
+    else:
+        level, fmt = logging.INFO, '%(message)s'
+
+    if class_tag:
+        fmt = '[%(class_name)s] ' + fmt
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+
+    logging.basicConfig(level=level, format=fmt)
+
+    if class_tag:
+        for handler in root.handlers:
+            handler.addFilter(_ClassNameFilter())
+
+
 def parseArgs():
     """
     Parse the arguments/options passed to the program on the command line.
@@ -454,7 +933,7 @@ def parseArgs():
     # positional
     parser.add_argument('class_names',
                         action='store',
-                        nargs='+',
+                        nargs='*',
                         help='name(s) of the class(es) (e.g. "nlp")')
 
     parser.add_argument('-c',
@@ -593,11 +1072,99 @@ def parseArgs():
                         dest='local_page',
                         help='uses or creates local cached version of syllabus'
                              ' page')
+    parser.add_argument('--page-store',
+                        dest='page_store',
+                        action='store',
+                        default=None,
+                        help='archive the pages fetched from Coursera'
+                             ' (syllabi, about pages, ...) compressed in'
+                             ' this SQLite file, which also keeps the copies'
+                             ' of the syllabi revalidated on later runs')
+    parser.add_argument('--ledger',
+                        dest='ledger',
+                        action='store',
+                        default=None,
+                        help='share the downloads with the other coursera-dl'
+                             ' processes using this work ledger (the path'
+                             ' of an SQLite file, e.g. on a filesystem'
+                             ' shared by several machines), so that each'
+                             ' file is downloaded by only one of them')
+    parser.add_argument('--disk-reserve',
+                        dest='disk_reserve',
+                        action='store',
+                        default='0',
+                        help='space to keep free on the disk, e.g. 500M or'
+                             ' 2G; files which would not fit are skipped'
+                             ' (default: 0)')
     parser.add_argument('--skip-download',
                         dest='skip_download',
                         action='store_true',
                         default=False,
                         help='for debugging: skip actual downloading of files')
+    parser.add_argument('--plan',
+                        dest='plan',
+                        action='store_true',
+                        default=False,
+                        help='download nothing, but find the size of the'
+                             ' selected resources and report how much (and'
+                             ' how long) it would take to download them')
+    parser.add_argument('--plan-bandwidth',
+                        dest='plan_bandwidth',
+                        action='store',
+                        default='1M',
+                        help='bandwidth used to estimate the download'
+                             ' times of --plan, in bytes per second, e.g.'
+                             ' 500K or 2M (default: 1M)')
+    parser.add_argument('--plan-output',
+                        dest='plan_output',
+                        action='store',
+                        default=None,
+                        help='write the totals found by --plan to this'
+                             ' JSON file')
+    parser.add_argument('--profile',
+                        dest='profile',
+                        action='store_true',
+                        default=False,
+                        help='log the wall and CPU time spent in each phase'
+                             ' (%s), by class, at the end'
+                             % ', '.join(PHASES))
+    parser.add_argument('--profile-output',
+                        dest='profile_output',
+                        action='store',
+                        default=None,
+                        help='write the times found by --profile to this'
+                             ' JSON file')
+    parser.add_argument('--http-stats',
+                        dest='http_stats',
+                        action='store',
+                        metavar='FILE',
+                        default=None,
+                        help='write the statistics of the HTTP requests'
+                             ' (count, latency, status codes, bytes and'
+                             ' reused connections, by endpoint) to this JSON'
+                             ' file; they are logged with --profile')
+    parser.add_argument('--events',
+                        dest='events',
+                        action='store',
+                        metavar='FILE',
+                        default=None,
+                        help='append the events of the run (classes,'
+                             ' authentication, pages, files and hooks) to'
+                             ' FILE as JSON lines, or write them to the'
+                             ' standard output with -')
+    parser.add_argument('--profile-phase',
+                        dest='profile_phase',
+                        action='store',
+                        choices=PHASES,
+                        default=None,
+                        help='run this phase under cProfile, with --profile')
+    parser.add_argument('--profile-dump',
+                        dest='profile_dump',
+                        action='store',
+                        default='coursera-dl.prof',
+                        help='where the statistics of --profile-phase are'
+                             ' written (default: coursera-dl.prof, with the'
+                             ' id of each process when there are several)')
     parser.add_argument('--path',
                         dest='path',
                         action='store',
@@ -619,6 +1186,32 @@ def parseArgs():
                         default=False,
                         help='omit as many messages as possible'
                              ' (only printing errors)')
+    parser.add_argument('--class-jobs',
+                        dest='class_jobs',
+                        action='store',
+                        type=int,
+                        default=1,
+                        help='number of classes to download in parallel,'
+                             ' each in its own process, also for the classes'
+                             ' of --jobs-file (default: 1)')
+    parser.add_argument('--jobs-file',
+                        dest='jobs_file',
+                        action='store',
+                        default=None,
+                        help='also download the classes listed in this'
+                             ' JSON, INI or YAML file, each with its own'
+                             ' options (formats, filters, path, hooks,'
+                             ' ...), and report on each of them at the end')
+    parser.add_argument('--watch',
+                        dest='watch',
+                        action='store',
+                        type=int,
+                        default=None,
+                        metavar='INTERVAL',
+                        help='keep running, polling the classes every'
+                             ' INTERVAL seconds and downloading only what'
+                             ' is new in them (classes which appear'
+                             ' completed are polled less often)')
     parser.add_argument('--add-class',
                         dest='add_class',
                         action='append',
@@ -640,6 +1233,13 @@ def parseArgs():
                         action='append',
                         default=[],
                         help='hooks to run when finished')
+    parser.add_argument('--hook-jobs',
+                        dest='hook_jobs',
+                        type=int,
+                        default=HOOK_WORKERS,
+                        help='number of sections whose hooks may run at the'
+                             ' same time, in the background (default: %d)'
+                             % HOOK_WORKERS)
     parser.add_argument('-pl',
                         '--playlist',
                         dest='playlist',
@@ -651,6 +1251,13 @@ def parseArgs():
                         action='store_true',
                         default=False,
                         help='clear cached cookies')
+    parser.add_argument('--no-syllabus-cache',
+                        dest='syllabus_cache',
+                        action='store_false',
+                        default=True,
+                        help='always download and parse the syllabus page,'
+                             ' instead of revalidating the copy and reusing'
+                             ' the parsing results of a previous run')
     parser.add_argument('--unrestricted-filenames',
                         dest='intact_fnames',
                         action='store_true',
@@ -661,19 +1268,24 @@ def parseArgs():
 
     # Initialize the logging system first so that other functions
     # can use it right away
-    if args.debug:
-        logging.basicConfig(level=logging.DEBUG,
-                            format='%(name)s[%(funcName)s] %(message)s')
-    elif args.quiet:
-        logging.basicConfig(level=logging.ERROR,
-                            format='%(name)s: %(message)s')
-    else:
-        logging.basicConfig(level=logging.INFO,
-                            format='%(message)s')
+    setup_logging(args.debug, args.quiet)
+
+    if not (args.class_names or args.jobs_file):
+        parser.error('no class given, neither on the command line nor'
+                     ' with --jobs-file')
 
     # turn list of strings into list
     args.file_formats = args.file_formats.split()
 
+    if args.profile_output or args.profile_phase:
+        args.profile = True
+
+    try:
+        args.plan_bandwidth = parse_bandwidth(args.plan_bandwidth)
+        args.disk_reserve = parse_size(args.disk_reserve)
+    except ValueError as e:
+        parser.error(str(e))
+
     for bin in ['wget_bin', 'curl_bin', 'aria2_bin', 'axel_bin']:
         if getattr(args, bin):
             logging.error('The --%s option is deprecated, please use --%s',
@@ -694,86 +1306,474 @@ def parseArgs():
             logging.error(e)
             sys.exit(1)
 
+    args.jobs = []
+    if args.jobs_file:
+        try:
+            args.jobs = load_jobs(args.jobs_file, args)
+        except JobFileError as e:
+            logging.error(e)
+            sys.exit(1)
+
     return args
 
 
-def download_class(args, class_name):
+def make_session(args):
+    """
+    Create the requests session shared by all the classes of a run, with a
+    connection pool large enough for all the hosts that we talk to, and
+    with the page store and the work ledger given with --page-store and
+    --ledger, if any.  The hooks of all the classes are run by its
+    hook_runner, the phases are timed by its profiler, with --profile, the
+    events of the run go to its event stream, with --events, and its
+    requests are recorded by its tracer.
+    """
+    session = requests.Session()
+
+    session.tracer = HttpTracer()
+    for prefix in ('http://', 'https://'):
+        session.mount(prefix, TracingAdapter(
+            session.tracer,
+            pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE))
+
+    session.page_store = None
+    if args.page_store:
+        session.page_store = PageStore(args.page_store)
+
+    session.ledger = None
+    if getattr(args, 'ledger', None):
+        session.ledger = open_ledger(args.ledger)
+
+    session.profiler = None
+    if getattr(args, 'profile', False):
+        session.profiler = PhaseProfiler(args.profile_phase, args.profile_dump)
+
+    session.events = None
+    if getattr(args, 'events', None):
+        session.events = open_events(args.events)
+
+    session.hook_runner = HookRunner(getattr(args, 'hook_jobs', HOOK_WORKERS),
+                                     session.profiler, session.events)
+
+    return session
+
+
+def close_session(session):
+    session.hook_runner.close()
+    if session.profiler is not None:
+        session.profiler.dump_cprofile()
+    if session.events is not None:
+        session.events.close()
+    if session.page_store is not None:
+        session.page_store.close()
+    if session.ledger is not None:
+        session.ledger.close()
+    session.close()
+
+
+def download_class(args, class_name, session=None, watch=None, report=None):
     """
     Download all requested resources from the class given in class_name.
     Returns True if the class appears completed.
+
+    The session (and the authentication that it holds) may be shared with
+    other classes; otherwise, a new one is used for this class only.
+
+    With watch, the ClassWatch of the class in --watch mode, nothing is
+    done if the syllabus did not change since the previous round, and only
+    the resources which are new in it are downloaded.
+
+    The files downloaded, and their size, are added to report, if given.
     """
 
-    session = requests.Session()
+    if session is None:
+        session = make_session(args)
+        try:
+            return download_class(args, class_name, session, watch, report)
+        finally:
+            close_session(session)
 
     if args.preview:
         # Todo, remove this.
         session.cookie_values = 'dummy=dummy'
     else:
-        get_cookies_for_class(
-            session,
-            class_name,
-            cookies_file=args.cookies_file,
-            username=args.username, password=args.password
-        )
+        # the cookies cache may be shared with other processes
+        with _cookies_lock:
+            get_cookies_for_class(
+                session,
+                class_name,
+                cookies_file=args.cookies_file,
+                username=args.username, password=args.password
+            )
         session.cookie_values = make_cookie_values(session.cookies, class_name)
 
     # get the syllabus listing
-    page = get_syllabus(session, class_name, args.local_page, args.preview)
-
-    # parse it
-    sections = parse_syllabus(session, page, args.reverse,
-                              args.intact_fnames)
+    with phase(session, 'syllabus', class_name):
+        page = get_syllabus(session, class_name, args.local_page,
+                            args.preview, args.syllabus_cache)
+
+    if watch is not None:
+        key = syllabus_cache_key(page, args.reverse, args.intact_fnames)
+        if watch.unchanged(key):
+            return watch.completed
+
+    # parse it in the background, handing each section over to
+    # download_lectures as soon as it is ready
+    sections = prefetch(
+        phase_iter(session, 'parse',
+                   stream_syllabus(session, class_name, page, args.reverse,
+                                   args.intact_fnames, args.syllabus_cache),
+                   class_name),
+        SECTIONS_PREFETCH)
+
+    if watch is not None:
+        sections = watch.filter_new(sections)
+
+    if args.plan:
+        plan_class(session, class_name, sections, args, report)
+        return False
 
     if args.about:
         download_about(session, class_name, args.path, args.overwrite)
 
+    outcomes = {} if watch is not None else None
     downloader = get_downloader(session, class_name, args)
+    disk_space = DiskSpace(args.disk_reserve, load_sizes(),
+                           lambda url: get_size(session, url),
+                           PATH_DISK_RESERVATIONS)
 
     # obtain the resources
-    completed = download_lectures(
-        downloader,
-        class_name,
-        sections,
-        args.file_formats,
-        args.overwrite,
-        args.skip_download,
-        args.section_filter,
-        args.lecture_filter,
-        args.resource_filter,
-        args.path,
-        args.verbose_dirs,
-        args.preview,
-        args.combined_section_lectures_nums,
-        args.hooks,
-        args.playlist,
-        args.intact_fnames)
+    try:
+        completed = download_lectures(
+            downloader,
+            class_name,
+            sections,
+            args.file_formats,
+            args.overwrite,
+            args.skip_download,
+            args.section_filter,
+            args.lecture_filter,
+            args.resource_filter,
+            args.path,
+            args.verbose_dirs,
+            args.preview,
+            args.combined_section_lectures_nums,
+            args.hooks,
+            args.playlist,
+            args.intact_fnames,
+            getattr(session, 'ledger', None),
+            disk_space,
+            getattr(session, 'hook_runner', None),
+            outcomes)
+    finally:
+        disk_space.log_shortfall(class_name)
+        if report is not None:
+            report.files += downloader.files
+            report.bytes += downloader.bytes
+
+    if watch is not None:
+        completed = watch.done(key, completed, outcomes)
+
+    return completed
+
+
+def process_class(args, class_name, session=None, watch=None, report=None):
+    """
+    Download the class given in class_name, logging the errors that should
+    not keep us from downloading other classes.
+    Returns True if the class appears completed.
+
+    The outcome, time taken and bytes downloaded are recorded in report,
+    if given.
+    """
+    start = time.time()
+    completed = False
+    error = None
+
+    try:
+        logging.info('Downloading class: %s', class_name)
+        emit(session, 'class_start', class_name=class_name)
+        completed = download_class(args, class_name, session, watch, report)
+    except requests.exceptions.HTTPError as e:
+        error = 'HTTPError %s' % e
+    except ClassNotFound as cnf:
+        error = 'Could not find class: %s' % cnf
+    except AuthenticationFailed as af:
+        error = 'Could not authenticate: %s' % af
+
+    if error:
+        logging.error(error)
+
+    seconds = time.time() - start
+    if report is not None:
+        report.completed = completed
+        report.error = error
+        report.seconds += seconds
+
+    emit(session, 'class_end', class_name=class_name, completed=completed,
+         error=error, seconds=round(seconds, 3))
 
     return completed
 
 
+def _init_class_worker(args, cookies_lock):
+    global _args, _cookies_lock
+
+    _args = args
+    _cookies_lock = cookies_lock
+    setup_logging(args.debug, args.quiet, class_tag=True)
+
+
+def _get_worker_session():
+    """
+    Return the session of this worker, creating it for its first class.
+
+    It is created here rather than in _init_class_worker because the pool
+    would keep on starting new workers if the initializer failed.
+    """
+    global _session
+
+    if _session is None:
+        _session = make_session(_args)
+        if _session.profiler is not None:
+            _session.profiler.cprofile_path += '.%d' % os.getpid()
+        # pool workers skip atexit, but run the finalizers of this module
+        multiprocessing.util.Finalize(None, close_session, (_session,),
+                                      exitpriority=10)
+    return _session
+
+
+def _process_class_in_worker(job):
+    global _current_class
+
+    class_name, class_args = job
+    report = ClassReport(class_name)
+
+    _current_class = class_name
+    try:
+        session = _get_worker_session()
+        process_class(class_args, class_name, session, None, report)
+        _collect_http(session, report)
+        # the report goes back to the parent now, with the hooks of the class
+        report.hooks = session.hook_runner.wait(class_name)
+        _collect_phases(session, report)
+        return report
+    finally:
+        _current_class = None
+
+
+def download_classes_in_parallel(args, jobs, processes):
+    """
+    Download the classes of the given (class_name, args) jobs in a pool of
+    processes, so that the parsing of their pages is spread over several
+    cores.  Returns the ClassReport of each job.
+    """
+    reports = {}
+
+    pool = multiprocessing.Pool(
+        min(processes, len(jobs)), _init_class_worker,
+        (args, multiprocessing.Lock()))
+    try:
+        for report in pool.imap_unordered(_process_class_in_worker, jobs):
+            reports[report.class_name] = report
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    # keep the order of the jobs
+    return [reports[class_name] for class_name, _ in jobs]
+
+
+def _collect_phases(session, report):
+    """
+    Move the times of the phases of the class of report, with --profile,
+    from the profiler of the session to the report.
+    """
+    if getattr(session, 'profiler', None) is not None:
+        report.add_phases(session.profiler.pop_class(report.class_name))
+
+
+def _collect_http(session, report):
+    """
+    Move the statistics of the requests made since the last call from the
+    tracer of the session to the report.
+    """
+    if getattr(session, 'tracer', None) is not None:
+        report.add_http(session.tracer.pop())
+
+
+def authenticate_classes(session, jobs):
+    """
+    Authenticate on all the classes of the given (class_name, args) jobs
+    at once, before downloading any of them, so that the login and the
+    handshakes with the classes are not done one class at a time.  The
+    classes read from a cookies file, or previewed, need none.
+    """
+    by_user = {}
+    for class_name, class_args in jobs:
+        if class_args.preview or class_args.cookies_file:
+            continue
+        credentials = (class_args.username, class_args.password)
+        by_user.setdefault(credentials, []).append(class_name)
+
+    for (username, password), class_names in by_user.items():
+        if len(class_names) < 2:
+            continue
+        try:
+            with _cookies_lock:
+                get_cookies_for_classes(session, class_names,
+                                        username, password)
+        except (AuthenticationFailed, ClassNotFound,
+                requests.exceptions.RequestException) as e:
+            # each class will try again, and report its own error
+            logging.warn('Could not authenticate on the classes of %s: %s',
+                         username, e)
+
+
+def download_classes(args, jobs):
+    """
+    Download the classes of the given (class_name, args) jobs, running up to
+    args.class_jobs of them at the same time.  Returns the ClassReport of
+    each job.
+
+    The requests made to authenticate on all the classes at once are
+    counted in the report of the first one.
+    """
+    if args.class_jobs > 1 and len(jobs) > 1:
+        # the workers find the cookies in the cache, already validated
+        session = requests.Session()
+        session.profiler = PhaseProfiler() if args.profile else None
+        session.tracer = HttpTracer()
+        for prefix in ('http://', 'https://'):
+            session.mount(prefix, TracingAdapter(session.tracer))
+        try:
+            authenticate_classes(session, jobs)
+        finally:
+            session.close()
+
+        reports = download_classes_in_parallel(args, jobs, args.class_jobs)
+        for report in reports:
+            _collect_phases(session, report)
+        _collect_http(session, reports[0])
+        return reports
+
+    reports = []
+    session = make_session(args)
+    try:
+        authenticate_classes(session, jobs)
+        shared = session.tracer.pop()
+        for class_name, class_args in jobs:
+            report = ClassReport(class_name)
+            process_class(class_args, class_name, session, None, report)
+            _collect_http(session, report)
+            reports.append(report)
+        if reports:
+            reports[0].add_http(shared)
+        for report in reports:
+            report.hooks = session.hook_runner.wait(report.class_name)
+            _collect_phases(session, report)
+    finally:
+        close_session(session)
+
+    return reports
+
+
+def watch_classes(args, jobs, session, rounds=None):
+    """
+    Poll the classes of the given (class_name, args) jobs every args.watch
+    seconds, downloading whatever appears in them, until interrupted (or
+    for the given number of rounds).  The classes which appear completed
+    are polled less often.
+    """
+    watches = [(ClassWatch(class_name, args.watch), class_args)
+               for class_name, class_args in jobs]
+    hook_runner = getattr(session, 'hook_runner', None)
+
+    while rounds is None or rounds > 0:
+        for watch, class_args in watches:
+            if watch.next_poll <= time.time():
+                process_class(class_args, watch.class_name, session, watch)
+                watch.schedule(time.time())
+
+        # the hooks which are over, so that their results do not pile up
+        if hook_runner is not None:
+            log_hooks(hook_runner.pop_results())
+
+        if rounds is not None:
+            rounds -= 1
+            if not rounds:
+                break
+
+        next_poll = min(watch.next_poll for watch, _ in watches)
+        delay = next_poll - time.time()
+        if delay > 0:
+            logging.info('Next poll in %d seconds.', delay)
+            time.sleep(delay)
+
+
 def main():
     """
     Main entry point for execution as a program (instead of as a module).
     """
 
     args = parseArgs()
+    check_versions()
     completed_classes = []
+    start, start_cpu = time.time(), cpu_time(children=True)
 
     mkdir_p(PATH_CACHE, 0o700)
     if args.clear_cache:
         shutil.rmtree(PATH_CACHE)
 
-    for class_name in args.class_names:
+    jobs = [(class_name, args) for class_name in args.class_names]
+    jobs.extend(args.jobs)
+
+    if args.watch:
+        session = make_session(args)
         try:
-            logging.info('Downloading class: %s', class_name)
-            if download_class(args, class_name):
-                completed_classes.append(class_name)
-        except requests.exceptions.HTTPError as e:
-            logging.error('HTTPError %s', e)
-        except ClassNotFound as cnf:
-            logging.error('Could not find class: %s', cnf)
-        except AuthenticationFailed as af:
-            logging.error('Could not authenticate: %s', af)
+            authenticate_classes(session, jobs)
+            watch_classes(args, jobs, session)
+        except KeyboardInterrupt:
+            logging.info('Stopped watching.')
+        finally:
+            close_session(session)
+        hooks = session.hook_runner.pop_results()
+        if args.profile:
+            phases = session.profiler.times
+        http = session.tracer.stats
+    else:
+        reports = download_classes(args, jobs)
+        if args.jobs_file:
+            log_report(reports)
+        if args.plan and args.plan_output:
+            write_plan(args.plan_output,
+                       dict((r.class_name, r.plan) for r in reports
+                            if r.plan is not None),
+                       args.plan_bandwidth)
+        completed_classes = [r.class_name for r in reports if r.completed]
+        hooks = [h for r in reports for h in r.hooks]
+        phases = dict((r.class_name, r.phases) for r in reports)
+        http = {}
+        for report in reports:
+            merge_http_stats(http, report.http)
+
+    if args.profile:
+        summary = summarize_phases(phases, time.time() - start,
+                                   cpu_time(children=True) - start_cpu)
+        log_phases(summary)
+        if args.profile_output:
+            write_phases(args.profile_output, summary)
+
+    if args.profile or args.http_stats:
+        summary = summarize_http(http)
+        if args.profile:
+            log_http_stats(summary)
+        if args.http_stats:
+            write_http_stats(args.http_stats, summary)
+
+    log_hooks(hooks)
 
     if completed_classes:
         logging.info(
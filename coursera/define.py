@@ -25,3 +25,8 @@ else:
 
 PATH_CACHE = os.path.join(tempfile.gettempdir(), user+"_coursera_dl_cache")
 PATH_COOKIES = os.path.join(PATH_CACHE, 'cookies')
+PATH_SYLLABUS_CACHE = os.path.join(PATH_CACHE, 'syllabus')
+PATH_PAGE_CACHE = os.path.join(PATH_CACHE, 'pages')
+PATH_SIZES_CACHE = os.path.join(PATH_CACHE, 'sizes.json.z')
+PATH_VALIDATIONS_CACHE = os.path.join(PATH_CACHE, 'validations.json.z')
+PATH_DISK_RESERVATIONS = os.path.join(PATH_CACHE, 'reservations.json')
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+"""
+Admission control of the downloads by the free space of their filesystem.
+
+Before a transfer starts, its size (as planned by --plan, or as given by the
+Content-Length of a HEAD request) is compared with the space left on the
+filesystem of the file, minus a reserve, and minus what the transfers still
+in flight are yet to write.  Transfers which would not fit are skipped, so
+that we do not leave truncated files behind when the disk is full.
+
+The transfers in flight are kept in a registry file, under a lock, so that
+the processes of a run (with --class-jobs), or of several runs, do not
+overbook the disk.  The sizes which are not known are only asked for when
+the space runs low.
+"""
+
+import contextlib
+import errno
+import json
+import logging
+import os
+import threading
+
+from .downloaders import format_bytes
+from .utils import file_lock, mkdir_p
+
+# Below this much available space, the sizes which are not known are asked
+# for; above it, a file of unknown size is assumed to fit.
+LOW_SPACE = 10 * 1024 ** 3
+
+# Serializes the use of the registries by the threads of this process,
+# since their file lock cannot be taken twice by the same process.
+_registry_lock = threading.Lock()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def _read_registry(path):
+    """
+    Return the transfers in flight found in the registry at path, leaving
+    out those of the processes which are gone.
+    """
+    try:
+        with open(path) as f:
+            in_flight = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    return dict((filename, entry) for filename, entry in in_flight.items()
+                if _alive(entry[1]))
+
+
+def free_space(path):
+    """
+    Return the bytes available to us on the filesystem of path, or None if
+    we cannot tell.
+    """
+    while path and not os.path.exists(path):
+        path = os.path.dirname(path)
+
+    try:
+        st = os.statvfs(path or os.curdir)
+    except (AttributeError, OSError):  # no statvfs on Windows
+        return None
+    return st.f_bavail * st.f_frsize
+
+
+class DiskSpace(object):
+    """
+    Admits the transfers which fit on their filesystem.
+
+    :param reserve: Bytes to keep free on every filesystem.
+    :param sizes: Known sizes of the resources, by url.
+    :param get_size: Function returning the size of the resource at a url,
+        or None, for the resources whose size is not known.
+    :param registry: File where the transfers in flight are shared with
+        the other processes; without it, they are only known to this
+        DiskSpace.
+    """
+
+    def __init__(self, reserve=0, sizes=None, get_size=None, registry=None):
+        self.reserve = reserve
+        self.sizes = sizes or {}
+        self.get_size = get_size
+        # the entries of dead processes are found with os.kill, and the
+        # registry is only safe with file locks
+        self.registry = registry if os.name == 'posix' else None
+
+        self._lock = threading.Lock()
+        self._in_flight = {}  # [size, pid] of each file being downloaded
+        self.skipped = []     # (filename, size, available) of those skipped
+
+    def size_of(self, *urls):
+        """
+        Return the known size of a resource known by the given urls (e.g.
+        the url in the syllabus and the one that it was resolved to), or
+        None.
+        """
+        for url in urls:
+            if url in self.sizes:
+                return self.sizes[url]
+        return None
+
+    @contextlib.contextmanager
+    def _transfers(self, update=False):
+        """
+        Yield the dict of the transfers in flight, by absolute filename,
+        saving it back to the registry after the with block if update is
+        set.
+        """
+        if self.registry is None:
+            with self._lock:
+                yield self._in_flight
+            return
+
+        mkdir_p(os.path.dirname(self.registry))
+        with _registry_lock:
+            with file_lock(self.registry + '.lock'):
+                in_flight = _read_registry(self.registry)
+                yield in_flight
+                if update:
+                    with open(self.registry, 'w') as f:
+                        json.dump(in_flight, f)
+
+    def _available(self, free, in_flight):
+        """
+        Return the bytes available to a new transfer.
+        """
+        pending = 0
+        for filename, (size, _) in in_flight.items():
+            try:
+                written = os.path.getsize(filename)
+            except OSError:
+                written = 0
+            pending += max(0, size - written)
+        return free - pending - self.reserve
+
+    def admit(self, filename, size, url=None):
+        """
+        Tell whether the transfer of size bytes (None if unknown) to
+        filename may start.  If so, the space is held for it until release
+        is called.
+
+        If the size is not known, and the space runs low, it is asked for
+        with get_size(url), outside of the lock, and remembered.
+        """
+        free = free_space(os.path.dirname(filename))
+        if free is None:
+            return True
+
+        if size is None and url is not None and self.get_size is not None:
+            with self._transfers() as in_flight:
+                available = self._available(free, in_flight)
+            if available < LOW_SPACE:
+                size = self.get_size(url)
+                if size is not None:
+                    self.sizes[url] = size
+                free = free_space(os.path.dirname(filename))
+
+        with self._transfers(update=True) as in_flight:
+            available = self._available(free, in_flight)
+            if (size or 0) > available:
+                logging.warn('Not enough space for %s: it needs %s, but only'
+                             ' %s are available', filename, format_bytes(size),
+                             format_bytes(max(0, available)))
+                self.skipped.append((filename, size or 0, available))
+                return False
+
+            in_flight[os.path.abspath(filename)] = [size or 0, os.getpid()]
+            return True
+
+    def release(self, filename):
+        """
+        Forget the transfer to filename, which is over.
+        """
+        with self._transfers(update=True) as in_flight:
+            in_flight.pop(os.path.abspath(filename), None)
+
+    def log_shortfall(self, class_name):
+        """
+        Log what was skipped for lack of space, and how much more space it
+        would take.
+        """
+        if not self.skipped:
+            return
+
+        needed = sum(size for _, size, _ in self.skipped)
+        available = max(0, min(available for _, _, available in self.skipped))
+        logging.warn('Skipped %d file(s) of %s for lack of disk space: they'
+                     ' need %s, but only %s were available (keeping %s'
+                     ' free). Free at least %s and run again.',
+                     len(self.skipped), class_name, format_bytes(needed),
+                     format_bytes(available), format_bytes(self.reserve),
+                     format_bytes(needed - available))
@@ -12,6 +12,8 @@ import time
 
 from six import iteritems
 
+from .events import progress_listener
+
 
 class Downloader(object):
     """
@@ -26,6 +28,10 @@ class Downloader(object):
       >>> d.download('http://example.com', 'save/to/this/file')
     """
 
+    # Files downloaded so far, and their total size
+    files = 0
+    bytes = 0
+
     def _start_download(self, url, filename):
         """
         Actual method to download the given url to the given file.
@@ -37,10 +43,11 @@ class Downloader(object):
         """
         Download the given url to the given file. When the download
         is aborted by the user, the partially downloaded file is also removed.
+        Returns False if the download failed.
         """
 
         try:
-            self._start_download(url, filename)
+            ok = self._start_download(url, filename)
         except KeyboardInterrupt as e:
             logging.info(
                 'Keyboard Interrupt -- Removing partial file: %s', filename)
@@ -50,6 +57,18 @@ class Downloader(object):
                 pass
             raise e
 
+        if ok is False:
+            return False
+
+        # the external downloaders do not tell us what they fetched
+        try:
+            size = os.path.getsize(filename)
+        except OSError:
+            return True
+        self.files += 1
+        self.bytes += size
+        return True
+
 
 class ExternalDownloader(Downloader):
     """
@@ -195,9 +214,13 @@ class DownloadProgress(object):
     """
     Report download progress.
     Inspired by https://github.com/rg3/youtube-dl
+
+    The listener, if any, is called with the bytes read so far, the total
+    and the seconds elapsed, every time that some are read.  The progress
+    bar is printed to out (the standard output by default).
     """
 
-    def __init__(self, total):
+    def __init__(self, total, listener=None, out=None):
         if total in [0, '0', None]:
             self._total = None
         else:
@@ -208,6 +231,8 @@ class DownloadProgress(object):
         self._now = 0
 
         self._finished = False
+        self._listener = listener
+        self._out = out
 
     def start(self):
         self._now = time.time()
@@ -223,6 +248,9 @@ class DownloadProgress(object):
         self._now = time.time()
         self._current += bytes
         self.report_progress()
+        if self._listener is not None:
+            self._listener(self._current, self._total,
+                           self._now - self._start)
 
     def calc_percent(self):
         if self._total is None:
@@ -247,11 +275,12 @@ class DownloadProgress(object):
 
         report = '\r{0: <56} {1: >30}'.format(percent, total_speed_report)
 
+        out = self._out or sys.stdout
         if self._finished:
-            print(report)
+            print(report, file=out)
         else:
-            print(report, end="")
-        sys.stdout.flush()
+            print(report, end="", file=out)
+        out.flush()
 
 
 class NativeDownloader(Downloader):
@@ -283,14 +312,18 @@ class NativeDownloader(Downloader):
                     error_msg = 'HTTP Error ' + str(r.status_code)
 
                 wait_interval = 2 ** (attempts_count + 1)
-                msg = 'Error downloading, will retry in {0} seconds ...'
-                print(msg.format(wait_interval))
+                logging.info('Error downloading, will retry in %d'
+                             ' seconds ...', wait_interval)
                 time.sleep(wait_interval)
                 attempts_count += 1
                 continue
 
             content_length = r.headers.get('content-length')
-            progress = DownloadProgress(content_length)
+            events = getattr(self.session, 'events', None)
+            progress = DownloadProgress(
+                content_length, progress_listener(self.session, filename),
+                # keep the standard output for the events
+                sys.stderr if events and events.to_stdout else None)
             chunk_sz = 1048576
             with open(filename, 'wb') as f:
                 progress.start()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+"""
+Stream of the events of a run, for --events, which other programs can
+follow.
+
+Each event is a JSON object on a line of its own, with its 'event' name, the
+'time' when it happened and the 'pid' of the process, plus fields of its
+own, e.g.:
+
+  {"event": "finished", "class_name": "ml-005", "file": "...",
+   "bytes": 1048576, "seconds": 2.5, "throughput": 419430.4, ...}
+
+The events are:
+
+  class_start, class_end    a class is being downloaded, or is done with
+  login, auth               we logged in, or got the cookies of a class
+  page                      a page was fetched
+  queued, started,          a resource is to be downloaded, and what
+  progress, finished,       happened to it
+  skipped, failed
+  hook                      a hook ended
+
+Each event is written with a single write, so that the processes of a run
+can share the file.  The progress of a transfer is reported at most every
+PROGRESS_INTERVAL seconds.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+# Seconds between the progress events of a transfer
+PROGRESS_INTERVAL = 1.0
+
+
+class EventStream(object):
+    """
+    Writes events to a file object, one JSON object per line.
+
+    :param out: The file object, opened in binary mode, or sys.stdout.
+    :param close: Whether close should close it.
+    """
+
+    def __init__(self, out, close=True):
+        self.out = out
+        self._close = close
+        self._lock = threading.Lock()
+
+    @property
+    def to_stdout(self):
+        return self.out is sys.stdout
+
+    def emit(self, event, **fields):
+        fields['event'] = event
+        fields['time'] = round(time.time(), 3)
+        fields['pid'] = os.getpid()
+        line = json.dumps(fields, separators=(',', ':')) + '\n'
+
+        with self._lock:
+            if self.to_stdout:
+                self.out.write(line)
+                self.out.flush()
+            else:
+                self.out.write(line.encode('utf-8'))
+
+    def close(self):
+        if self._close:
+            self.out.close()
+
+
+def open_events(spec):
+    """
+    Open the EventStream given on the command line: '-' for the standard
+    output, or the path of a file, to which the events are appended.
+    """
+    if spec == '-':
+        return EventStream(sys.stdout, close=False)
+    return EventStream(open(spec, 'ab', 0))
+
+
+def emit(session, event, **fields):
+    """
+    Emit an event in the event stream of the session, if it has one.
+    """
+    events = getattr(session, 'events', None)
+    if events is not None:
+        events.emit(event, **fields)
+
+
+def transfer_fields(size, seconds):
+    """
+    Return the fields of an event about size bytes transferred in seconds.
+    """
+    return {'bytes': size,
+            'seconds': round(seconds, 3),
+            'throughput': round(size / seconds, 1) if seconds > 0 else None}
+
+
+def progress_listener(session, filename):
+    """
+    Return a function to call with the bytes read so far, the total (None
+    if unknown) and the seconds elapsed during the transfer of filename,
+    which emits progress events, or None if the session has no event
+    stream.
+    """
+    if getattr(session, 'events', None) is None:
+        return None
+
+    state = {'last': None}
+
+    def listener(current, total, seconds):
+        now = time.time()
+        last = state['last']
+        if last is not None and now - last < PROGRESS_INTERVAL:
+            return
+        state['last'] = now
+        emit(session, 'progress', file=filename, total=total,
+             **transfer_fields(current, seconds))
+
+    return listener
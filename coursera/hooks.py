@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""
+Background execution of the --hook commands.
+
+The hooks of a section are run as soon as it is downloaded, in a small pool
+of threads, so that a slow hook (e.g., transcoding the videos or uploading
+them somewhere) does not hold up the download of the next sections.  Each
+hook runs in the directory of its section; the hooks of a section run one
+after the other, in the order in which they were given.
+"""
+
+import logging
+import subprocess
+import threading
+import time
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+from .events import emit
+from .phases import phase
+
+# How many sections may have their hooks running at the same time
+HOOK_WORKERS = 2
+
+
+class HookResult(namedtuple('HookResult',
+                            'class_name section hook returncode seconds')):
+    """
+    The outcome of a hook: its exit code, or None if it could not be run,
+    and how long it took.
+    """
+
+    __slots__ = ()
+
+    @property
+    def failed(self):
+        return self.returncode != 0
+
+
+def run_hook(class_name, section, hook):
+    """
+    Run the hook in the directory section, and return its HookResult.
+    """
+    logging.info('Running hook %s for section %s.', hook, section)
+    start = time.time()
+    try:
+        returncode = subprocess.call(hook, cwd=section)
+    except OSError as e:
+        logging.error('Could not run hook %s for section %s: %s',
+                      hook, section, e)
+        returncode = None
+
+    result = HookResult(class_name, section, hook, returncode,
+                        time.time() - start)
+    if result.returncode:
+        logging.warn('Hook %s for section %s exited with code %d.',
+                     hook, section, result.returncode)
+    else:
+        logging.debug('Hook %s for section %s done in %.1f seconds.',
+                      hook, section, result.seconds)
+    return result
+
+
+def log_hooks(results):
+    """
+    Log a line for each of the given HookResults, with its exit code and
+    how long it took.
+    """
+    for r in results:
+        if r.returncode is None:
+            outcome = 'could not be run'
+        else:
+            outcome = 'exited with code %d' % r.returncode
+        logging.info('Hook %s for section %s %s after %.1f seconds.',
+                     r.hook, r.section, outcome, r.seconds)
+
+
+class HookRunner(object):
+    """
+    Runs the hooks of the sections in the background.
+
+    :param workers: How many sections may have their hooks running at the
+        same time.
+    :param profiler: PhaseProfiler recording the time spent in the hooks,
+        if any.
+    :param events: EventStream to which the results are emitted, if any.
+    """
+
+    def __init__(self, workers=HOOK_WORKERS, profiler=None, events=None):
+        self.workers = max(1, workers)
+        self.profiler = profiler
+        self.events = events
+
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pending = []  # (class_name, AsyncResult) of each section
+        self.results = []   # HookResult of each hook which has run, until
+                            # it is returned by wait or pop_results
+
+    def submit(self, class_name, section, hooks):
+        """
+        Run the hooks of a section of class_name, one after the other, in
+        the background.
+        """
+        def run():
+            for hook in hooks:
+                with phase(self, 'hooks', class_name):
+                    result = run_hook(class_name, section, hook)
+                emit(self, 'hook', class_name=class_name, section=section,
+                     hook=hook, returncode=result.returncode,
+                     seconds=round(result.seconds, 3))
+                with self._lock:
+                    self.results.append(result)
+
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self.workers)
+            self._pending.append((class_name, self._pool.apply_async(run)))
+
+    def wait(self, class_name=None):
+        """
+        Wait until the hooks submitted for class_name (or for all the
+        classes) are over, and return their HookResults, which are then
+        forgotten.
+        """
+        self._wait(class_name)
+        with self._lock:
+            return self._pop_results(class_name)
+
+    def _wait(self, class_name):
+        with self._lock:
+            pending = [p for p in self._pending
+                       if class_name is None or p[0] == class_name]
+
+        running = sum(1 for _, r in pending if not r.ready())
+        if running:
+            logging.info('Waiting for the hooks of %d section(s).', running)
+        for _, async_result in pending:
+            async_result.get()
+
+        with self._lock:
+            self._pending = [p for p in self._pending if p not in pending]
+
+    def pop_results(self):
+        """
+        Return the HookResults of the hooks which are over, without waiting
+        for the others, and forget them.
+        """
+        with self._lock:
+            self._pending = [p for p in self._pending if not p[1].ready()]
+            return self._pop_results(None)
+
+    def _pop_results(self, class_name):
+        popped, kept = [], []
+        for r in self.results:
+            if class_name is None or r.class_name == class_name:
+                popped.append(r)
+            else:
+                kept.append(r)
+        self.results = kept
+        return popped
+
+    def close(self):
+        """
+        Wait for all the hooks, and stop the pool.  The results which were
+        not returned yet are kept for pop_results.
+        """
+        self._wait(None)
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
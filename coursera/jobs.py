@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+"""
+Job files, which list many classes with their own options, so that they can
+all be downloaded by a single run, and the report of such a run.
+
+A job file can be written in JSON::
+
+    {"defaults": {"formats": "mp4 pdf"},
+     "classes": [{"class": "ml-005", "path": "/data/ml"},
+                 {"class": "nlp", "preview": true, "hooks": ["./done.sh"]}]}
+
+or as an INI file, with one section per class (and their defaults in the
+DEFAULT section)::
+
+    [DEFAULT]
+    formats = mp4 pdf
+
+    [ml-005]
+    path = /data/ml
+
+or in YAML, with the same structure as in JSON, if PyYAML is installed.
+"""
+
+import copy
+import json
+import logging
+import os
+
+from six.moves import configparser
+
+from .downloaders import format_bytes
+from .tracing import merge_http_stats
+
+
+class JobFileError(BaseException):
+    """
+    Raised if a job file cannot be read or has unknown options.
+    """
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'yes', 'true', 'on')
+
+
+def _to_list(value):
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [line.strip() for line in value.splitlines() if line.strip()]
+
+
+def _to_formats(value):
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return value.split()
+
+
+# The options that can be given to each class, with the attribute of the
+# command line arguments that they replace and how to convert them.
+JOB_OPTIONS = {
+    'about': ('about', _to_bool),
+    'combined_section_lectures_nums': ('combined_section_lectures_nums',
+                                       _to_bool),
+    'formats': ('file_formats', _to_formats),
+    'hooks': ('hooks', _to_list),
+    'lecture_filter': ('lecture_filter', None),
+    'overwrite': ('overwrite', _to_bool),
+    'path': ('path', None),
+    'playlist': ('playlist', _to_bool),
+    'preview': ('preview', _to_bool),
+    'resource_filter': ('resource_filter', None),
+    'reverse': ('reverse', _to_bool),
+    'section_filter': ('section_filter', None),
+    'skip_download': ('skip_download', _to_bool),
+    'unrestricted_filenames': ('intact_fnames', _to_bool),
+    'verbose_dirs': ('verbose_dirs', _to_bool),
+}
+
+
+def _read_ini(path):
+    parser = configparser.RawConfigParser()
+    # readfp is deprecated in Python 3
+    read_file = getattr(parser, 'read_file', None) or parser.readfp
+    try:
+        with open(path) as f:
+            read_file(f)
+    except configparser.Error as e:
+        raise JobFileError('Cannot parse %s: %s' % (path, e))
+
+    classes = []
+    for section in parser.sections():
+        options = dict(parser.items(section))
+        options['class'] = section
+        classes.append(options)
+    return {'classes': classes}
+
+
+def _read_yaml(path):
+    try:
+        import yaml
+    except ImportError:
+        raise JobFileError('PyYAML is needed to read %s' % path)
+
+    with open(path) as f:
+        try:
+            return yaml.safe_load(f)
+        except yaml.YAMLError as e:
+            raise JobFileError('Cannot parse %s: %s' % (path, e))
+
+
+def _read_json(path):
+    with open(path) as f:
+        try:
+            return json.load(f)
+        except ValueError as e:
+            raise JobFileError('Cannot parse %s: %s' % (path, e))
+
+
+def read_job_file(path):
+    """
+    Return the contents of the job file as a dict with the 'classes' list
+    and the optional 'defaults', whatever the format of the file.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext in ('.ini', '.cfg', '.conf'):
+            data = _read_ini(path)
+        elif ext in ('.yaml', '.yml'):
+            data = _read_yaml(path)
+        else:
+            data = _read_json(path)
+    except (IOError, OSError) as e:
+        raise JobFileError('Cannot read %s: %s' % (path, e))
+
+    if isinstance(data, list):
+        data = {'classes': data}
+    if not isinstance(data, dict) or \
+            not isinstance(data.get('classes'), list):
+        raise JobFileError('No list of classes in %s' % path)
+
+    return data
+
+
+def _apply_options(args, options, where):
+    for name, value in options.items():
+        name = name.replace('-', '_')
+        if name not in JOB_OPTIONS:
+            raise JobFileError('Unknown option %s in %s' % (name, where))
+        dest, convert = JOB_OPTIONS[name]
+        setattr(args, dest, convert(value) if convert else value)
+
+
+def load_jobs(path, args):
+    """
+    Return the (class_name, args) pairs of the classes listed in the job
+    file, where args are the command line arguments updated with the
+    defaults of the file and with the options of the class.
+    """
+    data = read_job_file(path)
+
+    defaults = copy.copy(args)
+    _apply_options(defaults, data.get('defaults') or {}, 'defaults')
+
+    jobs = []
+    for options in data['classes']:
+        if not isinstance(options, dict):
+            options = {'class': options}
+        options = dict(options)
+
+        class_name = options.pop('class', None)
+        if not class_name:
+            raise JobFileError('Class without a name in %s' % path)
+
+        job_args = copy.copy(defaults)
+        _apply_options(job_args, options, class_name)
+        jobs.append((class_name, job_args))
+
+    logging.info('Loaded %d class(es) from %s', len(jobs), path)
+    return jobs
+
+
+class ClassReport(object):
+    """
+    What happened to a class during a run.
+    """
+
+    def __init__(self, class_name):
+        self.class_name = class_name
+        self.completed = False
+        self.error = None
+        self.seconds = 0.0
+        self.files = 0
+        self.bytes = 0
+        self.plan = None  # summary of the plan, with --plan
+        self.hooks = []   # HookResult of each hook run for the class
+        self.phases = {}  # [wall, cpu, count] by phase, with --profile
+        self.http = {}    # statistics of the HTTP requests, by endpoint
+
+    def add_phases(self, phases):
+        """
+        Add the times of phases, as returned by PhaseProfiler.pop_class.
+        """
+        for name, times in phases.items():
+            totals = self.phases.setdefault(name, [0.0, 0.0, 0])
+            for i, value in enumerate(times):
+                totals[i] += value
+
+    def add_http(self, stats):
+        """
+        Add the statistics of requests, as returned by HttpTracer.pop.
+        """
+        merge_http_stats(self.http, stats)
+
+    @property
+    def status(self):
+        if self.error:
+            return 'failed'
+        return 'completed' if self.completed else 'ok'
+
+
+def log_report(reports):
+    """
+    Log a table with the time taken by each class and what it downloaded.
+    """
+    if not reports:
+        return
+
+    width = max(len(r.class_name) for r in reports)
+    line = '{0:<{width}}  {1:<9}  {2:>9}  {3:>6}  {4:>10}'
+
+    logging.info('Report:')
+    logging.info(line.format('class', 'status', 'seconds', 'files', 'bytes',
+                             width=width))
+    for r in reports:
+        logging.info(line.format(r.class_name, r.status,
+                                 '%.1f' % r.seconds, r.files,
+                                 format_bytes(r.bytes), width=width))
+        if r.error:
+            logging.info('  %s', r.error)
+
+    logging.info(line.format(
+        'total', '%d/%d' % (sum(1 for r in reports if not r.error),
+                            len(reports)),
+        '%.1f' % sum(r.seconds for r in reports),
+        sum(r.files for r in reports),
+        format_bytes(sum(r.bytes for r in reports)), width=width))
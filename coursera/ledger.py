@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+"""
+Work ledgers, which let several coursera-dl processes (possibly on several
+machines) share the download of the same classes without fetching the same
+file twice.
+
+Before downloading a file, download_lectures claims it in the ledger.  A
+claim is a lease: the worker holding it renews it periodically, and if the
+worker dies, the claim expires and the file can be claimed by another one.
+Files are marked as done once they are downloaded, and are never claimed
+again.
+
+The default ledger is an SQLite file, which can be put on a filesystem
+shared by all the machines.  Other backends can be added to LEDGERS, and
+are selected with a scheme://location specification.
+"""
+
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+# Seconds after which the claim of a worker which stopped renewing it expires
+LEASE_SECONDS = 120
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS claims (
+    key TEXT PRIMARY KEY,
+    owner TEXT,
+    done INTEGER,
+    expires REAL
+);
+"""
+
+
+def make_owner():
+    """
+    Return a name for this worker which is unique among all the machines.
+    """
+    return '%s:%d:%s' % (socket.gethostname(), os.getpid(),
+                         uuid.uuid4().hex[:8])
+
+
+class WorkLedger(object):
+    """
+    Base class of the ledgers.
+
+    Subclasses implement claim, renew, finish and release, for the keys of
+    the files to download (their paths relative to the download directory).
+
+    :param lease: Seconds that a claim lasts if it is not renewed.
+    :param owner: Name of this worker; a unique one by default.
+    """
+
+    def __init__(self, lease=LEASE_SECONDS, owner=None):
+        self.lease = lease
+        self.owner = owner or make_owner()
+
+        self._stopped = threading.Event()
+        self._heartbeat = None
+
+    def claim(self, key):
+        """
+        Try to claim the file with the given key.  Returns True if it is now
+        ours to download, and False if it is done or claimed by another
+        worker whose lease did not expire.
+        """
+        raise NotImplementedError("Subclasses should implement this")
+
+    def renew(self):
+        """
+        Extend the lease of all the claims of this worker.
+        """
+        raise NotImplementedError("Subclasses should implement this")
+
+    def finish(self, key):
+        """
+        Mark the file with the given key, claimed by this worker, as done.
+        """
+        raise NotImplementedError("Subclasses should implement this")
+
+    def release(self, key):
+        """
+        Give up the claim of this worker on the file with the given key.
+        """
+        raise NotImplementedError("Subclasses should implement this")
+
+    def start_heartbeat(self):
+        """
+        Renew the claims of this worker in the background, every third of
+        the lease, until the ledger is closed.
+        """
+        if self._heartbeat is not None:
+            return
+
+        def beat():
+            while True:
+                # Event.wait returns None on Python 2.6
+                self._stopped.wait(self.lease / 3.0)
+                if self._stopped.is_set():
+                    break
+                try:
+                    self.renew()
+                except Exception as e:
+                    logging.warn('Could not renew the claims of %s: %s',
+                                 self.owner, e)
+
+        self._heartbeat = threading.Thread(target=beat)
+        self._heartbeat.daemon = True
+        self._heartbeat.start()
+
+    def close(self):
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+
+
+class SQLiteLedger(WorkLedger):
+    """
+    A ledger kept in an SQLite database.
+
+    :param path: Path of the database, which is created if needed.
+    """
+
+    def __init__(self, path, lease=LEASE_SECONDS, owner=None):
+        super(SQLiteLedger, self).__init__(lease, owner)
+
+        self.path = path
+        self._lock = threading.Lock()
+        # we handle the transactions ourselves, to take the write lock of
+        # the database before looking at a claim
+        self._conn = sqlite3.connect(path, timeout=60,
+                                     isolation_level=None,
+                                     check_same_thread=False)
+        with self._lock:
+            self._conn.executescript(_SCHEMA)
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount
+
+    def claim(self, key):
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(
+                    'SELECT owner, done, expires FROM claims WHERE key = ?',
+                    (key,)).fetchone()
+
+                if row is None:
+                    self._conn.execute(
+                        'INSERT INTO claims (key, owner, done, expires)'
+                        ' VALUES (?, ?, 0, ?)',
+                        (key, self.owner, now + self.lease))
+                    claimed = True
+                else:
+                    owner, done, expires = row
+                    claimed = not done and (owner == self.owner or
+                                            expires < now)
+                    if claimed:
+                        if owner != self.owner:
+                            logging.info('Taking over %s from %s, whose'
+                                         ' claim expired.', key, owner)
+                        self._conn.execute(
+                            'UPDATE claims SET owner = ?, expires = ?'
+                            ' WHERE key = ?',
+                            (self.owner, now + self.lease, key))
+                self._conn.execute('COMMIT')
+            except:
+                self._conn.execute('ROLLBACK')
+                raise
+
+        if claimed:
+            self.start_heartbeat()
+        return claimed
+
+    def renew(self):
+        self._execute(
+            'UPDATE claims SET expires = ? WHERE owner = ? AND done = 0',
+            (time.time() + self.lease, self.owner))
+
+    def finish(self, key):
+        self._execute(
+            'UPDATE claims SET done = 1 WHERE key = ? AND owner = ?',
+            (key, self.owner))
+
+    def release(self, key):
+        self._execute(
+            'DELETE FROM claims WHERE key = ? AND owner = ? AND done = 0',
+            (key, self.owner))
+
+    def close(self):
+        super(SQLiteLedger, self).close()
+        with self._lock:
+            self._conn.close()
+
+
+# The backends that can be selected with scheme://location
+LEDGERS = {
+    'sqlite': SQLiteLedger,
+}
+
+
+def open_ledger(spec, lease=LEASE_SECONDS):
+    """
+    Open the ledger given on the command line: either scheme://location,
+    for one of the LEDGERS, or the path of an SQLite ledger.
+    """
+    scheme, sep, location = spec.partition('://')
+    if not sep:
+        scheme, location = 'sqlite', spec
+
+    if scheme not in LEDGERS:
+        raise ValueError('Unknown ledger: %s' % spec)
+
+    return LEDGERS[scheme](location, lease=lease)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""
+The syllabus of a class: its sections, lectures and resources.
+
+They are tuples with empty __slots__, so they take no more memory than the
+plain tuples they replace and can still be unpacked as the (name, lectures)
+and (name, resources) pairs that the rest of the code expects.
+"""
+
+from collections import namedtuple
+
+from six import iteritems
+
+# There are only a handful of formats (mp4, pdf, txt, ...) shared by all the
+# resources of all the classes, so we keep a single copy of each.
+_formats = {}
+
+
+def intern_format(fmt):
+    """
+    Return the canonical copy of the given format string.
+    """
+    return _formats.setdefault(fmt, fmt)
+
+
+class Resource(namedtuple('Resource', 'url title via fallback')):
+    """
+    A downloadable resource of a lecture.
+
+    If via is not None, url is the page where the resource can be found,
+    and it has to be resolved before being downloaded.  If that fails, the
+    page given as fallback (if any) is tried as a hidden video.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, url, title, via=None, fallback=None):
+        return super(Resource, cls).__new__(cls, url, title, via, fallback)
+
+
+class Lecture(namedtuple('Lecture', 'name resources')):
+    """
+    A lecture, with its resources given as a dict mapping each format to
+    the tuple of resources in that format.
+    """
+
+    __slots__ = ()
+
+
+class Section(namedtuple('Section', 'name lectures')):
+    """
+    A section (usually, a week) of a class, with its list of lectures.
+    """
+
+    __slots__ = ()
+
+
+def make_lecture(name, resources):
+    """
+    Build a Lecture from a dict mapping each format to a list of (url,
+    title, via[, fallback]) tuples.
+
+    Only the last resource of each format keeps an empty title (for
+    backward compatibility of the filenames); the others get their index
+    prepended to their title, so that their filenames are unique.
+    """
+    lecture = {}
+    for fmt, found in iteritems(resources):
+        count = len(found)
+        lecture[intern_format(fmt)] = tuple(
+            Resource(r[0], '' if i + 1 == count
+                     else '{0:d}_{1}'.format(i, r[1]), *r[2:])
+            for i, r in enumerate(found))
+
+    return Lecture(name, lecture)
+
+
+def sections_from_json(data):
+    """
+    Rebuild the sections serialized with json.dumps(sections).
+    """
+    return [Section(section_name,
+                    [Lecture(lecture_name,
+                             dict((intern_format(fmt),
+                                   tuple(Resource(*r) for r in resources))
+                                  for fmt, resources in iteritems(lecture)))
+                     for lecture_name, lecture in lectures])
+            for section_name, lectures in data]
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+"""
+A compressed store of the pages fetched from Coursera.
+
+All the pages (syllabi, about pages, lecture pages, ...) of all the classes
+are kept in a single SQLite file, indexed by URL, with their bodies
+compressed.  This takes far less space than one text file per page and
+lets the parsers and the page cache load any page with a single lookup.
+
+Pages are compressed with zstd if the zstandard module is available, and
+with zlib otherwise.
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    class_name TEXT,
+    fetched REAL,
+    etag TEXT,
+    last_modified TEXT,
+    codec TEXT,
+    size INTEGER,
+    body BLOB
+);
+CREATE INDEX IF NOT EXISTS pages_class_name ON pages (class_name);
+"""
+
+_CLASS_NAME_RE = re.compile(
+    r'//class\.coursera\.org/([^/?#]+)|[?&]topic-id=([^&#]+)')
+
+
+def class_name_from_url(url):
+    """
+    Return the name of the class that the given URL belongs to, if any.
+    """
+    m = _CLASS_NAME_RE.search(url)
+    if m:
+        return m.group(1) or m.group(2)
+    return None
+
+
+def _compress(data):
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor().compress(data)
+    return 'zlib', zlib.compress(data, 6)
+
+
+def _decompress(codec, data):
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise IOError('The zstandard module is needed to read this page')
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise IOError('Unknown codec: %s' % codec)
+
+
+class PageStore(object):
+    """
+    Pages stored compressed in an SQLite database.
+
+    :param path: Path of the database, which is created if needed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30,
+                                     check_same_thread=False)
+        with self._lock:
+            self._conn.executescript(_SCHEMA)
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*) FROM pages').fetchone()[0]
+
+    def get_entry(self, url):
+        """
+        Return a (page, validators) tuple for the given url, where
+        validators is a dict holding the 'etag' and/or 'last_modified' of
+        the page.  If the page is not in the store, page is None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT codec, body, etag, last_modified FROM pages'
+                ' WHERE url = ?', (url,)).fetchone()
+
+        if row is None:
+            return None, {}
+
+        codec, body, etag, last_modified = row
+        page = _decompress(codec, bytes(body)).decode('utf-8')
+
+        validators = {}
+        if etag:
+            validators['etag'] = etag
+        if last_modified:
+            validators['last_modified'] = last_modified
+
+        return page, validators
+
+    def get(self, url):
+        """
+        Return the page stored for the given url, or None.
+        """
+        return self.get_entry(url)[0]
+
+    def put(self, url, page, etag=None, last_modified=None,
+            class_name=None):
+        """
+        Store page as the contents of url, replacing any previous copy.
+        """
+        data = page.encode('utf-8')
+        codec, body = _compress(data)
+
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO pages (url, class_name, fetched,'
+                ' etag, last_modified, codec, size, body)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, class_name or class_name_from_url(url), time.time(),
+                 etag, last_modified, codec, len(data),
+                 sqlite3.Binary(body)))
+            self._conn.commit()
+
+        logging.debug('Stored %s (%d bytes, %d compressed)', url, len(data),
+                      len(body))
+
+    def urls(self, class_name=None):
+        """
+        Return the URLs stored, optionally only those of the given class.
+        """
+        with self._lock:
+            if class_name is None:
+                rows = self._conn.execute(
+                    'SELECT url FROM pages ORDER BY url')
+            else:
+                rows = self._conn.execute(
+                    'SELECT url FROM pages WHERE class_name = ?'
+                    ' ORDER BY url', (class_name,))
+            return [row[0] for row in rows]
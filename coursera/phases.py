@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+"""
+Timing of the phases of a run, for --profile.
+
+The wall and CPU time spent in each phase (logging in, validating the
+cookies, fetching and parsing the syllabus, resolving the hidden videos,
+transferring the files and running the hooks) is recorded for each class.
+One of the phases may also be run under cProfile, to see where its time
+goes.
+
+The phases may overlap (e.g., the syllabus is parsed in the background
+while the first files are transferred, and the hooks run while the next
+sections are downloaded), and the CPU time of a phase is that of the whole
+process while it lasts, so the phases do not add up to the whole run.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+PHASES = ('login', 'authenticate', 'validate', 'syllabus', 'parse',
+          'resolve', 'transfer', 'hooks')
+
+
+def cpu_time(children=False):
+    """
+    Return the user and system CPU time of this process, and of its
+    children which ended, if asked.
+    """
+    times = os.times()
+    if children:
+        return sum(times[:4])
+    return times[0] + times[1]
+
+
+class PhaseProfiler(object):
+    """
+    Records the time spent in each phase, by class.
+
+    :param cprofile_phase: Phase to run under cProfile, if any.
+    :param cprofile_path: Where the statistics of cProfile are written.
+    """
+
+    def __init__(self, cprofile_phase=None, cprofile_path=None):
+        self.cprofile_phase = cprofile_phase
+        self.cprofile_path = cprofile_path
+
+        self._lock = threading.Lock()
+        self._cprofile = None
+        self._cprofiled_thread = None
+        self.times = {}  # {class_name: {phase: [wall, cpu, count]}}
+
+    @contextlib.contextmanager
+    def phase(self, name, class_name=None):
+        """
+        Record the time spent in the with block as phase name of class_name.
+        """
+        profiling = self._start_cprofile(name)
+        wall, cpu = time.time(), cpu_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.time() - wall, cpu_time() - cpu
+            if profiling:
+                self._stop_cprofile()
+            self.add(class_name, name, wall, cpu)
+
+    def _start_cprofile(self, name):
+        # cProfile only sees the thread which enables it, so only one thread
+        # at a time is profiled
+        if name != self.cprofile_phase:
+            return False
+
+        with self._lock:
+            if self._cprofiled_thread is not None:
+                return False
+            if self._cprofile is None:
+                import cProfile
+                self._cprofile = cProfile.Profile()
+            self._cprofiled_thread = threading.current_thread()
+
+        self._cprofile.enable()
+        return True
+
+    def _stop_cprofile(self):
+        self._cprofile.disable()
+        with self._lock:
+            self._cprofiled_thread = None
+
+    def add(self, class_name, name, wall, cpu, count=1):
+        with self._lock:
+            phases = self.times.setdefault(class_name, {})
+            totals = phases.setdefault(name, [0.0, 0.0, 0])
+            totals[0] += wall
+            totals[1] += cpu
+            totals[2] += count
+
+    def pop_class(self, class_name):
+        """
+        Return the times of the phases of class_name, as a dict by phase of
+        [wall, cpu, count], and forget them.
+        """
+        with self._lock:
+            return self.times.pop(class_name, {})
+
+    def dump_cprofile(self):
+        """
+        Write the statistics of cProfile, if the phase was run at all.
+        """
+        if self._cprofile is None or not self.cprofile_path:
+            return
+        self._cprofile.dump_stats(self.cprofile_path)
+        logging.info('Wrote the profile of the %s phase to %s',
+                     self.cprofile_phase, self.cprofile_path)
+
+
+class _NoPhase(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+def phase(session, name, class_name=None):
+    """
+    Return a context manager recording the time spent in the with block as
+    phase name of class_name, if the session has a profiler.
+    """
+    profiler = getattr(session, 'profiler', None)
+    if profiler is None:
+        return _NO_PHASE
+    return profiler.phase(name, class_name)
+
+
+def phase_iter(session, name, iterable, class_name=None):
+    """
+    Return an iterator over iterable which records the time taken to get
+    each of its items as phase name of class_name, if the session has a
+    profiler.
+    """
+    profiler = getattr(session, 'profiler', None)
+    if profiler is None:
+        return iter(iterable)
+
+    def timed():
+        it = iter(iterable)
+        while True:
+            with profiler.phase(name, class_name):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            yield item
+
+    return timed()
+
+
+def summarize_phases(times, wall, cpu):
+    """
+    Return the summary of a run which took wall and cpu seconds, given the
+    times of its classes, as returned by PhaseProfiler.pop_class by class.
+    """
+    def entry(wall, cpu, count):
+        return {'wall': wall, 'cpu': cpu, 'count': count}
+
+    overall = {}
+    for phases in times.values():
+        for name, (w, c, n) in phases.items():
+            totals = overall.setdefault(name, [0.0, 0.0, 0])
+            totals[0] += w
+            totals[1] += c
+            totals[2] += n
+
+    return {'wall': wall,
+            'cpu': cpu,
+            'phases': dict((name, entry(*totals))
+                           for name, totals in overall.items()),
+            'classes': dict((class_name or '', dict(
+                (name, entry(*totals)) for name, totals in phases.items()))
+                for class_name, phases in times.items())}
+
+
+def log_phases(summary):
+    """
+    Log a table with the time spent in each phase, overall and by class.
+    """
+    def order(names):
+        known = [name for name in PHASES if name in names]
+        return known + sorted(set(names) - set(known))
+
+    line = '{0:<24}  {1:<12}  {2:>10}  {3:>10}  {4:>6}'
+
+    logging.info('Profile: %.1f seconds, %.1f of CPU', summary['wall'],
+                 summary['cpu'])
+    logging.info(line.format('class', 'phase', 'wall', 'cpu', 'count'))
+
+    rows = [('total', summary['phases'])]
+    rows.extend(sorted(summary['classes'].items()))
+    for class_name, phases in rows:
+        for name in order(phases):
+            t = phases[name]
+            logging.info(line.format(class_name or '-', name,
+                                     '%.3f' % t['wall'], '%.3f' % t['cpu'],
+                                     t['count']))
+
+
+def write_phases(path, summary):
+    """
+    Write the summary of the phases to path as JSON, to compare runs.
+    """
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=4, sort_keys=True)
+    logging.info('Wrote the profile to %s', path)
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+"""
+Planning of downloads: how many bytes the selected resources of a class
+take, and how long it would take to download them.
+
+The sizes are found with HEAD requests, sent concurrently, and kept in a
+cache, so that later runs (and later plans) can use them without asking
+Coursera again.
+"""
+
+import json
+import logging
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+import requests
+
+from .downloaders import format_bytes
+from .utils import parse_size
+
+# How many HEAD requests are sent at the same time
+PLAN_WORKERS = 8
+
+
+def parse_bandwidth(text):
+    """
+    Return the number of bytes per second given by text, e.g. '500K',
+    '2M' or '1.5GB/s' (with 1K = 1024 bytes).
+    """
+    if text.endswith('/s'):
+        text = text[:-2]
+    try:
+        return float(parse_size(text))
+    except ValueError:
+        raise ValueError('Invalid bandwidth: %s' % text)
+
+
+class PlanEntry(namedtuple('PlanEntry', 'section lecture fmt url size')):
+    """
+    A resource selected for download, with its size in bytes (None if it is
+    not known).
+    """
+
+    __slots__ = ()
+
+
+def get_size(session, url):
+    """
+    Return the size of the resource at url, as given by a HEAD request, or
+    None if it cannot be found.
+    """
+    try:
+        r = session.head(url, allow_redirects=True)
+        r.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logging.debug('Cannot get the size of %s: %s', url, e)
+        return None
+
+    size = r.headers.get('content-length')
+    try:
+        return int(size)
+    except (TypeError, ValueError):
+        return None
+
+
+def plan_resources(session, sections, filters, resolve, sizes,
+                   workers=PLAN_WORKERS):
+    """
+    Return the PlanEntry of every resource of the sections selected by the
+    given ResourceFilter.
+
+    resolve(session, url, via, fallback) finds the resources which have to
+    be resolved.  sizes is the cache of the known sizes, by url, which is
+    updated with the sizes found.
+    """
+    selected = []
+    for section, lectures in sections:
+        if not filters.section(section):
+            continue
+        for lecture, resources in lectures:
+            if not filters.lecture(lecture):
+                continue
+            for fmt, resource in filters.resources(resources):
+                selected.append((section, lecture, fmt, resource))
+
+    def measure(item):
+        resource = item[3]
+        if resource.url in sizes:
+            return sizes[resource.url]
+
+        url = resource.url
+        if resource.via:
+            url = resolve(session, url, resource.via, resource.fallback)
+            if url is None:
+                return None
+        return get_size(session, url)
+
+    pool = ThreadPool(max(1, min(workers, len(selected))))
+    try:
+        found = pool.map(measure, selected)
+    finally:
+        pool.close()
+        pool.join()
+
+    entries = []
+    for (section, lecture, fmt, resource), size in zip(selected, found):
+        if size is not None:
+            sizes[resource.url] = size
+        entries.append(PlanEntry(section, lecture, fmt, resource.url, size))
+
+    return entries
+
+
+def summarize(entries):
+    """
+    Return the totals of the entries of a class, as a dict holding the
+    number of 'files', their 'bytes' and how many have an 'unknown' size,
+    overall and by 'sections' and 'formats'.
+    """
+    def total():
+        return {'files': 0, 'bytes': 0, 'unknown': 0}
+
+    def add(totals, entry):
+        totals['files'] += 1
+        if entry.size is None:
+            totals['unknown'] += 1
+        else:
+            totals['bytes'] += entry.size
+
+    summary = total()
+    summary['sections'] = []
+    summary['formats'] = {}
+
+    sections = {}
+    for entry in entries:
+        add(summary, entry)
+
+        if entry.section not in sections:
+            sections[entry.section] = total()
+            sections[entry.section]['name'] = entry.section
+            summary['sections'].append(sections[entry.section])
+        add(sections[entry.section], entry)
+
+        add(summary['formats'].setdefault(entry.fmt, total()), entry)
+
+    return summary
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return '%d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60,
+                             seconds % 60)
+
+
+def log_plan(class_name, summary, bandwidth):
+    """
+    Log the totals of the plan of a class, and the time that it would take
+    to download it at bandwidth bytes per second.
+    """
+    def describe(totals):
+        text = '%d file(s), %s' % (totals['files'],
+                                   format_bytes(totals['bytes']))
+        if totals['unknown']:
+            text += ' (%d of unknown size)' % totals['unknown']
+        return text
+
+    logging.info('Plan for %s: %s, about %s at %s/s', class_name,
+                 describe(summary),
+                 format_duration(summary['bytes'] / bandwidth),
+                 format_bytes(bandwidth))
+    for section in summary['sections']:
+        logging.info('  %s: %s', section['name'], describe(section))
+    for fmt in sorted(summary['formats']):
+        logging.info('  [%s]: %s', fmt, describe(summary['formats'][fmt]))
+
+
+def write_plan(path, plans, bandwidth):
+    """
+    Write the summaries of the plans of several classes, given as a dict
+    by class name, to path as JSON.
+    """
+    total = sum(plan['bytes'] for plan in plans.values())
+    data = {'bandwidth': bandwidth,
+            'bytes': total,
+            'seconds': total / bandwidth,
+            'classes': plans}
+
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=4, sort_keys=True)
+    logging.info('Wrote the plan to %s', path)
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the caches kept under PATH_CACHE.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from coursera import cache, coursera_dl
+
+SECTIONS = [
+    ('01_Week_1', [
+        ('Introduction', {
+            'mp4': (('http://example.com/intro.mp4', '', None, None),
+                    ('http://example.com/preview_view?lecture_id=1', '',
+                     'preview', 'http://example.com/view?lecture_id=1')),
+            'pdf': (('http://example.com/intro.pdf', '0_slides', None, None),
+                    ('http://example.com/notes.pdf', '', None, None))}),
+        ('Hidden', {})]),
+    ('02_Week_2', []),
+]
+
+
+def save_validations(args):
+    """
+    Save validations one at a time, in a separate process.
+    """
+    fn, user = args
+    for i in range(20):
+        cache.save_validations({'%s/class-%d' % (user, i): time.time() + 60},
+                               fn)
+
+
+class SyllabusCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_key_depends_on_page_and_options(self):
+        key = cache.syllabus_cache_key('<html></html>')
+
+        self.assertEqual(key, cache.syllabus_cache_key(u'<html></html>'))
+        self.assertNotEqual(key, cache.syllabus_cache_key('<html> </html>'))
+        self.assertNotEqual(
+            key, cache.syllabus_cache_key('<html></html>', reverse=True))
+        self.assertNotEqual(
+            key, cache.syllabus_cache_key('<html></html>', intact_fnames=True))
+
+    def test_roundtrip(self):
+        cache.save_syllabus('class-001', 'key', SECTIONS, path=self.path)
+        sections = cache.load_syllabus('class-001', 'key', path=self.path)
+
+        self.assertEqual(sections, SECTIONS)
+
+    def test_stale_key(self):
+        cache.save_syllabus('class-001', 'key', SECTIONS, path=self.path)
+
+        self.assertTrue(
+            cache.load_syllabus('class-001', 'other', path=self.path) is None)
+
+    def test_missing_entry(self):
+        self.assertTrue(
+            cache.load_syllabus('class-001', 'key', path=self.path) is None)
+
+    def test_corrupted_entry(self):
+        fn = cache.get_syllabus_cache_path('class-001', path=self.path)
+        with open(fn, 'wb') as f:
+            f.write(b'garbage')
+
+        self.assertTrue(
+            cache.load_syllabus('class-001', 'key', path=self.path) is None)
+        self.assertTrue(os.path.exists(fn))
+
+
+class SizesCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.fn = os.path.join(self.path, 'sizes.json.z')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_sizes_are_merged(self):
+        self.assertEqual(cache.load_sizes(self.fn), {})
+
+        cache.save_sizes({'http://a/1': 1, 'http://a/2': 2}, self.fn)
+        cache.save_sizes({'http://a/2': 3}, self.fn)
+
+        self.assertEqual(cache.load_sizes(self.fn),
+                         {'http://a/1': 1, 'http://a/2': 3})
+
+
+class ValidationsCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.fn = os.path.join(self.path, 'validations.json.z')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_expired_validations_are_dropped(self):
+        cache.save_validations({'u/a': time.time() + 60, 'u/b': 1}, self.fn)
+
+        self.assertEqual(list(cache.load_validations(self.fn)), ['u/a'])
+
+    def test_processes_do_not_lose_updates(self):
+        pool = multiprocessing.Pool(4)
+        try:
+            pool.map(save_validations,
+                     [(self.fn, 'user%d' % i) for i in range(4)])
+        finally:
+            pool.close()
+            pool.join()
+
+        self.assertEqual(len(cache.load_validations(self.fn)), 80)
+        self.assertEqual(sorted(os.listdir(self.path)),
+                         ['validations.json.z', 'validations.json.z.lock'])
+
+
+class MockResponse(object):
+    def __init__(self, status_code, text='', headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        pass
+
+
+class MockSession(object):
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def get(self, url, headers=None):
+        self.requests.append((url, headers))
+        return self.responses.pop(0)
+
+
+class PageCacheTestCase(unittest.TestCase):
+
+    URL = 'https://class.coursera.org/class-001/lecture/index'
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+        self.__load_page = coursera_dl.load_page
+        self.__save_page = coursera_dl.save_page
+        coursera_dl.load_page = \
+            lambda url: cache.load_page(url, path=self.path)
+        coursera_dl.save_page = \
+            lambda url, page, **kwargs: cache.save_page(
+                url, page, path=self.path, **kwargs)
+
+    def tearDown(self):
+        coursera_dl.load_page = self.__load_page
+        coursera_dl.save_page = self.__save_page
+        shutil.rmtree(self.path)
+
+    def test_roundtrip(self):
+        cache.save_page(self.URL, u'<html>é</html>', etag='"abc"',
+                        path=self.path)
+
+        page, validators = cache.load_page(self.URL, path=self.path)
+        self.assertEqual(page, u'<html>é</html>')
+        self.assertEqual(validators, {'etag': '"abc"'})
+
+    def test_pages_without_validators_are_not_cached(self):
+        cache.save_page(self.URL, '<html></html>', path=self.path)
+
+        page, validators = cache.load_page(self.URL, path=self.path)
+        self.assertTrue(page is None)
+
+    def test_not_modified_page_is_served_from_cache(self):
+        headers = {'ETag': '"abc"',
+                   'Last-Modified': 'Tue, 10 Dec 2013 10:00:00 GMT'}
+        session = MockSession([MockResponse(200, '<html></html>', headers),
+                               MockResponse(304)])
+
+        first = coursera_dl.get_page_cached(session, self.URL)
+        second = coursera_dl.get_page_cached(session, self.URL)
+
+        self.assertEqual(first, '<html></html>')
+        self.assertEqual(second, '<html></html>')
+        self.assertEqual(session.requests[0][1], {})
+        self.assertEqual(session.requests[1][1], {
+            'If-None-Match': '"abc"',
+            'If-Modified-Since': 'Tue, 10 Dec 2013 10:00:00 GMT'})
+
+    def test_modified_page_replaces_cached_copy(self):
+        session = MockSession([
+            MockResponse(200, 'old', {'ETag': '"1"'}),
+            MockResponse(200, 'new', {'ETag': '"2"'}),
+            MockResponse(304)])
+
+        coursera_dl.get_page_cached(session, self.URL)
+        coursera_dl.get_page_cached(session, self.URL)
+
+        self.assertEqual(coursera_dl.get_page_cached(session, self.URL),
+                         'new')
+        self.assertEqual(session.requests[2][1], {'If-None-Match': '"2"'})
+
+
+class LocalPageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_local_page_roundtrip(self):
+        local_page = os.path.join(self.path, 'listing.html')
+        session = MockSession([MockResponse(200, u'<html>é</html>')])
+
+        downloaded = coursera_dl.get_syllabus(session, 'class-001',
+                                              local_page=local_page)
+        read = coursera_dl.get_syllabus(session, 'class-001',
+                                        local_page=local_page)
+
+        self.assertEqual(downloaded, u'<html>é</html>')
+        self.assertEqual(read, u'<html>é</html>')
+        self.assertEqual(len(session.requests), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,9 +5,15 @@
 Test syllabus parsing.
 """
 
+import multiprocessing
 import os.path
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 
+import requests
 import six
 
 from coursera import cookies
@@ -107,3 +113,523 @@ class CookiesFileTestCase(unittest.TestCase):
         values = 'csrf_token=csrfclass001; session=sessionclass1'
         cookie_values = cookies.make_cookie_values(cj, 'class-001')
         self.assertEquals(cookie_values, values)
+
+
+class CookiesIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write_cookies(self, lines):
+        fn = os.path.join(self.path, 'cookies.txt')
+        with open(fn, 'w') as f:
+            f.write('\n'.join('\t'.join(line) for line in lines) + '\n')
+        return fn
+
+    def test_only_coursera_cookies_are_indexed(self):
+        index = cookies.CookiesIndex(FIREFOX_COOKIES)
+
+        self.assertEqual(len(index.find('.coursera.org')), 4)
+        self.assertEqual(len(index.find('class.coursera.org')), 5)
+        self.assertEqual(index.find('www.coursera.org'), [])
+        self.assertEqual(
+            sorted(c.name for c in
+                   index.find('class.coursera.org', '/class-001')),
+            ['csrf_token', 'session'])
+
+    def test_index_is_built_once(self):
+        first = cookies.get_cookies_index(FIREFOX_COOKIES)
+        second = cookies.get_cookies_index(FIREFOX_COOKIES)
+
+        self.assertTrue(first is second)
+
+    def test_http_only_and_session_cookies(self):
+        fn = self.write_cookies([
+            ('#HttpOnly_.coursera.org', 'TRUE', '/', 'TRUE', '2381580073',
+             'CAUTH', 'fake'),
+            ('class.coursera.org', 'FALSE', '/class-001', 'FALSE', '',
+             'session', 'gone-at-exit'),
+            ('example.com', 'FALSE', '/', 'FALSE', '2381580073', 'a', 'b'),
+            ('not a cookie',),
+        ])
+
+        cj = cookies.find_cookies_for_class(fn, 'class-001')
+
+        self.assertEqual([c.name for c in cj], ['CAUTH'])
+
+
+class StatusResponse(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def make_class_cookies(class_name):
+    cj = requests.cookies.RequestsCookieJar()
+    cj.set('CAUTH', 'cauth', domain='.coursera.org', path='/')
+    cj.set('csrf_token', 'csrf', domain='class.coursera.org',
+           path='/' + class_name)
+    cj.set('session', 'session', domain='class.coursera.org',
+           path='/' + class_name)
+    return cj
+
+
+class SharedSession(object):
+    """
+    A session reused for several classes, whose class pages answer with
+    the given status code.
+    """
+    def __init__(self, status_code=200):
+        self.cookies = requests.cookies.RequestsCookieJar()
+        self.status_code = status_code
+
+        self.hooks = {'response': []}
+        self.heads = 0
+
+    def head(self, url, allow_redirects=True):
+        self.heads += 1
+        return StatusResponse(self.status_code)
+
+
+class SharedSessionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.__get_cookies_from_cache = cookies.get_cookies_from_cache
+        self.__load_validations = cookies.load_validations
+        self.__save_validations = cookies.save_validations
+        self.loads = 0
+        self.saved = {}
+
+        def get_cookies_from_cache(username):
+            self.loads += 1
+            return make_class_cookies('class-001')
+
+        cookies.get_cookies_from_cache = get_cookies_from_cache
+        cookies.load_validations = lambda: dict(self.saved)
+        cookies.save_validations = self.saved.update
+
+    def tearDown(self):
+        cookies.get_cookies_from_cache = self.__get_cookies_from_cache
+        cookies.load_validations = self.__load_validations
+        cookies.save_validations = self.__save_validations
+
+    def test_cookies_cache_is_loaded_once(self):
+        session = SharedSession()
+
+        cookies.get_cookies_for_class(session, 'class-001', username='u')
+        cookies.get_cookies_for_class(session, 'class-001', username='u')
+
+        self.assertEqual(self.loads, 1)
+
+    def test_stale_class_keeps_the_login_of_this_run(self):
+        session = SharedSession(302)
+        session.cookies.update(make_class_cookies('class-001'))
+        session.logged_in = True
+
+        self.assertFalse(cookies.validate_cookies(session, 'class-001'))
+
+        self.assertFalse(
+            cookies.do_we_have_enough_cookies(session.cookies, 'class-001'))
+        self.assertTrue('.coursera.org' in session.cookies.list_domains())
+
+    def test_stale_class_clears_a_cached_login(self):
+        session = SharedSession(302)
+        session.cookies.update(make_class_cookies('class-001'))
+
+        self.assertFalse(cookies.validate_cookies(session, 'class-001'))
+
+        self.assertEqual(session.cookies.list_domains(), [])
+
+    def test_validated_cookies_are_trusted_for_a_while(self):
+        session = SharedSession()
+        session.cookies.update(make_class_cookies('class-001'))
+
+        self.assertTrue(cookies.validate_cookies(session, 'class-001', 'u'))
+        self.assertTrue(cookies.validate_cookies(session, 'class-001', 'u'))
+        self.assertEqual(session.heads, 1)
+
+        # as well as by the next runs
+        session = SharedSession()
+        session.cookies.update(make_class_cookies('class-001'))
+
+        self.assertTrue(cookies.validate_cookies(session, 'class-001', 'u'))
+        self.assertEqual(session.heads, 0)
+
+    def test_validations_which_cannot_be_saved_are_kept(self):
+        def save_validations(validations):
+            raise OSError('read-only filesystem')
+
+        cookies.save_validations = save_validations
+        session = SharedSession()
+        session.cookies.update(make_class_cookies('class-001'))
+
+        self.assertTrue(cookies.validate_cookies(session, 'class-001', 'u'))
+        self.assertTrue(cookies.validate_cookies(session, 'class-001', 'u'))
+        self.assertEqual(session.heads, 1)
+
+    def test_validation_expires_with_the_cookies(self):
+        session = SharedSession()
+        session.cookies.update(make_class_cookies('class-001'))
+        expires = int(time.time()) + 60
+        session.cookies.set('session', 'session', domain='class.coursera.org',
+                            path='/class-001', expires=expires)
+
+        cookies.validate_cookies(session, 'class-001', 'u')
+
+        self.assertEqual(self.saved['u/class-001'], expires)
+
+    def test_stale_cookies_are_validated_again(self):
+        session = SharedSession()
+        session.cookies.update(make_class_cookies('class-001'))
+        cookies.validate_cookies(session, 'class-001', 'u')
+
+        session.status_code = 302
+        session.validations['u/class-001'] = time.time() - 1  # expired
+        self.assertFalse(cookies.validate_cookies(session, 'class-001', 'u'))
+        self.assertEqual(self.saved['u/class-001'], 0)
+
+        session.status_code = 200
+        session.cookies.update(make_class_cookies('class-001'))
+        self.assertTrue(cookies.validate_cookies(session, 'class-001', 'u'))
+        self.assertEqual(session.heads, 3)
+
+
+class BulkAuthenticationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.patched = {}
+        self.logins = 0
+        self.writes = 0
+        self.handshakes = []
+        self.saved = {}
+
+        def login(session, class_name, username, password):
+            self.logins += 1
+            session.cookies.set('CAUTH', 'cauth', domain='.coursera.org',
+                                path='/')
+
+        def down_the_wabbit_hole(session, class_name):
+            self.handshakes.append(class_name)
+            time.sleep(0.2)
+            if class_name != 'class-bad':
+                session.cookies.update(make_class_cookies(class_name))
+
+        def write_cookies_to_cache(cj, username):
+            self.writes += 1
+
+        self.patch('get_cookies_from_cache',
+                   lambda username: requests.cookies.RequestsCookieJar())
+        self.patch('load_validations', lambda: dict(self.saved))
+        self.patch('save_validations', self.saved.update)
+        self.patch('login', login)
+        self.patch('down_the_wabbit_hole', down_the_wabbit_hole)
+        self.patch('write_cookies_to_cache', write_cookies_to_cache)
+
+    def tearDown(self):
+        for name, func in self.patched.items():
+            setattr(cookies, name, func)
+
+    def patch(self, name, func):
+        self.patched.setdefault(name, getattr(cookies, name))
+        setattr(cookies, name, func)
+
+    def test_classes_are_authenticated_concurrently(self):
+        class_names = ['class-%03d' % i for i in range(8)] + ['class-bad']
+        session = SharedSession(302)
+
+        start = time.time()
+        errors = cookies.get_cookies_for_classes(session, class_names,
+                                                 'u', 'p')
+
+        self.assertTrue(time.time() - start < 0.2 * len(class_names))
+        self.assertEqual(sorted(self.handshakes), sorted(class_names))
+        self.assertEqual(self.logins, 1)
+        self.assertEqual(self.writes, 1)
+        self.assertEqual(list(errors), ['class-bad'])
+        self.assertEqual(sorted(self.saved),
+                         ['u/' + c for c in class_names[:-1]])
+        for class_name in class_names[:-1]:
+            self.assertTrue(cookies.do_we_have_enough_cookies(
+                session.cookies, class_name))
+
+    def test_validated_classes_are_left_alone(self):
+        session = SharedSession(302)
+        cookies.get_cookies_for_classes(session, ['class-001'], 'u', 'p')
+        self.handshakes = []
+
+        errors = cookies.get_cookies_for_classes(
+            SharedSession(302), ['class-001'], 'u', 'p')
+
+        self.assertEqual(errors, {})
+        self.assertEqual(self.handshakes, [])
+        self.assertEqual(self.writes, 1)
+
+    def test_valid_cookies_need_no_handshake(self):
+        session = SharedSession(200)
+        self.patch('get_cookies_from_cache',
+                   lambda username: make_class_cookies('class-001'))
+
+        cookies.get_cookies_for_classes(session, ['class-001'], 'u', 'p')
+
+        self.assertEqual(self.handshakes, [])
+        self.assertEqual(self.logins, 0)
+        self.assertEqual(self.writes, 0)
+        self.assertEqual(list(self.saved), ['u/class-001'])
+
+
+def write_class_cookies(args):
+    """
+    Write the cookies of a class to the cache many times, in a separate
+    process.
+    """
+    path, class_name = args
+    cookies.PATH_COOKIES = path
+    for _ in range(20):
+        cookies.write_cookies_to_cache(make_cached_cookies(class_name), 'u')
+
+
+def make_cached_cookies(class_name):
+    # the cache keeps only the cookies which are not session cookies
+    cj = requests.cookies.RequestsCookieJar()
+    for c in make_class_cookies(class_name):
+        c.expires = int(time.time()) + 3600
+        c.discard = False
+        cj.set_cookie(c)
+    return cj
+
+
+class CookiesCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.__path_cookies = cookies.PATH_COOKIES
+        self.__get_authentication_cookies = \
+            cookies.get_authentication_cookies
+        self.__save_validations = cookies.save_validations
+        cookies.PATH_COOKIES = self.path
+        cookies.save_validations = lambda validations: None
+        self.logins = 0
+
+        def get_authentication_cookies(session, class_name, username,
+                                       password):
+            self.logins += 1
+            session.cookies.update(make_cached_cookies(class_name))
+
+        cookies.get_authentication_cookies = get_authentication_cookies
+
+    def tearDown(self):
+        cookies.PATH_COOKIES = self.__path_cookies
+        cookies.get_authentication_cookies = \
+            self.__get_authentication_cookies
+        cookies.save_validations = self.__save_validations
+        shutil.rmtree(self.path)
+
+    def test_writes_are_merged(self):
+        cookies.write_cookies_to_cache(make_cached_cookies('class-001'), 'u')
+        cookies.write_cookies_to_cache(make_cached_cookies('class-002'), 'u')
+
+        cj = cookies.get_cookies_from_cache('u')
+        for class_name in ('class-001', 'class-002'):
+            self.assertTrue(
+                cookies.do_we_have_enough_cookies(cj, class_name))
+        self.assertEqual(sorted(os.listdir(self.path)),
+                         ['u.txt', 'u.txt.lock'])
+
+    def test_processes_write_at_the_same_time(self):
+        class_names = ['class-%03d' % i for i in range(4)]
+
+        pool = multiprocessing.Pool(4)
+        try:
+            pool.map(write_class_cookies,
+                     [(self.path, class_name) for class_name in class_names])
+        finally:
+            pool.close()
+            pool.join()
+
+        cj = cookies.get_cookies_from_cache('u')
+        self.assertEqual(len(cj), 1 + 2 * len(class_names))
+
+    def test_processes_share_one_login(self):
+        first, second = SharedSession(), SharedSession()
+        # the second session loaded the cache before the first one wrote it
+        cookies.get_cookies_for_class(second, 'class-002', username='u')
+        self.assertEqual(self.logins, 1)
+
+        cookies.get_cookies_for_class(first, 'class-001', username='u')
+        self.assertEqual(self.logins, 2)
+        second.cookies.clear()
+
+        cookies.get_cookies_for_class(second, 'class-001', username='u')
+
+        self.assertEqual(self.logins, 2)
+        self.assertTrue(
+            cookies.do_we_have_enough_cookies(second.cookies, 'class-001'))
+
+
+class RefusingAdapter(requests.adapters.BaseAdapter):
+    """
+    Answers 403 to the requests which do not carry the given cookie.
+    """
+    def __init__(self, cookie):
+        super(RefusingAdapter, self).__init__()
+        self.cookie = cookie
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        r = requests.models.Response()
+        r.status_code = 200
+        if self.cookie not in request.headers.get('Cookie', ''):
+            r.status_code = 403
+        r.url = request.url
+        r.request = request
+        r.raw = six.BytesIO(b'')
+        return r
+
+    def close(self):
+        pass
+
+
+class ReauthenticationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.__get_authentication_cookies = \
+            cookies.get_authentication_cookies
+        self.__write_cookies_to_cache = cookies.write_cookies_to_cache
+        self.__save_validations = cookies.save_validations
+        self.logins = []
+
+        def get_authentication_cookies(session, class_name, username,
+                                       password):
+            self.logins.append(class_name)
+            session.cookies.set('session', 'fresh',
+                                domain='class.coursera.org',
+                                path='/' + class_name)
+
+        cookies.get_authentication_cookies = get_authentication_cookies
+        cookies.write_cookies_to_cache = lambda cj, username: None
+        cookies.save_validations = lambda validations: None
+
+        self.session = requests.Session()
+        self.session.validations = {'u/class-001': time.time() + 60}
+        self.adapter = RefusingAdapter('session=fresh')
+        self.session.mount('https://', self.adapter)
+        cookies.reauthenticate_on_refusal(self.session, 'u', 'p')
+
+    def tearDown(self):
+        cookies.get_authentication_cookies = \
+            self.__get_authentication_cookies
+        cookies.write_cookies_to_cache = self.__write_cookies_to_cache
+        cookies.save_validations = self.__save_validations
+
+    def test_refused_requests_are_authenticated_again(self):
+        r = self.session.get('https://class.coursera.org/class-001/lecture')
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(self.logins, ['class-001'])
+        self.assertEqual(len(self.adapter.requests), 2)
+        self.assertEqual(self.session.validations['u/class-001'], 0)
+        self.assertEqual(self.session.cookie_values, 'session=fresh')
+
+    def test_requests_are_sent_again_only_once(self):
+        self.adapter.cookie = 'never'
+
+        r = self.session.get('https://class.coursera.org/class-001/lecture')
+
+        self.assertEqual(r.status_code, 403)
+        self.assertEqual(len(self.adapter.requests), 2)
+
+    def test_other_sites_are_left_alone(self):
+        r = self.session.get('https://www.coursera.org/about')
+
+        self.assertEqual(r.status_code, 403)
+        self.assertEqual(self.logins, [])
+
+
+class RedirectorAdapter(requests.adapters.BaseAdapter):
+    """
+    Refuses the given number of requests to the auth redirector, then
+    answers them with the cookies of the class.
+    """
+    def __init__(self, session, refusals):
+        super(RedirectorAdapter, self).__init__()
+        self.session = session
+        self.refusals = refusals
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request.url)
+        r = requests.models.Response()
+        r.status_code = 200
+        if self.refusals:
+            self.refusals -= 1
+            r.status_code = 403
+        else:
+            self.session.cookies.set('csrf_token', 'fresh',
+                                     domain='class.coursera.org',
+                                     path='/class-001')
+        r.url = request.url
+        r.request = request
+        r.raw = six.BytesIO(b'')
+        return r
+
+    def close(self):
+        pass
+
+
+class AuthenticationUnderLockTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.__path_cookies = cookies.PATH_COOKIES
+        self.__save_validations = cookies.save_validations
+        cookies.PATH_COOKIES = self.path
+        cookies.save_validations = lambda validations: None
+
+        self.session = requests.Session()
+        # logged in, but not yet authenticated on the class
+        self.session.cookies.set('CAUTH', 'x', domain='.coursera.org')
+
+    def tearDown(self):
+        cookies.PATH_COOKIES = self.__path_cookies
+        cookies.save_validations = self.__save_validations
+        shutil.rmtree(self.path)
+
+    def authenticate(self, refusals):
+        """
+        Run get_cookies_for_class in a thread, and return what it raised,
+        or None, and whether it was over in time.
+        """
+        adapter = RedirectorAdapter(self.session, refusals)
+        self.session.mount('https://', adapter)
+        outcome = []
+
+        def run():
+            try:
+                cookies.get_cookies_for_class(self.session, 'class-001',
+                                              username='u', password='p')
+                outcome.append(None)
+            except BaseException as e:
+                outcome.append(e)
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        thread.join(5)
+        return outcome, adapter.requests
+
+    def test_refusal_while_holding_the_lock(self):
+        outcome, sent = self.authenticate(refusals=1)
+
+        # the response hook did not take the lock of the cache again
+        self.assertEqual(len(outcome), 1)
+        self.assertTrue(isinstance(outcome[0], cookies.AuthenticationFailed))
+        self.assertEqual(len(sent), 1)
+        self.assertFalse(getattr(self.session, 'reauthenticating', False))
+
+        # which is still taken by the next attempts
+        outcome, sent = self.authenticate(refusals=0)
+        self.assertEqual(outcome, [None])
+        self.assertTrue(os.path.exists(os.path.join(self.path, 'u.txt')))
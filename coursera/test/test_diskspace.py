@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the admission control of the downloads by disk space.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from coursera import coursera_dl, diskspace
+from coursera.model import Section, make_lecture
+
+
+class MockDownloader(object):
+    session = None
+
+    def __init__(self):
+        self.downloaded = []
+
+    def download(self, url, filename):
+        self.downloaded.append(url)
+
+
+def admit_in_process(registry, filename):
+    """
+    Hold the space of a transfer, and exit without releasing it.
+    """
+    diskspace.free_space = lambda path: 1000
+    assert diskspace.DiskSpace(registry=registry).admit(filename, 600)
+
+
+class DiskSpaceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.free = 1000
+
+        self.__free_space = diskspace.free_space
+        diskspace.free_space = lambda path: self.free
+
+    def tearDown(self):
+        diskspace.free_space = self.__free_space
+        shutil.rmtree(self.path)
+
+    def fn(self, name):
+        return os.path.join(self.path, name)
+
+    def test_free_space(self):
+        self.assertTrue(self.__free_space(self.fn('a/b/c')) > 0)
+
+    def test_reserve_is_kept(self):
+        disk_space = diskspace.DiskSpace(reserve=100)
+
+        self.assertFalse(disk_space.admit(self.fn('a'), 901))
+        self.assertTrue(disk_space.admit(self.fn('b'), 900))
+        self.assertEqual(disk_space.skipped, [(self.fn('a'), 901, 900)])
+
+    def test_transfers_in_flight_hold_their_space(self):
+        disk_space = diskspace.DiskSpace()
+
+        self.assertTrue(disk_space.admit(self.fn('a'), 600))
+        self.assertFalse(disk_space.admit(self.fn('b'), 600))
+
+        # a has written 400 bytes, which are not free anymore
+        with open(self.fn('a'), 'wb') as f:
+            f.write(b'x' * 400)
+        self.free = 600
+        self.assertFalse(disk_space.admit(self.fn('b'), 500))
+        self.assertTrue(disk_space.admit(self.fn('b'), 400))
+
+        disk_space.release(self.fn('a'))
+        disk_space.release(self.fn('b'))
+        self.assertTrue(disk_space.admit(self.fn('c'), 600))
+
+    def test_unknown_sizes(self):
+        disk_space = diskspace.DiskSpace(reserve=1000)
+
+        self.assertTrue(disk_space.admit(self.fn('a'), None))
+        self.assertFalse(diskspace.DiskSpace(reserve=1001).admit(
+            self.fn('a'), None))
+
+    def test_size_of(self):
+        disk_space = diskspace.DiskSpace(sizes={'http://a/page': 5})
+
+        self.assertEqual(disk_space.size_of('http://a/page', 'http://a/v'), 5)
+        self.assertEqual(disk_space.size_of('http://a/other', 'http://a/v'),
+                         None)
+
+    def test_sizes_are_only_asked_for_when_space_runs_low(self):
+        heads = []
+
+        def get_size(url):
+            heads.append(url)
+            return 700
+
+        disk_space = diskspace.DiskSpace(get_size=get_size)
+
+        self.free = diskspace.LOW_SPACE + 1000
+        self.assertTrue(disk_space.admit(self.fn('a'), None, 'http://a/a'))
+        self.assertEqual(heads, [])
+        disk_space.release(self.fn('a'))
+
+        self.free = 1000
+        self.assertTrue(disk_space.admit(self.fn('b'), None, 'http://a/b'))
+        self.assertFalse(disk_space.admit(self.fn('c'), None, 'http://a/c'))
+        self.assertEqual(heads, ['http://a/b', 'http://a/c'])
+        self.assertEqual(disk_space.size_of('http://a/c'), 700)
+
+        # nor when the free space cannot be told
+        self.free = None
+        self.assertTrue(disk_space.admit(self.fn('d'), None, 'http://a/d'))
+        self.assertEqual(len(heads), 2)
+
+    def test_processes_share_the_registry(self):
+        registry = self.fn('reservations.json')
+        a = diskspace.DiskSpace(registry=registry)
+        b = diskspace.DiskSpace(registry=registry)
+
+        self.assertTrue(a.admit(self.fn('a'), 600))
+        self.assertFalse(b.admit(self.fn('b'), 600))
+        a.release(self.fn('a'))
+        self.assertTrue(b.admit(self.fn('b'), 600))
+
+    def test_transfers_of_dead_processes_are_forgotten(self):
+        registry = self.fn('reservations.json')
+        p = multiprocessing.Process(target=admit_in_process,
+                                    args=(registry, self.fn('a')))
+        p.start()
+        p.join()
+
+        self.assertEqual(p.exitcode, 0)
+        self.assertTrue(diskspace.DiskSpace(registry=registry).admit(
+            self.fn('b'), 600))
+
+    def test_download_lectures_skips_what_does_not_fit(self):
+        sections = [Section('Week_1', [make_lecture('Intro', {
+            'mp4': [('http://a/1.mp4', '', None)],
+            'pdf': [('http://a/1.pdf', '', None)]})])]
+        disk_space = diskspace.DiskSpace(
+            sizes={'http://a/1.mp4': 5000, 'http://a/1.pdf': 50})
+
+        downloader = MockDownloader()
+        coursera_dl.download_lectures(
+            downloader, 'class-001', sections, ['all'], path=self.path,
+            disk_space=disk_space)
+
+        self.assertEqual(downloader.downloaded, ['http://a/1.pdf'])
+        self.assertEqual(len(disk_space.skipped), 1)
+        disk_space.log_shortfall('class-001')
+
+
+if __name__ == "__main__":
+    unittest.main()
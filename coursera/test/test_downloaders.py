@@ -158,6 +158,32 @@ class NativeDownloaderTestCase(unittest.TestCase):
         time.sleep = _sleep
 
 
+class DownloadCountTestCase(unittest.TestCase):
+
+    def test_files_and_bytes_are_counted(self):
+        import os
+        import shutil
+        import tempfile
+
+        class FileDownloader(downloaders.Downloader):
+            def _start_download(self, url, filename):
+                if url != 'missing':
+                    with open(filename, 'w') as f:
+                        f.write(url)
+
+        path = tempfile.mkdtemp()
+        try:
+            d = FileDownloader()
+            d.download('abc', os.path.join(path, 'a'))
+            d.download('de', os.path.join(path, 'b'))
+            d.download('missing', os.path.join(path, 'c'))
+        finally:
+            shutil.rmtree(path)
+
+        self.assertEquals(d.files, 2)
+        self.assertEquals(d.bytes, 5)
+
+
 class DownloadProgressTestCase(unittest.TestCase):
 
     def _get_progress(self, total):
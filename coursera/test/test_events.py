@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the stream of events of a run.
+"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import six
+
+from coursera import coursera_dl, downloaders, events, hooks
+from coursera.model import Section, make_lecture
+
+
+def emit_many(path):
+    """
+    Emit many events to the stream at path, in a separate process.
+    """
+    stream = events.open_events(path)
+    try:
+        for i in range(200):
+            stream.emit('page', url='http://a/%d' % i, padding='x' * 200)
+    finally:
+        stream.close()
+
+
+class EventSession(object):
+
+    def __init__(self, stream):
+        self.events = stream
+
+
+class FileDownloader(downloaders.Downloader):
+
+    def __init__(self, session, fail=False):
+        self.session = session
+        self.fail = fail
+
+    def _start_download(self, url, filename):
+        if self.fail:
+            return False
+        with open(filename, 'w') as f:
+            f.write('x' * 100)
+
+
+class EventsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.fn = os.path.join(self.path, 'events.jsonl')
+        self.stream = events.open_events(self.fn)
+        self.session = EventSession(self.stream)
+
+    def tearDown(self):
+        self.stream.close()
+        shutil.rmtree(self.path)
+
+    def read_events(self):
+        with open(self.fn) as f:
+            return [json.loads(line) for line in f]
+
+    def test_events_are_json_lines(self):
+        events.emit(self.session, 'class_start', class_name='ml-005')
+        events.emit(None, 'class_start', class_name='nothing')
+
+        found = self.read_events()
+        self.assertEqual(len(found), 1)
+        self.assertEqual(found[0]['event'], 'class_start')
+        self.assertEqual(found[0]['class_name'], 'ml-005')
+        self.assertEqual(found[0]['pid'], os.getpid())
+        self.assertTrue('time' in found[0])
+
+    def test_standard_output(self):
+        stdout = sys.stdout
+        sys.stdout = six.StringIO()
+        try:
+            stream = events.open_events('-')
+            stream.emit('login', username='u')
+            stream.close()
+            out = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+        self.assertEqual(json.loads(out)['event'], 'login')
+
+    def test_processes_share_the_stream(self):
+        pool = multiprocessing.Pool(4)
+        try:
+            pool.map(emit_many, [self.fn] * 4)
+        finally:
+            pool.close()
+            pool.join()
+
+        self.assertEqual(len(self.read_events()), 800)
+
+    def test_progress_is_throttled(self):
+        listener = events.progress_listener(self.session, 'a.mp4')
+        for i in range(100):
+            listener(i * 10, 1000, 0.5)
+
+        found = self.read_events()
+        self.assertEqual(len(found), 1)
+        self.assertEqual(found[0]['file'], 'a.mp4')
+        self.assertEqual(found[0]['throughput'], 0.0)
+
+        self.assertEqual(events.progress_listener(None, 'a.mp4'), None)
+
+    def download(self, downloader, exists=False):
+        sections = [Section('Week_1', [make_lecture('Intro', {
+            'pdf': [('http://a/1.pdf', '', None)]})])]
+        if exists:
+            os.makedirs(os.path.join(self.path, 'class-001', '01_Week_1'))
+            open(os.path.join(self.path, 'class-001', '01_Week_1',
+                              '01_Intro.pdf'), 'w').close()
+
+        coursera_dl.download_lectures(downloader, 'class-001', sections,
+                                      ['all'], path=self.path)
+        return [(e['event'], e) for e in self.read_events()]
+
+    def test_downloads(self):
+        found = self.download(FileDownloader(self.session))
+
+        self.assertEqual([name for name, _ in found],
+                         ['queued', 'started', 'finished'])
+        finished = found[-1][1]
+        self.assertEqual(finished['class_name'], 'class-001')
+        self.assertEqual(finished['bytes'], 100)
+        self.assertTrue(finished['file'].endswith('01_Intro.pdf'))
+
+    def test_failed_downloads(self):
+        found = self.download(FileDownloader(self.session, fail=True))
+
+        self.assertEqual([name for name, _ in found],
+                         ['queued', 'started', 'failed'])
+
+    def test_existing_files_are_skipped(self):
+        found = self.download(FileDownloader(self.session), exists=True)
+
+        self.assertEqual([(name, e['reason']) for name, e in found],
+                         [('skipped', 'exists')])
+
+    def test_hook_results(self):
+        runner = hooks.HookRunner(events=self.stream)
+        runner.submit('class-001', self.path, ['true'])
+        runner.close()
+
+        found = self.read_events()
+        self.assertEqual(found[0]['event'], 'hook')
+        self.assertEqual(found[0]['returncode'], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
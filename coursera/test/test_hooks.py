@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the background execution of the hooks.
+"""
+
+import os
+import shutil
+import stat
+import tempfile
+import time
+import unittest
+
+from coursera import coursera_dl, hooks
+from coursera.model import Section, make_lecture
+
+
+class MockDownloader(object):
+    session = None
+
+    def download(self, url, filename):
+        open(filename, 'w').close()
+
+
+class HookRunnerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        self.runner = hooks.HookRunner(2)
+
+    def tearDown(self):
+        self.runner.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.path)
+
+    def make_hook(self, name, script):
+        hook = os.path.join(self.path, name)
+        with open(hook, 'w') as f:
+            f.write('#!/bin/sh\n' + script + '\n')
+        os.chmod(hook, os.stat(hook).st_mode | stat.S_IEXEC)
+        return hook
+
+    def make_section(self, name):
+        sec = os.path.join(self.path, name)
+        os.mkdir(sec)
+        return sec
+
+    def test_hooks_run_in_their_section(self):
+        hook = self.make_hook('pwd.sh', 'pwd > where')
+        sec = self.make_section('01_Week_1')
+
+        self.runner.submit('class-001', sec, [hook])
+        self.runner.wait()
+
+        with open(os.path.join(sec, 'where')) as f:
+            self.assertEqual(os.path.realpath(f.read().strip()),
+                             os.path.realpath(sec))
+        self.assertEqual(os.getcwd(), self.cwd)
+
+    def test_hooks_of_a_section_run_in_order(self):
+        first = self.make_hook('first.sh', 'sleep 0.2; echo first >> log')
+        second = self.make_hook('second.sh', 'echo second >> log')
+        sec = self.make_section('01_Week_1')
+
+        self.runner.submit('class-001', sec, [first, second])
+        self.runner.wait()
+
+        with open(os.path.join(sec, 'log')) as f:
+            self.assertEqual(f.read().split(), ['first', 'second'])
+
+    def test_hooks_run_in_the_background(self):
+        hook = self.make_hook('slow.sh', 'sleep 0.5')
+        sec = self.make_section('01_Week_1')
+
+        start = time.time()
+        self.runner.submit('class-001', sec, [hook])
+        self.assertTrue(time.time() - start < 0.5)
+
+        results = self.runner.wait()
+        self.assertTrue(time.time() - start >= 0.5)
+        self.assertEqual(len(results), 1)
+        self.assertTrue(results[0].seconds >= 0.5)
+
+    def test_results_are_collected(self):
+        ok = self.make_hook('ok.sh', 'exit 0')
+        bad = self.make_hook('bad.sh', 'exit 3')
+        missing = os.path.join(self.path, 'missing.sh')
+        a = self.make_section('01_Week_1')
+        b = self.make_section('02_Week_2')
+
+        self.runner.submit('class-001', a, [ok, bad])
+        self.runner.submit('class-002', b, [missing])
+
+        results = self.runner.wait('class-001')
+        self.assertEqual([(r.hook, r.returncode) for r in results],
+                         [(ok, 0), (bad, 3)])
+        self.assertEqual([r.failed for r in results], [False, True])
+
+        results = self.runner.wait('class-002')
+        self.assertEqual([(r.hook, r.returncode) for r in results],
+                         [(missing, None)])
+        self.assertTrue(results[0].failed)
+
+    def test_results_are_returned_once(self):
+        ok = self.make_hook('ok.sh', 'exit 0')
+        slow = self.make_hook('slow.sh', 'sleep 0.5')
+        a = self.make_section('01_Week_1')
+        b = self.make_section('02_Week_2')
+
+        self.runner.submit('class-001', a, [ok])
+        self.assertEqual(len(self.runner.wait('class-001')), 1)
+        self.assertEqual(self.runner.wait('class-001'), [])
+
+        # e.g. between the rounds of --watch
+        self.runner.submit('class-001', a, [ok])
+        self.runner.submit('class-002', b, [slow])
+        time.sleep(0.2)
+        self.assertEqual([r.hook for r in self.runner.pop_results()], [ok])
+        self.assertEqual(self.runner.pop_results(), [])
+
+        self.runner.close()
+        results = self.runner.pop_results()
+        self.assertEqual([r.hook for r in results], [slow])
+        self.assertEqual(self.runner.results, [])
+
+        hooks.log_hooks(results)
+
+    def test_download_lectures_runs_the_hooks_of_each_section(self):
+        hook = self.make_hook('ls.sh', 'ls > ../$(basename $PWD).ls')
+        sections = [Section('Week_%d' % i, [make_lecture('Intro', {
+            'pdf': [('http://a/%d.pdf' % i, '', None)]})])
+            for i in (1, 2)]
+
+        coursera_dl.download_lectures(
+            MockDownloader(), 'class-001', sections, ['all'],
+            path=self.path, hooks=[hook], hook_runner=self.runner)
+        results = self.runner.wait('class-001')
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(os.getcwd(), self.cwd)
+        for i in (1, 2):
+            listing = os.path.join(self.path, 'class-001',
+                                   '%02d_Week_%d.ls' % (i, i))
+            with open(listing) as f:
+                self.assertEqual(f.read().split(), ['01_Intro.pdf'])
+
+    def test_download_lectures_waits_for_its_own_runner(self):
+        hook = self.make_hook('touch.sh', 'sleep 0.2; touch done')
+        sections = [Section('Week_1', [make_lecture('Intro', {
+            'pdf': [('http://a/1.pdf', '', None)]})])]
+
+        coursera_dl.download_lectures(
+            MockDownloader(), 'class-001', sections, ['all'],
+            path=self.path, hooks=[hook])
+
+        self.assertTrue(os.path.exists(os.path.join(
+            self.path, 'class-001', '01_Week_1', 'done')))
+
+
+if __name__ == "__main__":
+    unittest.main()
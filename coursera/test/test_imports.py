@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test that coursera-dl starts quickly.
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+# Seconds that importing coursera.coursera_dl may take (about 0.1 on a
+# laptop; see benchmarks/bench_import.py)
+IMPORT_BUDGET = 0.5
+
+# Modules which are only imported by the code paths which need them
+LAZY_MODULES = ['bs4', 'html5lib', 'distutils', 'BeautifulSoup']
+
+CHILD = """
+import sys, time
+start = time.time()
+import coursera.coursera_dl
+print(time.time() - start)
+print(' '.join(m for m in %r if m in sys.modules))
+""" % (LAZY_MODULES,)
+
+
+def import_in_child():
+    """
+    Import coursera.coursera_dl in a fresh interpreter, and return the
+    seconds that it took and the lazy modules which were imported.
+    """
+    p = subprocess.Popen([sys.executable, '-c', CHILD], cwd=ROOT,
+                         stdout=subprocess.PIPE, universal_newlines=True)
+    out, _ = p.communicate()
+    lines = out.split('\n')
+    return float(lines[0]), lines[1].split()
+
+
+class ImportTestCase(unittest.TestCase):
+
+    def test_heavy_modules_are_imported_lazily(self):
+        _, imported = import_in_child()
+
+        self.assertEqual(imported, [])
+
+    def test_import_is_within_budget(self):
+        seconds = min(import_in_child()[0] for _ in range(3))
+
+        self.assertTrue(seconds < IMPORT_BUDGET,
+                        'importing took %.2f seconds' % seconds)
+
+    def test_pages_are_still_parsed(self):
+        from coursera import coursera_dl
+
+        soup = coursera_dl.BeautifulSoup('<p>hello</p>')
+
+        self.assertEqual(soup.find('p').text, 'hello')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the job files.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from coursera import jobs
+
+
+class JobFileTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.args = argparse.Namespace(
+            file_formats=['all'], path='', hooks=[], preview=False,
+            section_filter=None, intact_fnames=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, name, contents):
+        fn = os.path.join(self.path, name)
+        with open(fn, 'w') as f:
+            f.write(contents)
+        return fn
+
+    def test_json(self):
+        fn = self.write('jobs.json', json.dumps({
+            'defaults': {'formats': 'mp4 pdf'},
+            'classes': [
+                {'class': 'ml-005', 'path': '/data/ml'},
+                {'class': 'nlp', 'preview': True, 'hooks': ['./done.sh'],
+                 'unrestricted-filenames': True},
+                'saas']}))
+
+        loaded = jobs.load_jobs(fn, self.args)
+
+        self.assertEqual([class_name for class_name, _ in loaded],
+                         ['ml-005', 'nlp', 'saas'])
+        ml, nlp, saas = [args for _, args in loaded]
+        self.assertEqual(ml.file_formats, ['mp4', 'pdf'])
+        self.assertEqual(ml.path, '/data/ml')
+        self.assertFalse(ml.preview)
+        self.assertTrue(nlp.preview)
+        self.assertTrue(nlp.intact_fnames)
+        self.assertEqual(nlp.hooks, ['./done.sh'])
+        self.assertEqual(saas.path, '')
+        self.assertEqual(self.args.file_formats, ['all'])
+
+    def test_ini(self):
+        fn = self.write('jobs.ini', '\n'.join([
+            '[DEFAULT]',
+            'formats = mp4',
+            '',
+            '[ml-005]',
+            'preview = yes',
+            'hooks = ./a.sh',
+            '    ./b.sh',
+            '',
+            '[nlp]',
+            'section_filter = week1',
+            '']))
+
+        loaded = dict(jobs.load_jobs(fn, self.args))
+
+        self.assertEqual(sorted(loaded), ['ml-005', 'nlp'])
+        self.assertEqual(loaded['ml-005'].file_formats, ['mp4'])
+        self.assertTrue(loaded['ml-005'].preview)
+        self.assertEqual(loaded['ml-005'].hooks, ['./a.sh', './b.sh'])
+        self.assertEqual(loaded['nlp'].section_filter, 'week1')
+        self.assertFalse(loaded['nlp'].preview)
+
+    def test_unknown_option(self):
+        fn = self.write('jobs.json', json.dumps(
+            [{'class': 'ml-005', 'password': 'secret'}]))
+
+        self.assertRaises(jobs.JobFileError, jobs.load_jobs, fn, self.args)
+
+    def test_bad_files(self):
+        self.assertRaises(jobs.JobFileError, jobs.load_jobs,
+                          os.path.join(self.path, 'missing.json'), self.args)
+        self.assertRaises(jobs.JobFileError, jobs.load_jobs,
+                          self.write('bad.json', '{"classes": '), self.args)
+        self.assertRaises(jobs.JobFileError, jobs.load_jobs,
+                          self.write('empty.json', '{}'), self.args)
+
+
+if __name__ == "__main__":
+    unittest.main()
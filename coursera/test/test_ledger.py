@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the work ledgers.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from coursera import coursera_dl, ledger
+from coursera.model import Section, make_lecture
+
+
+def claim_all(args):
+    """
+    Claim as many of the given keys as possible, in a separate process.
+    """
+    path, keys = args
+    worker = ledger.SQLiteLedger(path)
+    try:
+        claimed = []
+        for key in keys:
+            if worker.claim(key):
+                claimed.append(key)
+                worker.finish(key)
+        return claimed
+    finally:
+        worker.close()
+
+
+class MockDownloader(object):
+    session = None
+
+    def __init__(self):
+        self.downloaded = []
+
+    def download(self, url, filename):
+        self.downloaded.append(url)
+
+
+class FailingDownloader(MockDownloader):
+
+    def download(self, url, filename):
+        self.downloaded.append(url)
+        return False
+
+
+class SQLiteLedgerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.db = os.path.join(self.path, 'ledger.db')
+        self.ledgers = []
+
+    def tearDown(self):
+        for l in self.ledgers:
+            l.close()
+        shutil.rmtree(self.path)
+
+    def open(self, lease=ledger.LEASE_SECONDS):
+        l = ledger.SQLiteLedger(self.db, lease=lease)
+        self.ledgers.append(l)
+        return l
+
+    def test_claims_are_exclusive(self):
+        a, b = self.open(), self.open()
+
+        self.assertTrue(a.claim('x'))
+        self.assertTrue(a.claim('x'))
+        self.assertFalse(b.claim('x'))
+        self.assertTrue(b.claim('y'))
+
+    def test_done_files_are_not_claimed_again(self):
+        a, b = self.open(0.1), self.open()
+
+        a.claim('x')
+        a.finish('x')
+        time.sleep(0.2)
+
+        self.assertFalse(b.claim('x'))
+        self.assertFalse(a.claim('x'))
+
+    def test_released_claims_can_be_taken(self):
+        a, b = self.open(), self.open()
+
+        a.claim('x')
+        a.release('x')
+
+        self.assertTrue(b.claim('x'))
+
+    def test_expired_claims_are_taken_over(self):
+        a, b = self.open(0.1), self.open()
+
+        a.claim('x')
+        a.close()  # a dead worker, which stops renewing its claims
+        time.sleep(0.2)
+
+        self.assertTrue(b.claim('x'))
+
+    def test_heartbeat_keeps_claims_alive(self):
+        a, b = self.open(0.3), self.open()
+
+        a.claim('x')
+        time.sleep(0.6)
+
+        self.assertFalse(b.claim('x'))
+
+    def test_open_ledger(self):
+        l = ledger.open_ledger('sqlite://' + self.db)
+        self.ledgers.append(l)
+
+        self.assertTrue(isinstance(l, ledger.SQLiteLedger))
+        self.assertRaises(ValueError, ledger.open_ledger, 'nosuch://x')
+
+    def test_processes_share_the_work(self):
+        keys = ['file-%03d' % i for i in range(100)]
+        ledger.SQLiteLedger(self.db).close()  # create it
+
+        pool = multiprocessing.Pool(4)
+        try:
+            claimed = pool.map(claim_all, [(self.db, keys)] * 4)
+        finally:
+            pool.close()
+            pool.join()
+
+        self.assertEqual(sorted(sum(claimed, [])), keys)
+
+    def test_download_lectures_skips_claimed_files(self):
+        sections = [Section('Week_1', [make_lecture('Intro', {
+            'pdf': [('http://a/1.pdf', '', None)],
+            'txt': [('http://a/1.txt', '', None)]})])]
+        a, b = self.open(), self.open()
+        b.claim(os.path.join('class-001', '01_Week_1', '01_Intro.txt'))
+
+        downloader = MockDownloader()
+        coursera_dl.download_lectures(
+            downloader, 'class-001', sections, ['all'],
+            path=os.path.join(self.path, 'a'), ledger=a)
+
+        self.assertEqual(downloader.downloaded, ['http://a/1.pdf'])
+
+        downloader = MockDownloader()
+        coursera_dl.download_lectures(
+            downloader, 'class-001', sections, ['all'],
+            path=os.path.join(self.path, 'b'), ledger=b)
+
+        self.assertEqual(downloader.downloaded, ['http://a/1.txt'])
+
+    def test_failed_downloads_are_released(self):
+        sections = [Section('Week_1', [make_lecture('Intro', {
+            'mp4': [('http://a/1.mp4', '', None)]})])]
+        a, b = self.open(), self.open()
+
+        coursera_dl.download_lectures(
+            FailingDownloader(), 'class-001', sections, ['all'],
+            path=self.path, ledger=a, playlist=True)
+
+        sec = os.path.join(self.path, 'class-001', '01_Week_1')
+        self.assertFalse(os.path.exists(os.path.join(sec, '01_Intro.mp4')))
+        self.assertFalse(os.path.exists(os.path.join(sec, '01_Week_1.m3u')))
+        self.assertTrue(b.claim(os.path.join('class-001', '01_Week_1',
+                                             '01_Intro.mp4')))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the syllabus model.
+"""
+
+import json
+import unittest
+
+from coursera import model
+
+
+class ModelTestCase(unittest.TestCase):
+
+    def test_make_lecture_makes_titles_unique(self):
+        lecture = model.make_lecture('Intro', {
+            'pdf': [('http://a/1.pdf', 'Slides', None),
+                    ('http://a/2.pdf', 'Notes', None),
+                    ('http://a/3.pdf', 'Slides', None)],
+            'mp4': [('http://a/view', '', 'preview')]})
+
+        self.assertEqual(lecture.name, 'Intro')
+        self.assertEqual(lecture.resources['pdf'], (
+            ('http://a/1.pdf', '0_Slides', None, None),
+            ('http://a/2.pdf', '1_Notes', None, None),
+            ('http://a/3.pdf', '', None, None)))
+        self.assertEqual(lecture.resources['mp4'][0].via, 'preview')
+
+    def test_fallback_is_kept(self):
+        lecture = model.make_lecture('Intro', {
+            'mp4': [('http://a/preview', '', 'preview', 'http://a/view')]})
+
+        self.assertEqual(lecture.resources['mp4'][0].fallback,
+                         'http://a/view')
+
+    def test_formats_are_interned(self):
+        fmt = ''.join(['p', 'd', 'f'])
+        a = model.make_lecture('a', {fmt: [('http://a/1.pdf', '', None)]})
+        b = model.make_lecture('b', {'pdf': [('http://a/2.pdf', '', None)]})
+
+        self.assertTrue(list(a.resources)[0] is list(b.resources)[0])
+
+    def test_no_instance_dict(self):
+        resource = model.Resource('http://a/1.pdf', '', None)
+        self.assertFalse(hasattr(resource, '__dict__'))
+        self.assertRaises(AttributeError, setattr, resource, 'size', 1)
+
+    def test_unpacks_like_tuples(self):
+        section = model.Section('Week_1', [model.make_lecture('Intro', {})])
+
+        name, lectures = section
+        self.assertEqual(name, 'Week_1')
+        self.assertEqual(lectures[0], ('Intro', {}))
+
+    def test_json_roundtrip(self):
+        sections = [
+            model.Section('Week_1', [
+                model.make_lecture('Intro', {
+                    'mp4': [('http://a/view', '', 'hidden')],
+                    'pdf': [('http://a/1.pdf', 'Slides', None)]})])]
+
+        data = json.loads(json.dumps(sections))
+        restored = model.sections_from_json(data)
+
+        self.assertEqual(restored, sections)
+        resource = restored[0].lectures[0].resources['mp4'][0]
+        self.assertTrue(isinstance(resource, model.Resource))
+        self.assertEqual(resource.via, 'hidden')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the compressed page store.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from coursera import coursera_dl, pagestore
+
+SYLLABUS = os.path.join(os.path.dirname(__file__),
+                        "fixtures", "html", "regular-syllabus.html")
+
+
+class MockResponse(object):
+    def __init__(self, text, headers=None):
+        self.status_code = 200
+        self.text = text
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        pass
+
+
+class MockSession(object):
+    def __init__(self, text):
+        self.text = text
+
+    def get(self, url, headers=None):
+        return MockResponse(self.text, {'ETag': '"abc"'})
+
+
+class PageStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'pages.db')
+        self.store = pagestore.PageStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.dir)
+
+    def test_roundtrip(self):
+        url = 'https://class.coursera.org/class-001/lecture/index'
+        self.store.put(url, u'<html>é</html>', etag='"abc"')
+
+        self.assertEqual(self.store.get(url), u'<html>é</html>')
+        self.assertEqual(self.store.get_entry(url)[1], {'etag': '"abc"'})
+        self.assertTrue(self.store.get(url + '?other') is None)
+
+    def test_put_replaces_previous_copy(self):
+        url = 'https://class.coursera.org/class-001/lecture/index'
+        self.store.put(url, 'old')
+        self.store.put(url, 'new')
+
+        self.assertEqual(self.store.get(url), 'new')
+        self.assertEqual(len(self.store), 1)
+
+    def test_urls_by_class(self):
+        self.store.put('https://class.coursera.org/a-001/lecture/index', '')
+        self.store.put('https://class.coursera.org/b-001/lecture/index', '')
+        self.store.put('https://www.coursera.org/maestro/api/topic/'
+                       'information?topic-id=a-001', '{}')
+
+        self.assertEqual(len(self.store.urls()), 3)
+        self.assertEqual(len(self.store.urls('a-001')), 2)
+        self.assertEqual(self.store.urls('b-001'),
+                         ['https://class.coursera.org/b-001/lecture/index'])
+
+    def test_pages_are_compressed_and_persistent(self):
+        with open(SYLLABUS, 'rb') as f:
+            page = f.read().decode('utf-8')
+
+        url = 'https://class.coursera.org/nlp/lecture/index'
+        self.store.put(url, page)
+        self.store.close()
+
+        self.assertTrue(os.path.getsize(self.path) < len(page) / 2)
+
+        self.store = pagestore.PageStore(self.path)
+        self.assertEqual(self.store.get(url), page)
+
+    def test_get_page_archives_pages(self):
+        session = MockSession('<html></html>')
+        session.page_store = self.store
+        url = 'https://class.coursera.org/class-001/lecture/view?id=1'
+
+        coursera_dl.get_page(session, url)
+
+        self.assertEqual(self.store.get(url), '<html></html>')
+        self.assertEqual(self.store.urls('class-001'), [url])
+
+
+if __name__ == "__main__":
+    unittest.main()
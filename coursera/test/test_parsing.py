@@ -5,12 +5,21 @@
 Test functionality of coursera module.
 """
 
+import argparse
+import logging
+import multiprocessing
 import os.path
+import re
+import shutil
+import tempfile
+import time
 import unittest
 
 from six import iteritems
 
-from coursera import coursera_dl
+from coursera import cache, coursera_dl, jobs
+from coursera.cookies import ClassNotFound
+from coursera.model import Section, make_lecture
 
 
 class TestSyllabusParsing(unittest.TestCase):
@@ -81,6 +90,45 @@ class TestSyllabusParsing(unittest.TestCase):
                 sum(r for f, r in resources if f == "mp4"),
                 num_videos)
 
+    def test_iter_syllabus_yields_the_same_sections(self):
+        filename = os.path.join(
+            os.path.dirname(__file__), "fixtures", "html",
+            "regular-syllabus.html")
+
+        with open(filename) as syllabus:
+            page = syllabus.read()
+
+        self.assertEqual(list(coursera_dl.iter_syllabus(None, page)),
+                         coursera_dl.parse_syllabus(None, page))
+
+    def test_iter_syllabus_parses_one_section_at_a_time(self):
+        filename = os.path.join(
+            os.path.dirname(__file__), "fixtures", "html",
+            "regular-syllabus.html")
+
+        with open(filename) as syllabus:
+            page = syllabus.read()
+
+        parsed = []
+        original = coursera_dl.BeautifulSoup
+        make_soup = coursera_dl._make_beautiful_soup()
+
+        def BeautifulSoup(chunk):
+            parsed.append(len(chunk))
+            return make_soup(chunk)
+
+        coursera_dl.BeautifulSoup = BeautifulSoup
+        try:
+            sections = coursera_dl.iter_syllabus(None, page)
+            next(sections)
+            self.assertEqual(len(parsed), 1)
+            self.assertTrue(parsed[0] < len(page) / 10)
+
+            self.assertEqual(len(list(sections)), 22)
+            self.assertEqual(len(parsed), 23)
+        finally:
+            coursera_dl.BeautifulSoup = original
+
     def test_parse(self):
         self._assert_parse(
             "regular-syllabus.html",
@@ -94,8 +142,8 @@ class TestSyllabusParsing(unittest.TestCase):
             "links-to-wikipedia.html",
             num_sections=5,
             num_lectures=37,
-            num_resources=158,
-            num_videos=36)
+            num_resources=159,
+            num_videos=37)
 
     def test_parse_preview(self):
         self._assert_parse(
@@ -126,7 +174,7 @@ class TestSyllabusParsing(unittest.TestCase):
             'datasci-001': (10, 97, 358, 97),  # issue 134
             'startup-001': (4, 44, 136, 44),   # issue 137
             'wealthofnations-001': (8, 74, 296, 74),  # issue 131
-            'malsoftware-001': (3, 18, 56, 16)  # issue 148
+            'malsoftware-001': (3, 18, 58, 18)  # issue 148
         }
 
         for class_, counts in iteritems(classes):
@@ -147,5 +195,417 @@ class TestSyllabusParsing(unittest.TestCase):
             num_videos=97)
 
 
+class MockDownloader(object):
+    def __init__(self):
+        self.session = None
+        self.downloaded = []
+
+    def download(self, url, filename):
+        self.downloaded.append((url, filename))
+
+
+class TestLazyResolution(unittest.TestCase):
+
+    def setUp(self):
+        """
+        We mock get_video to record which preview pages get resolved.
+        """
+        self.path = tempfile.mkdtemp()
+        self.resolved = []
+
+        self.__get_video = coursera_dl.get_video
+
+        def new_get_video(session, href):
+            self.resolved.append(href)
+            return 'http://example.com/video.mp4'
+        coursera_dl.get_video = new_get_video
+
+        filename = os.path.join(
+            os.path.dirname(__file__), "fixtures", "html", "preview.html")
+        with open(filename) as syllabus:
+            self.sections = coursera_dl.parse_syllabus(None, syllabus.read())
+
+    def tearDown(self):
+        coursera_dl.get_video = self.__get_video
+        shutil.rmtree(self.path)
+
+    def test_parse_does_not_resolve(self):
+        self.assertEqual(self.resolved, [])
+
+        vias = set(r[2]
+                   for sec in self.sections
+                   for lec in sec[1]
+                   for res in lec[1].values()
+                   for r in res)
+        self.assertEqual(vias, set(['preview']))
+
+    def test_only_selected_lectures_are_resolved(self):
+        section, lectures = self.sections[1]
+        downloader = MockDownloader()
+
+        coursera_dl.download_lectures(
+            downloader, 'preview-001', self.sections, ['mp4'],
+            section_filter='^' + re.escape(section) + '$', path=self.path)
+
+        self.assertEqual(len(self.resolved), len(lectures))
+        self.assertEqual(len(downloader.downloaded), len(lectures))
+        for url, filename in downloader.downloaded:
+            self.assertEqual(url, 'http://example.com/video.mp4')
+            self.assertTrue(filename.endswith('.mp4'))
+
+    def test_hidden_video_is_tried_when_preview_fails(self):
+        def failing_get_video(session, href):
+            raise TypeError("'NoneType' object is not subscriptable")
+
+        def new_grab_hidden_video_url(session, href):
+            self.resolved.append(href)
+            return 'http://example.com/hidden.mp4'
+
+        grab_hidden_video_url = coursera_dl.grab_hidden_video_url
+        coursera_dl.get_video = failing_get_video
+        coursera_dl.grab_hidden_video_url = new_grab_hidden_video_url
+        try:
+            url = coursera_dl.resolve_resource(
+                None, 'http://example.com/preview_view?lecture_id=1',
+                'preview', 'http://example.com/view?lecture_id=1')
+        finally:
+            coursera_dl.grab_hidden_video_url = grab_hidden_video_url
+
+        self.assertEqual(url, 'http://example.com/hidden.mp4')
+        self.assertEqual(self.resolved,
+                         ['http://example.com/view?lecture_id=1'])
+
+    def test_skip_download_does_not_resolve(self):
+        downloader = MockDownloader()
+
+        coursera_dl.download_lectures(
+            downloader, 'preview-001', self.sections, ['all'],
+            skip_download=True, path=self.path)
+
+        self.assertEqual(self.resolved, [])
+        self.assertEqual(downloader.downloaded, [])
+
+
+class TestDownloadLectures(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.sections = [Section('Week_1', [make_lecture('Intro', {
+            'mp4': [('http://a/1.mp4', '', None)],
+            'pdf': [('http://a/1.pdf', '', None)]})])]
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _download(self):
+        downloader = MockDownloader()
+        completed = coursera_dl.download_lectures(
+            downloader, 'class-001', self.sections, ['all'],
+            path=self.path)
+        return completed, downloader.downloaded
+
+    def test_existing_files_are_found_without_a_stat_each(self):
+        sec = os.path.join(self.path, 'class-001', '01_Week_1')
+        os.makedirs(sec)
+        fn = os.path.join(sec, '01_Intro.pdf')
+        open(fn, 'w').close()
+
+        exists, getmtime = os.path.exists, os.path.getmtime
+        os.path.exists = os.path.getmtime = None
+        try:
+            completed, downloaded = self._download()
+        finally:
+            os.path.exists, os.path.getmtime = exists, getmtime
+
+        self.assertEqual(downloaded, [
+            ('http://a/1.mp4', os.path.join(sec, '01_Intro.mp4'))])
+        self.assertFalse(completed)
+
+    def test_old_files_mean_the_class_is_completed(self):
+        sec = os.path.join(self.path, 'class-001', '01_Week_1')
+        os.makedirs(sec)
+        old = time.time() - 60 * 24 * 3600
+        for name in ('01_Intro.pdf', '01_Intro.mp4'):
+            fn = os.path.join(sec, name)
+            open(fn, 'w').close()
+            os.utime(fn, (old, old))
+
+        self.assertEqual(self._download(), (True, []))
+
+
+class TestPlaylists(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.sec = os.path.join(self.path, 'class-001', '01_Week_1')
+        self.sections = [Section('Week_1', [
+            make_lecture('Lecture_%d' % i, {
+                'mp4': [('http://a/%d.mp4' % i, '', None)],
+                'pdf': [('http://a/%d.pdf' % i, '', None)]})
+            for i in range(12)])]
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _download(self, sections):
+        cwd = os.getcwd()
+        coursera_dl.download_lectures(
+            MockDownloader(), 'class-001', sections, ['all'],
+            skip_download=True, path=self.path, playlist=True)
+        self.assertEqual(os.getcwd(), cwd)
+
+    def _playlist(self):
+        with open(os.path.join(self.sec, '01_Week_1.m3u')) as m3u:
+            return m3u.read().splitlines()
+
+    def test_playlist_is_in_lecture_order(self):
+        self._download(self.sections)
+
+        self.assertEqual(self._playlist(),
+                         ['%02d_Lecture_%d.mp4' % (i + 1, i)
+                          for i in range(12)])
+        self.assertEqual(sorted(name for name in os.listdir(self.sec)
+                                if name.endswith('.tmp')), [])
+
+    def test_playlist_keeps_the_videos_downloaded_before(self):
+        self._download(self.sections)
+
+        # e.g. in --watch mode, only the new lectures are left
+        new = [Section('Week_1', [make_lecture('Lecture_%d' % i, {})
+                                  for i in range(12)] + [
+            make_lecture('Lecture_12', {
+                'mp4': [('http://a/12.mp4', '', None)]})])]
+        self._download(new)
+
+        self.assertEqual(self._playlist(),
+                         ['%02d_Lecture_%d.mp4' % (i + 1, i)
+                          for i in range(13)])
+
+    def test_no_playlist_without_videos(self):
+        self._download([Section('Week_1', [make_lecture('Intro', {
+            'pdf': [('http://a/1.pdf', '', None)]})])])
+
+        self.assertEqual(os.listdir(self.sec), ['01_Intro.pdf'])
+
+
+class TestStreamSyllabus(unittest.TestCase):
+
+    def setUp(self):
+        """
+        We keep the syllabus cache in a temporary directory.
+        """
+        self.path = tempfile.mkdtemp()
+
+        self.__load_syllabus = coursera_dl.load_syllabus
+        self.__save_syllabus = coursera_dl.save_syllabus
+        coursera_dl.load_syllabus = \
+            lambda class_name, key: cache.load_syllabus(
+                class_name, key, path=self.path)
+        coursera_dl.save_syllabus = \
+            lambda class_name, key, sections: cache.save_syllabus(
+                class_name, key, sections, path=self.path)
+
+        filename = os.path.join(
+            os.path.dirname(__file__), "fixtures", "html",
+            "sections-not-to-be-missed.html")
+        with open(filename) as syllabus:
+            self.page = syllabus.read()
+
+    def tearDown(self):
+        coursera_dl.load_syllabus = self.__load_syllabus
+        coursera_dl.save_syllabus = self.__save_syllabus
+        shutil.rmtree(self.path)
+
+    def _stream(self, reverse=False, use_cache=True):
+        return coursera_dl.stream_syllabus(None, 'class-001', self.page,
+                                           reverse, use_cache=use_cache)
+
+    def _files(self, sections):
+        path = os.path.join(self.path, 'files')
+        coursera_dl.download_lectures(MockDownloader(), 'class-001',
+                                      sections, ['all'], skip_download=True,
+                                      path=path)
+        files = []
+        for dirpath, dirnames, filenames in os.walk(path):
+            files.extend(os.path.relpath(os.path.join(dirpath, fn), path)
+                         for fn in filenames)
+        shutil.rmtree(path)
+        return sorted(files)
+
+    def test_same_sections_as_parse_syllabus(self):
+        for reverse in (False, True):
+            expected = coursera_dl.parse_syllabus(None, self.page, reverse)
+            self.assertEqual(list(self._stream(reverse, False)), expected)
+
+    def test_cache_is_written_once_the_stream_is_exhausted(self):
+        fn = cache.get_syllabus_cache_path('class-001', path=self.path)
+
+        sections = self._stream()
+        next(sections)
+        self.assertFalse(os.path.exists(fn))
+
+        list(sections)
+        self.assertTrue(os.path.exists(fn))
+
+    def test_cache_hit_keeps_order_and_numbering(self):
+        for reverse in (False, True):
+            expected = coursera_dl.parse_syllabus(None, self.page, reverse)
+            list(self._stream(reverse))
+
+            beautiful_soup = coursera_dl.BeautifulSoup
+
+            def failing_soup(page):
+                raise AssertionError('the page should not be parsed')
+
+            coursera_dl.BeautifulSoup = failing_soup
+            try:
+                cached = list(self._stream(reverse))
+                files = self._files(self._stream(reverse))
+            finally:
+                coursera_dl.BeautifulSoup = beautiful_soup
+
+            self.assertEqual(cached, expected)
+            self.assertEqual(files, self._files(expected))
+
+
+def mock_download_class(args, class_name, session=None, watch=None,
+                        report=None):
+    if class_name == 'missing-001':
+        raise ClassNotFound(class_name)
+    if report is not None:
+        report.files, report.bytes = 1, len(class_name)
+    return class_name.startswith('completed')
+
+
+class TestClassJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.__download_class = coursera_dl.download_class
+        coursera_dl.download_class = mock_download_class
+        self.args = argparse.Namespace(debug=False, quiet=True,
+                                       page_store=None)
+
+    def tearDown(self):
+        coursera_dl.download_class = self.__download_class
+
+    def test_process_class_logs_errors(self):
+        self.assertFalse(coursera_dl.process_class(self.args, 'missing-001'))
+        self.assertTrue(
+            coursera_dl.process_class(self.args, 'completed-001'))
+
+    def test_download_classes_in_parallel(self):
+        # the mocks are only inherited by forked workers
+        if getattr(multiprocessing, 'get_start_method',
+                   lambda: 'fork')() != 'fork':
+            return
+
+        class_names = ['completed-002', 'running-001', 'missing-001',
+                       'completed-001']
+
+        reports = coursera_dl.download_classes_in_parallel(
+            self.args, [(c, self.args) for c in class_names], 3)
+
+        self.assertEqual([r.class_name for r in reports], class_names)
+        self.assertEqual([r.class_name for r in reports if r.completed],
+                         ['completed-002', 'completed-001'])
+        self.assertEqual([r.bytes for r in reports], [13, 11, 0, 13])
+        self.assertEqual(reports[2].error, 'Could not find class: missing-001')
+
+    def test_process_class_fills_the_report(self):
+        report = jobs.ClassReport('completed-001')
+
+        coursera_dl.process_class(self.args, 'completed-001', report=report)
+
+        self.assertEqual(report.status, 'completed')
+        self.assertEqual((report.files, report.bytes), (1, 13))
+        self.assertTrue(report.seconds >= 0)
+
+    def test_workers_hold_the_lock_while_getting_cookies(self):
+        class FakeLock(object):
+            held = False
+
+            def __enter__(self):
+                self.held = True
+
+            def __exit__(self, *exc_info):
+                self.held = False
+
+        class Stop(Exception):
+            pass
+
+        lock = FakeLock()
+        held = []
+
+        def get_cookies_for_class(session, class_name, **kwargs):
+            held.append(lock.held)
+
+        def get_syllabus(*args, **kwargs):
+            raise Stop()
+
+        args = argparse.Namespace(
+            debug=False, quiet=True, page_store=None, preview=False,
+            cookies_file=None, username='user', password='pass',
+            local_page=False, syllabus_cache=False)
+
+        saved = (coursera_dl.setup_logging, coursera_dl.get_cookies_for_class,
+                 coursera_dl.get_syllabus, coursera_dl._cookies_lock)
+        coursera_dl.download_class = self.__download_class
+        coursera_dl.setup_logging = lambda *args, **kwargs: None
+        coursera_dl.get_cookies_for_class = get_cookies_for_class
+        coursera_dl.get_syllabus = get_syllabus
+        try:
+            coursera_dl._init_class_worker(args, lock)
+            self.assertRaises(Stop, coursera_dl._process_class_in_worker,
+                              ('class-001', args))
+        finally:
+            (coursera_dl.setup_logging, coursera_dl.get_cookies_for_class,
+             coursera_dl.get_syllabus, coursera_dl._cookies_lock) = saved
+            if coursera_dl._session is not None:
+                coursera_dl.close_session(coursera_dl._session)
+            coursera_dl._args = None
+            coursera_dl._session = None
+
+        self.assertEqual(held, [True])
+        self.assertFalse(lock.held)
+
+    def test_workers_reuse_their_session(self):
+        path = tempfile.mkdtemp()
+        sessions = []
+
+        def download_class(args, class_name, session=None, watch=None,
+                           report=None):
+            sessions.append(session)
+            return True
+
+        coursera_dl.download_class = download_class
+        coursera_dl._args = argparse.Namespace(
+            page_store=os.path.join(path, 'pages.db'))
+        try:
+            coursera_dl._process_class_in_worker(('class-001', None))
+            coursera_dl._process_class_in_worker(('class-002', None))
+        finally:
+            if coursera_dl._session is not None:
+                coursera_dl.close_session(coursera_dl._session)
+            coursera_dl._args = None
+            coursera_dl._session = None
+            shutil.rmtree(path)
+
+        self.assertTrue(sessions[0] is not None)
+        self.assertTrue(sessions[0] is sessions[1])
+        self.assertTrue(sessions[0].page_store is not None)
+
+    def test_log_records_are_tagged_with_the_class(self):
+        record = logging.LogRecord('coursera', logging.INFO, __file__, 1,
+                                   'message', (), None)
+
+        coursera_dl._current_class = 'class-001'
+        try:
+            self.assertTrue(coursera_dl._ClassNameFilter().filter(record))
+        finally:
+            coursera_dl._current_class = None
+
+        self.assertEqual(record.class_name, 'class-001')
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the timing of the phases of a run.
+"""
+
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import unittest
+
+from coursera import coursera_dl, phases
+from coursera.jobs import ClassReport
+from coursera.model import Section, make_lecture
+
+
+def busy(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+def idle(seconds):
+    time.sleep(seconds)
+
+
+class ProfiledSession(object):
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+
+class MockDownloader(object):
+
+    def __init__(self, session):
+        self.session = session
+
+    def download(self, url, filename):
+        idle(0.05)
+        open(filename, 'w').close()
+
+
+class PhaseProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_phases_are_timed_by_class(self):
+        profiler = phases.PhaseProfiler()
+        session = ProfiledSession(profiler)
+
+        with phases.phase(session, 'syllabus', 'class-001'):
+            idle(0.1)
+        with phases.phase(session, 'parse', 'class-001'):
+            busy(0.1)
+        with phases.phase(session, 'parse', 'class-001'):
+            busy(0.1)
+        with phases.phase(session, 'parse', 'class-002'):
+            pass
+
+        times = profiler.pop_class('class-001')
+        wall, cpu, count = times['syllabus']
+        self.assertTrue(wall >= 0.1)
+        self.assertTrue(cpu < 0.1)
+        self.assertEqual(count, 1)
+        wall, cpu, count = times['parse']
+        self.assertTrue(wall >= 0.2)
+        self.assertTrue(cpu > 0.1)
+        self.assertEqual(count, 2)
+
+        self.assertEqual(list(profiler.times), ['class-002'])
+
+    def test_no_profiler(self):
+        with phases.phase(None, 'parse', 'class-001'):
+            pass
+        self.assertEqual(list(phases.phase_iter(None, 'parse', [1, 2])),
+                         [1, 2])
+
+    def test_iterations_are_timed(self):
+        profiler = phases.PhaseProfiler()
+        session = ProfiledSession(profiler)
+
+        def produce():
+            for i in range(3):
+                idle(0.05)
+                yield i
+
+        items = []
+        for item in phases.phase_iter(session, 'parse', produce(), 'c'):
+            idle(0.1)  # not timed
+            items.append(item)
+
+        self.assertEqual(items, [0, 1, 2])
+        wall, _, count = profiler.times['c']['parse']
+        self.assertEqual(count, 4)  # the last one finds the end
+        self.assertTrue(0.15 <= wall < 0.3)
+
+    def test_a_phase_is_run_under_cprofile(self):
+        dump = os.path.join(self.path, 'run.prof')
+        profiler = phases.PhaseProfiler('parse', dump)
+        session = ProfiledSession(profiler)
+
+        with phases.phase(session, 'parse', 'c'):
+            busy(0.01)
+        with phases.phase(session, 'transfer', 'c'):
+            idle(0.01)
+        profiler.dump_cprofile()
+
+        functions = [f[2] for f in pstats.Stats(dump).stats]
+        self.assertTrue('busy' in functions)
+        self.assertFalse('idle' in functions)
+
+    def test_summary(self):
+        times = {'class-001': {'parse': [1.0, 0.5, 1],
+                               'transfer': [2.0, 0.1, 3]},
+                 'class-002': {'parse': [3.0, 1.5, 1]}}
+
+        summary = phases.summarize_phases(times, 10.0, 4.0)
+
+        self.assertEqual(summary['wall'], 10.0)
+        self.assertEqual(summary['phases']['parse'],
+                         {'wall': 4.0, 'cpu': 2.0, 'count': 2})
+        self.assertEqual(summary['classes']['class-001']['transfer'],
+                         {'wall': 2.0, 'cpu': 0.1, 'count': 3})
+
+        fn = os.path.join(self.path, 'profile.json')
+        phases.write_phases(fn, summary)
+        with open(fn) as f:
+            self.assertEqual(json.load(f), summary)
+        phases.log_phases(summary)
+
+    def test_reports_add_the_phases_of_several_processes(self):
+        report = ClassReport('class-001')
+
+        report.add_phases({'login': [1.0, 0.5, 1]})
+        report.add_phases({'login': [1.0, 0.5, 1], 'parse': [2.0, 2.0, 4]})
+
+        self.assertEqual(report.phases, {'login': [2.0, 1.0, 2],
+                                         'parse': [2.0, 2.0, 4]})
+
+    def test_download_lectures_times_the_transfers(self):
+        profiler = phases.PhaseProfiler()
+        sections = [Section('Week_1', [make_lecture('Intro', {
+            'pdf': [('http://a/1.pdf', '', None)],
+            'txt': [('http://a/1.txt', '', None)]})])]
+
+        coursera_dl.download_lectures(
+            MockDownloader(ProfiledSession(profiler)), 'class-001', sections,
+            ['all'], path=self.path)
+
+        wall, _, count = profiler.times['class-001']['transfer']
+        self.assertEqual(count, 2)
+        self.assertTrue(wall >= 0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
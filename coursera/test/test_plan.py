@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the planning of downloads.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from coursera import plan
+from coursera.coursera_dl import ResourceFilter
+from coursera.model import Section, make_lecture
+
+SECTIONS = [
+    Section('Week_1', [
+        make_lecture('Intro', {
+            'mp4': [('http://a/preview', '', 'preview')],
+            'pdf': [('http://a/1.pdf', '', None)]}),
+        make_lecture('Outro', {'pdf': [('http://a/2.pdf', '', None)]})]),
+    Section('Week_2', [
+        make_lecture('Next', {'txt': [('http://a/3.txt', '', None)]})]),
+]
+
+
+class MockResponse(object):
+    def __init__(self, size):
+        self.headers = {}
+        if size is not None:
+            self.headers['content-length'] = str(size)
+
+    def raise_for_status(self):
+        pass
+
+
+class MockSession(object):
+    def __init__(self, sizes):
+        self.sizes = sizes
+        self.heads = []
+        self.lock = threading.Lock()
+
+    def head(self, url, allow_redirects=False):
+        with self.lock:
+            self.heads.append(url)
+        return MockResponse(self.sizes.get(url))
+
+
+def resolve(session, url, via, fallback=None):
+    return 'http://a/video.mp4'
+
+
+class PlanTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.session = MockSession({'http://a/video.mp4': 1000,
+                                    'http://a/1.pdf': 10,
+                                    'http://a/2.pdf': 20})
+
+    def test_parse_bandwidth(self):
+        self.assertEqual(plan.parse_bandwidth('100'), 100)
+        self.assertEqual(plan.parse_bandwidth('500K'), 500 * 1024)
+        self.assertEqual(plan.parse_bandwidth('1.5MB/s'), 1.5 * 1024 ** 2)
+        self.assertRaises(ValueError, plan.parse_bandwidth, 'fast')
+
+    def test_plan_resources(self):
+        sizes = {}
+        entries = plan.plan_resources(self.session, SECTIONS,
+                                      ResourceFilter(), resolve, sizes)
+
+        self.assertEqual(sorted((e.url, e.size) for e in entries), [
+            ('http://a/1.pdf', 10), ('http://a/2.pdf', 20),
+            ('http://a/3.txt', None), ('http://a/preview', 1000)])
+        self.assertEqual(sizes, {'http://a/1.pdf': 10, 'http://a/2.pdf': 20,
+                                 'http://a/preview': 1000})
+
+    def test_cached_sizes_are_not_requested(self):
+        sizes = {'http://a/1.pdf': 15, 'http://a/preview': 2000}
+        plan.plan_resources(self.session, SECTIONS, ResourceFilter(),
+                            resolve, sizes)
+
+        self.assertEqual(sorted(self.session.heads),
+                         ['http://a/2.pdf', 'http://a/3.txt'])
+        self.assertEqual(sizes['http://a/1.pdf'], 15)
+
+    def test_filters_are_applied(self):
+        entries = plan.plan_resources(self.session, SECTIONS,
+                                      ResourceFilter(['pdf']), resolve, {})
+
+        self.assertEqual([e.url for e in entries],
+                         ['http://a/1.pdf', 'http://a/2.pdf'])
+
+    def test_summarize(self):
+        entries = plan.plan_resources(self.session, SECTIONS,
+                                      ResourceFilter(), resolve, {})
+        summary = plan.summarize(entries)
+
+        self.assertEqual((summary['files'], summary['bytes'],
+                          summary['unknown']), (4, 1030, 1))
+        self.assertEqual([(s['name'], s['bytes'], s['unknown'])
+                          for s in summary['sections']],
+                         [('Week_1', 1030, 0), ('Week_2', 0, 1)])
+        self.assertEqual(summary['formats']['pdf']['bytes'], 30)
+        self.assertEqual(summary['formats']['txt']['unknown'], 1)
+
+    def test_write_plan(self):
+        path = tempfile.mkdtemp()
+        try:
+            fn = os.path.join(path, 'plan.json')
+            summary = plan.summarize(plan.plan_resources(
+                self.session, SECTIONS, ResourceFilter(), resolve, {}))
+            plan.write_plan(fn, {'class-001': summary}, 10)
+
+            with open(fn) as f:
+                data = json.load(f)
+        finally:
+            shutil.rmtree(path)
+
+        self.assertEqual(data['bytes'], 1030)
+        self.assertEqual(data['seconds'], 103)
+        self.assertEqual(data['classes']['class-001']['files'], 4)
+
+    def test_format_duration(self):
+        self.assertEqual(plan.format_duration(3725.5), '1:02:05')
+
+
+if __name__ == "__main__":
+    unittest.main()
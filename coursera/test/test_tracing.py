@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the tracing of the HTTP requests.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import requests
+from six.moves import BaseHTTPServer
+
+from coursera import define, tracing
+from coursera.jobs import ClassReport
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'x' * 100
+        self.send_response(404 if self.path == '/missing' else 200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TracedSessionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+        self.tracer = tracing.HttpTracer()
+        self.session = requests.Session()
+        self.session.mount('http://', tracing.TracingAdapter(self.tracer))
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_requests_are_recorded(self):
+        self.session.get(self.url + '/a')
+        self.session.get(self.url + '/b')
+        self.session.get(self.url + '/missing')
+
+        stats = self.tracer.stats['media']
+        self.assertEqual(stats['count'], 3)
+        self.assertEqual(stats['errors'], 0)
+        self.assertEqual(stats['bytes'], 300)
+        self.assertEqual(stats['statuses'], {200: 2, 404: 1})
+        self.assertEqual(sum(stats['latency']), 3)
+        self.assertEqual(stats['new_connections'], 1)
+        self.assertEqual(stats['reused_connections'], 2)
+
+    def test_streamed_responses(self):
+        r = self.session.get(self.url + '/a', stream=True)
+        self.assertEqual(self.tracer.stats['media']['bytes'], 100)
+        self.assertEqual(len(r.content), 100)
+
+    def test_failures_are_recorded(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.assertRaises(requests.exceptions.ConnectionError,
+                          self.session.get, self.url + '/a')
+
+        stats = self.tracer.pop()['media']
+        self.assertEqual((stats['count'], stats['errors']), (1, 1))
+        self.assertEqual(self.tracer.stats, {})
+
+
+class HttpStatsTestCase(unittest.TestCase):
+
+    def test_endpoints(self):
+        c = 'ml-005'
+        urls = [
+            (define.AUTH_URL, 'login'),
+            (define.AUTH_REDIRECT_URL.format(class_name=c),
+             'auth_redirector'),
+            (define.ABOUT_URL.format(class_name=c), 'about'),
+            (define.CLASS_URL.format(class_name=c) + '/lecture/index',
+             'syllabus'),
+            (define.CLASS_URL.format(class_name=c) + '/lecture/preview',
+             'syllabus'),
+            (define.CLASS_URL.format(class_name=c) +
+             '/lecture/view?lecture_id=1', 'lecture_view'),
+            (define.CLASS_URL.format(class_name=c) +
+             '/lecture/preview_view?lecture_id=1', 'lecture_view'),
+            (define.CLASS_URL.format(class_name=c) +
+             '/lecture/download.mp4?lecture_id=1', 'media'),
+            (define.CLASS_URL.format(class_name=c) + '/class', 'class'),
+            ('https://www.coursera.org/', 'other'),
+            ('https://d396qusza40orc.cloudfront.net/ml/a.pdf', 'media'),
+        ]
+        for url, endpoint in urls:
+            self.assertEqual(tracing.endpoint_of(url), endpoint, url)
+
+    def test_latency_histogram(self):
+        tracer = tracing.HttpTracer()
+        for seconds in (0.01, 0.05, 0.07, 3, 60):
+            tracer.record(define.AUTH_URL, seconds, 200)
+
+        self.assertEqual(tracer.stats['login']['latency'],
+                         [2, 1, 0, 0, 0, 0, 1, 0, 1])
+
+    def test_summary(self):
+        a, b = tracing.HttpTracer(), tracing.HttpTracer()
+        a.record(define.AUTH_URL, 0.5, 200, 10)
+        b.record(define.AUTH_URL, 1.5, 401, 20)
+        b.record('https://cdn/a.mp4', 2.0, 200, 1000)
+
+        report = ClassReport('ml-005')
+        report.add_http(a.pop())
+        report.add_http(b.pop())
+        summary = tracing.summarize_http(report.http)
+
+        login = summary['endpoints']['login']
+        self.assertEqual(login['count'], 2)
+        self.assertEqual(login['mean_seconds'], 1.0)
+        self.assertEqual(login['statuses'], {'200': 1, '401': 1})
+        self.assertEqual(login['latency']['<=0.5'], 1)
+        self.assertEqual(summary['total']['count'], 3)
+        self.assertEqual(summary['total']['bytes'], 1030)
+
+        path = tempfile.mkdtemp()
+        try:
+            fn = os.path.join(path, 'http.json')
+            tracing.write_http_stats(fn, summary)
+            with open(fn) as f:
+                self.assertEqual(json.load(f), summary)
+        finally:
+            shutil.rmtree(path)
+
+        tracing.log_http_stats(summary)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,6 +4,11 @@
 Test the utility functions.
 """
 
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 
 from six import iteritems
@@ -65,3 +70,87 @@ class UtilsTestCase(unittest.TestCase):
 
         url = ""
         self.assertEquals(utils.fix_url(url), "")
+
+    def test_scan_directory(self):
+        path = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(path, 'a.mp4'), 'w') as f:
+                f.write('abc')
+            os.mkdir(os.path.join(path, 'subdir'))
+
+            index = utils.scan_directory(path)
+            missing = utils.scan_directory(os.path.join(path, 'missing'))
+        finally:
+            shutil.rmtree(path)
+
+        self.assertEquals(list(index), ['a.mp4'])
+        self.assertEquals(index['a.mp4'][0], 3)
+        self.assertTrue(missing is None)
+
+    def test_replace_file(self):
+        path = tempfile.mkdtemp()
+        try:
+            fn = os.path.join(path, 'a.m3u')
+            for contents in ('old', 'new'):
+                tmp_fn = utils.temp_path(fn)
+                with open(tmp_fn, 'w') as f:
+                    f.write(contents)
+                utils.replace_file(tmp_fn, fn)
+
+            with open(fn) as f:
+                self.assertEqual(f.read(), 'new')
+            self.assertEqual(os.listdir(path), ['a.m3u'])
+        finally:
+            shutil.rmtree(path)
+
+    def test_temp_paths_differ_between_threads(self):
+        names = []
+        thread = threading.Thread(
+            target=lambda: names.append(utils.temp_path('a')))
+        thread.start()
+        thread.join()
+
+        self.assertNotEqual(names[0], utils.temp_path('a'))
+        self.assertTrue(names[0].startswith('a.'))
+
+    def test_parse_size(self):
+        self.assertEquals(utils.parse_size('100'), 100)
+        self.assertEquals(utils.parse_size('2k'), 2048)
+        self.assertEquals(utils.parse_size('1.5 GiB'), 3 * 1024 ** 3 // 2)
+        self.assertRaises(ValueError, utils.parse_size, 'lots')
+
+    def test_prefetch_keeps_order(self):
+        items = list(utils.prefetch(iter(range(100)), 3))
+        self.assertEquals(items, list(range(100)))
+
+    def test_prefetch_reraises_exceptions(self):
+        def failing():
+            yield 1
+            raise ValueError('failed')
+
+        items = utils.prefetch(failing())
+        self.assertEquals(next(items), 1)
+        self.assertRaises(ValueError, next, items)
+
+    def test_prefetch_starts_lazily(self):
+        threads = threading.active_count()
+
+        items = utils.prefetch(iter(range(10)))
+        self.assertEquals(threading.active_count(), threads)
+        del items
+
+        self.assertEquals(threading.active_count(), threads)
+
+    def test_prefetch_stops_with_the_caller(self):
+        produced = []
+
+        def counting():
+            for i in range(100):
+                produced.append(i)
+                yield i
+
+        items = utils.prefetch(counting(), 1)
+        self.assertEquals(next(items), 0)
+        items.close()
+        time.sleep(0.3)
+        self.assertTrue(len(produced) < 100)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+"""
+Test the --watch mode.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from coursera import coursera_dl, watch
+from coursera.model import Section, make_lecture
+
+
+def make_sections(*urls):
+    return [Section('Week_1', [
+        make_lecture('Intro', {'pdf': [(url, '', None) for url in urls]}),
+        make_lecture('Outro', {'txt': [('http://a/outro.txt', '', None)]})])]
+
+
+class ClassWatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.watch = watch.ClassWatch('class-001', 60)
+
+    def round(self, key, sections, completed=False, missing=(),
+              mtime=None):
+        """
+        Run a round in which the resources are all downloaded at mtime
+        (now, by default), except those whose url is in missing.
+        """
+        sections = list(self.watch.filter_new(sections))
+        outcomes = {}
+        for section in sections:
+            for lecture in section.lectures:
+                for fmt, resources in lecture.resources.items():
+                    for r in resources:
+                        key_ = watch.resource_key(section.name, lecture.name,
+                                                  fmt, r)
+                        outcomes[key_] = (None if r.url in missing
+                                          else mtime or time.time())
+        self.watch.done(key, completed, outcomes)
+        return sections
+
+    def test_first_round_keeps_everything(self):
+        sections = make_sections('http://a/1.pdf')
+
+        self.assertEqual(self.round('1', sections), sections)
+
+    def test_only_new_resources_are_kept(self):
+        self.round('1', make_sections('http://a/1.pdf'))
+        sections = self.round('2', make_sections('http://a/1.pdf',
+                                                 'http://a/2.pdf'))
+
+        self.assertEqual(len(sections[0].lectures), 2)
+        self.assertEqual(
+            [r.url for r in sections[0].lectures[0].resources['pdf']],
+            ['http://a/2.pdf'])
+        self.assertEqual(sections[0].lectures[1].resources, {})
+        self.assertEqual(self.watch.new_resources, 1)
+
+    def test_failed_round_is_tried_again(self):
+        self.round('1', make_sections('http://a/1.pdf'))
+        sections = make_sections('http://a/1.pdf', 'http://a/2.pdf')
+
+        list(self.watch.filter_new(sections))  # but done is not called
+        self.assertEqual(len(self.round('2', sections)[0].lectures[0]
+                             .resources['pdf']), 1)
+
+    def test_missing_resources_are_tried_again(self):
+        self.round('1', make_sections('http://a/1.pdf'),
+                   missing=['http://a/1.pdf'])
+        self.assertFalse(self.watch.unchanged('1'))
+
+        sections = self.round('1', make_sections('http://a/1.pdf'))
+        self.assertEqual(
+            [r.url for r in sections[0].lectures[0].resources['pdf']],
+            ['http://a/1.pdf'])
+        self.assertEqual(sections[0].lectures[1].resources, {})
+        self.assertTrue(self.watch.unchanged('1'))
+
+    def test_classes_become_completed(self):
+        old = time.time() - 60 * 24 * 3600
+        self.round('1', make_sections('http://a/1.pdf'))
+        self.assertFalse(self.watch.completed)
+
+        self.watch.last_update = old
+        self.round('2', make_sections('http://a/1.pdf'))
+        self.assertTrue(self.watch.completed)
+
+    def test_unchanged(self):
+        self.round('1', make_sections('http://a/1.pdf'))
+
+        self.assertTrue(self.watch.unchanged('1'))
+        self.assertFalse(self.watch.unchanged('2'))
+
+    def test_completed_classes_are_polled_less_often(self):
+        old = time.time() - 60 * 24 * 3600
+        self.round('1', make_sections('http://a/1.pdf'), completed=True,
+                   mtime=old)
+        self.watch.schedule(1000)
+        self.assertEqual(self.watch.next_poll,
+                         1000 + 60 * watch.COMPLETE_INTERVAL_FACTOR)
+
+        self.round('2', make_sections('http://a/1.pdf'))
+        self.assertTrue(self.watch.completed)
+
+        self.round('3', make_sections('http://a/1.pdf', 'http://a/2.pdf'))
+        self.watch.schedule(2000)
+        self.assertFalse(self.watch.completed)
+        self.assertEqual(self.watch.next_poll, 2060)
+
+
+class WatchClassesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.__download_class = coursera_dl.download_class
+        self.__sleep = coursera_dl.time.sleep
+        self.polls = []
+        self.sleeps = []
+
+        def download_class(args, class_name, session=None, watch=None,
+                           report=None):
+            self.polls.append(class_name)
+            return class_name.startswith('completed')
+
+        def sleep(seconds):
+            self.sleeps.append(seconds)
+
+        coursera_dl.download_class = download_class
+        coursera_dl.time.sleep = sleep
+
+    def tearDown(self):
+        coursera_dl.download_class = self.__download_class
+        coursera_dl.time.sleep = self.__sleep
+
+    def test_watch_classes(self):
+        args = argparse.Namespace(watch=60)
+        jobs = [('class-001', args), ('class-002', args)]
+
+        coursera_dl.watch_classes(args, jobs, None, rounds=2)
+
+        self.assertEqual(self.polls, ['class-001', 'class-002'])
+        self.assertEqual(len(self.sleeps), 1)
+        self.assertTrue(0 < self.sleeps[0] <= 60)
+
+
+class NoSpace(object):
+
+    def size_of(self, url, resolved):
+        return 1
+
+    def admit(self, filename, size, url=None):
+        return not filename.endswith('.pdf')
+
+    def release(self, filename):
+        pass
+
+
+class MockDownloader(object):
+    session = None
+
+    def download(self, url, filename):
+        open(filename, 'w').close()
+
+
+class WatchDownloadsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.watch = watch.ClassWatch('class-001', 60)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def round(self, disk_space=None):
+        outcomes = {}
+        sections = self.watch.filter_new(make_sections('http://a/1.pdf'))
+        completed = coursera_dl.download_lectures(
+            MockDownloader(), 'class-001', sections, ['all'],
+            path=self.path, disk_space=disk_space, outcomes=outcomes)
+        self.watch.done('1', completed, outcomes)
+        return outcomes
+
+    def test_skipped_files_are_offered_again(self):
+        outcomes = self.round(NoSpace())
+        self.assertEqual(sorted(v is None for v in outcomes.values()),
+                         [False, True])
+
+        outcomes = self.round()
+        self.assertEqual(len(outcomes), 1)
+        self.assertTrue(os.path.exists(os.path.join(
+            self.path, 'class-001', '01_Week_1', '01_Intro.pdf')))
+        self.assertTrue(self.watch.unchanged('1'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tracing of the HTTP requests of a run.
+
+The sessions of a run send their requests through a TracingAdapter, which
+records, for each class of endpoint (logging in, the auth redirector, the
+syllabus, the lecture pages, the about page, the other pages of a class and
+the media files), how many requests were made, how long they took, their
+status codes, the bytes received and how many of them reused a connection.
+This costs a few dictionary updates per request, so it is always on; the
+statistics are logged with --profile and written with --http-stats.
+
+The time of a request is that until its body is read, except for streamed
+responses (the downloads), whose time is that until the headers arrive and
+whose bytes are those announced by their Content-Length.
+"""
+
+import bisect
+import json
+import logging
+import re
+import threading
+import time
+import weakref
+
+import requests
+import six
+
+#  six.moves doesn’t support urlparse
+if six.PY3:
+    from urllib.parse import urlparse
+else:
+    from urlparse import urlparse
+
+ENDPOINTS = ('login', 'auth_redirector', 'syllabus', 'lecture_view',
+             'about', 'class', 'other', 'media')
+
+# Upper bounds, in seconds, of the buckets of the histogram of latencies;
+# the last bucket holds the slower requests
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def endpoint_of(url):
+    """
+    Return the class of endpoint, one of ENDPOINTS, of the given URL.
+    """
+    parts = urlparse(url)
+    host, path = parts.netloc.lower(), parts.path
+
+    if host == 'accounts.coursera.org':
+        return 'login'
+    if host == 'class.coursera.org':
+        if path.endswith('/auth/auth_redirector'):
+            return 'auth_redirector'
+        if re.search(r'/lecture/(index|preview)$', path):
+            return 'syllabus'
+        if re.search(r'/lecture/(preview_)?view', path):
+            return 'lecture_view'
+        if '/lecture/' in path:
+            # lecture/download.mp4 and the like, redirected to the media
+            return 'media'
+        return 'class'
+    if host == 'www.coursera.org' and path.startswith('/maestro/api/topic/'):
+        return 'about'
+    if host.endswith('coursera.org'):
+        return 'other'
+    return 'media'
+
+
+def new_stats():
+    return {'count': 0,
+            'errors': 0,
+            'bytes': 0,
+            'seconds': 0.0,
+            'new_connections': 0,
+            'reused_connections': 0,
+            'statuses': {},
+            'latency': [0] * (len(LATENCY_BUCKETS) + 1)}
+
+
+def merge_http_stats(into, stats):
+    """
+    Add the statistics stats, by endpoint, to those of into.
+    """
+    for endpoint, s in stats.items():
+        totals = into.setdefault(endpoint, new_stats())
+        for key in ('count', 'errors', 'bytes', 'seconds',
+                    'new_connections', 'reused_connections'):
+            totals[key] += s[key]
+        for status, count in s['statuses'].items():
+            totals['statuses'][status] = (
+                totals['statuses'].get(status, 0) + count)
+        for i, count in enumerate(s['latency']):
+            totals['latency'][i] += count
+    return into
+
+
+class HttpTracer(object):
+    """
+    Records the statistics of the HTTP requests, by endpoint.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sockets = weakref.WeakKeyDictionary()
+        self.stats = {}  # {endpoint: new_stats()}
+
+    def _reused(self, sock):
+        # None if it cannot be told
+        if sock is None:
+            return None
+        try:
+            reused = sock in self._sockets
+            self._sockets[sock] = True
+        except TypeError:
+            return None
+        return reused
+
+    def record(self, url, seconds, status=None, size=0, sock=None):
+        """
+        Record a request to url which took seconds, and its status and the
+        bytes received, or its failure if status is None.
+        """
+        endpoint = endpoint_of(url)
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+
+        with self._lock:
+            reused = self._reused(sock)
+            s = self.stats.get(endpoint)
+            if s is None:
+                s = self.stats[endpoint] = new_stats()
+            s['count'] += 1
+            s['seconds'] += seconds
+            s['latency'][bucket] += 1
+            if status is None:
+                s['errors'] += 1
+                return
+            s['statuses'][status] = s['statuses'].get(status, 0) + 1
+            s['bytes'] += size
+            if reused is not None:
+                s['reused_connections' if reused else 'new_connections'] += 1
+
+    def pop(self):
+        """
+        Return the statistics recorded so far, and forget them.
+        """
+        with self._lock:
+            stats, self.stats = self.stats, {}
+            return stats
+
+
+class TracingAdapter(requests.adapters.HTTPAdapter):
+    """
+    HTTPAdapter which records its requests in a HttpTracer.
+
+    :param tracer: The HttpTracer.
+    """
+
+    def __init__(self, tracer, **kwargs):
+        self.tracer = tracer
+        super(TracingAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        start = time.time()
+        try:
+            r = super(TracingAdapter, self).send(request, **kwargs)
+            # the connection is released once the body is read
+            sock = getattr(getattr(r.raw, 'connection', None), 'sock', None)
+            if request.method == 'HEAD':
+                size = 0
+            elif kwargs.get('stream'):
+                size = int(r.headers.get('Content-Length') or 0)
+            else:
+                # read here, rather than by the session, to be timed
+                size = len(r.content)
+        except Exception:
+            self.tracer.record(request.url, time.time() - start)
+            raise
+
+        self.tracer.record(request.url, time.time() - start, r.status_code,
+                           size, sock)
+        return r
+
+
+def summarize_http(stats):
+    """
+    Return the summary of the statistics, by endpoint and in total, with
+    the mean latency and the histogram keyed by the bounds of its buckets.
+    """
+    def entry(s):
+        bounds = ['<=%g' % b for b in LATENCY_BUCKETS]
+        bounds.append('>%g' % LATENCY_BUCKETS[-1])
+        e = dict(s)
+        e['mean_seconds'] = s['seconds'] / s['count'] if s['count'] else 0.0
+        e['statuses'] = dict((str(k), v) for k, v in s['statuses'].items())
+        e['latency'] = dict(zip(bounds, s['latency']))
+        return e
+
+    total = new_stats()
+    for s in stats.values():
+        merge_http_stats({'total': total}, {'total': s})
+
+    return {'total': entry(total),
+            'endpoints': dict((endpoint, entry(s))
+                              for endpoint, s in stats.items())}
+
+
+def log_http_stats(summary):
+    """
+    Log a table with the requests made to each endpoint.
+    """
+    def order(names):
+        known = [name for name in ENDPOINTS if name in names]
+        return known + sorted(set(names) - set(known))
+
+    line = '{0:<16}  {1:>6}  {2:>6}  {3:>10}  {4:>8}  {5:>12}  {6:>6}  {7}'
+
+    logging.info('HTTP requests:')
+    logging.info(line.format('endpoint', 'count', 'errors', 'seconds',
+                             'mean', 'bytes', 'reused', 'statuses'))
+
+    rows = [(name, summary['endpoints'][name])
+            for name in order(summary['endpoints'])]
+    rows.append(('total', summary['total']))
+    for name, s in rows:
+        statuses = ' '.join('%s:%d' % item
+                            for item in sorted(s['statuses'].items()))
+        logging.info(line.format(name, s['count'], s['errors'],
+                                 '%.3f' % s['seconds'],
+                                 '%.3f' % s['mean_seconds'], s['bytes'],
+                                 s['reused_connections'], statuses))
+
+
+def write_http_stats(path, summary):
+    """
+    Write the summary of the HTTP statistics to path as JSON.
+    """
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=4, sort_keys=True)
+    logging.info('Wrote the HTTP statistics to %s', path)
@@ -4,13 +4,32 @@
 This module provides utility functions that are used within the script.
 """
 
+import contextlib
 import errno
 import os
 import re
+import socket
 import string
+import sys
+import threading
 
 import six
 
+from six.moves import queue
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+try:
+    from os import scandir
+except ImportError:  # Python < 3.5
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
 #  six.moves doesn’t support urlparse
 if six.PY3:
     from urllib.parse import urlparse
@@ -79,3 +98,153 @@ def fix_url(url):
         url = "http://" + url
 
     return url
+
+
+def scan_directory(path):
+    """
+    Return a dict mapping the name of each file in the directory to its
+    (size, mtime), or None if there is no such directory.
+
+    The directory is listed once (with os.scandir, when available), so that
+    deciding which of its files are missing does not take one stat per
+    file, which is slow on network filesystems.
+    """
+    index = {}
+
+    try:
+        if scandir is not None:
+            for entry in scandir(path):
+                try:
+                    if entry.is_file():
+                        st = entry.stat()
+                        index[entry.name] = (st.st_size, st.st_mtime)
+                except OSError:  # removed since it was listed
+                    pass
+        else:
+            for name in os.listdir(path):
+                try:
+                    st = os.stat(os.path.join(path, name))
+                except OSError:
+                    continue
+                if not os.path.isdir(os.path.join(path, name)):
+                    index[name] = (st.st_size, st.st_mtime)
+    except OSError as e:
+        if e.errno in (errno.ENOENT, errno.ENOTDIR):
+            return None
+        raise
+
+    return index
+
+
+_SIZE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)(?:i?b)?\s*$',
+                      re.IGNORECASE)
+
+
+@contextlib.contextmanager
+def file_lock(path, shared=False):
+    """
+    Hold an advisory lock on the file path (created if needed) during the
+    with block: a shared one to read what it protects, or an exclusive one
+    to change it.  Without fcntl (i.e., on Windows), nothing is locked.
+
+    The lock is held by an open file, so it must not be taken twice by the
+    same process, even from the same thread.
+    """
+    if fcntl is None:
+        yield
+        return
+
+    f = open(path, 'a')
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        f.close()  # which releases the lock
+
+
+def temp_path(path):
+    """
+    Return the name of a temporary file next to path, to be renamed to it
+    by replace_file, which no other thread, process or machine (sharing the
+    filesystem) uses.
+    """
+    return '%s.%s-%d-%d.tmp' % (path, socket.gethostname(), os.getpid(),
+                                threading.current_thread().ident)
+
+
+def replace_file(tmp_path, path):
+    """
+    Rename tmp_path to path, replacing path in a single step, so that it is
+    never missing.  Only on Windows with Python 2, which cannot do that, is
+    path removed first.
+    """
+    replace = getattr(os, 'replace', None)
+    if replace is not None:
+        replace(tmp_path, path)
+        return
+
+    if os.name == 'nt' and os.path.exists(path):
+        os.remove(path)  # os.rename does not overwrite on Windows
+    os.rename(tmp_path, path)
+
+
+def parse_size(text):
+    """
+    Return the number of bytes given by text, e.g. '500K', '2M' or '1.5GB'
+    (with 1K = 1024 bytes).
+    """
+    m = _SIZE_RE.match(text)
+    if m is None:
+        raise ValueError('Invalid size: %s' % text)
+    number, unit = m.groups()
+    return int(float(number) * 1024 ** ' kmgt'.index(unit.lower() or ' '))
+
+
+def prefetch(iterable, size=1):
+    """
+    Consume the given iterable in a background thread, staying at most size
+    items ahead of the caller, and yield its items.
+
+    The thread is only started when the first item is requested.
+    Exceptions raised by the iterable are re-raised in the caller.  If the
+    caller stops early, the background thread gives up as well.
+    """
+
+    items = queue.Queue(size)
+    stopped = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException:
+            put((done, sys.exc_info()))
+        else:
+            put((done, None))
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            item, exc_info = items.get()
+            if item is not done:
+                yield item
+            elif exc_info:
+                six.reraise(*exc_info)
+            else:
+                return
+    finally:
+        stopped.set()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""
+State kept between the rounds of --watch, for each class being watched.
+
+After the first round, which downloads the class as usual, a class is only
+looked at again if its syllabus page changed, or if some of its resources
+could not be downloaded, and then only the resources that were not
+downloaded before are handed over to download_lectures, so that the files
+already downloaded are not even looked at.
+"""
+
+import logging
+import time
+
+from six import iteritems
+
+from .model import Lecture, Section
+
+# How many times longer we wait before polling again a class which appears
+# to be complete.
+COMPLETE_INTERVAL_FACTOR = 12
+
+# Seconds without new files after which a class appears to be complete, as
+# in download_lectures.
+COMPLETE_AFTER = 30 * 24 * 3600
+
+
+def resource_key(section_name, lecture_name, fmt, resource):
+    """
+    Return what identifies a resource between two versions of a syllabus.
+    """
+    return (section_name, lecture_name, fmt, resource.url)
+
+
+class ClassWatch(object):
+    """
+    What we know about a class from the previous rounds.
+
+    :param class_name: Name of the class.
+    :param interval: Seconds between two polls of the class, multiplied by
+        COMPLETE_INTERVAL_FACTOR while the class appears to be complete.
+    """
+
+    def __init__(self, class_name, interval):
+        self.class_name = class_name
+        self.interval = interval
+
+        self.key = None         # key of the last syllabus page handled
+        self.seen = None        # keys of the resources downloaded so far
+        self.completed = False
+        self.last_update = -1   # time of the newest file of the class
+        self.next_poll = 0
+        self.new_resources = 0  # found by the round in progress
+
+    def unchanged(self, key):
+        """
+        Tell whether the syllabus page has the given key since the last
+        round, in which case there is nothing new to download.
+        """
+        if key == self.key:
+            logging.info('Syllabus of %s did not change.', self.class_name)
+            return True
+        return False
+
+    def filter_new(self, sections):
+        """
+        Yield the sections, keeping in their lectures only the resources
+        which were not downloaded (or found on disk) in the previous rounds.
+
+        The sections and lectures themselves are kept, even if they are left
+        without resources, so that they are numbered as usual.  In the first
+        round, nothing is filtered out.
+        """
+        first_round = self.seen is None
+        seen = self.seen or set()
+        offered = set()
+        self.new_resources = 0
+
+        for section_name, lectures in sections:
+            kept = []
+            for lecture_name, lecture in lectures:
+                resources = {}
+                for fmt, found in iteritems(lecture):
+                    new = []
+                    for resource in found:
+                        key = resource_key(section_name, lecture_name, fmt,
+                                           resource)
+                        if key not in seen and key not in offered:
+                            offered.add(key)
+                            new.append(resource)
+                    if first_round:
+                        resources[fmt] = found
+                    elif new:
+                        resources[fmt] = tuple(new)
+                    self.new_resources += len(new)
+                kept.append(Lecture(lecture_name, resources))
+            yield Section(section_name, kept)
+
+        if not first_round:
+            logging.info('Found %d new resource(s) in %s.',
+                         self.new_resources, self.class_name)
+
+    def done(self, key, completed, outcomes):
+        """
+        Record the outcome of a round which handled the syllabus page with
+        the given key.  completed is what download_lectures returned, and
+        outcomes what it found out about each resource.
+
+        The resources which were not downloaded (e.g., for lack of space, or
+        because they failed) are tried again in the next round, even if the
+        syllabus page does not change.
+        """
+        first_round = self.seen is None
+        if first_round:
+            self.seen = set()
+
+        missing = 0
+        for resource, mtime in iteritems(outcomes):
+            if mtime is None:
+                missing += 1
+            else:
+                self.seen.add(resource)
+                self.last_update = max(self.last_update, mtime)
+        self.key = key if not missing else None
+
+        if first_round:
+            self.completed = completed
+        else:
+            # download_lectures only saw the new files
+            self.completed = (self.last_update >= 0 and
+                              time.time() - self.last_update > COMPLETE_AFTER)
+
+        return self.completed
+
+    def schedule(self, now):
+        """
+        Set the time of the next poll of the class, which happened at now.
+        """
+        interval = self.interval
+        if self.completed:
+            interval *= COMPLETE_INTERVAL_FACTOR
+        self.next_poll = now + interval